@@ -1,82 +1,37 @@
 from dataiku.fsprovider import FSProvider
-from boxsdk import OAuth2, Client
 
 import os
-import shutil
+import time
 import hashlib
+import logging
+import functools
 
 from box_item import BoxItem
-from utils import get_full_path, get_rel_path, get_normalized_path, get_item_size
-
-from boxsdk.network.default_network import DefaultNetwork, DefaultNetworkResponse
-from boxsdk.session.session import AuthorizedSession
-from six import text_type
-from pprint import pformat
-from boxsdk.util.log import sanitize_dictionary
-
-# The DefaultNetwork of box.com logs all network queries and responses, INCLUDING CONTENT
-# This is crazy but it is how it is, and it of course lead to incredible disk usage
-# and various failures because these insane log lines can find their way to a LogTail in DSS
-#
-# The DefaultNetwork has provision to avoid logging when the response is a stream
-# (see response_as_stream in DefaultNetworkResponse), but boxsdk.object.file always uses
-# the .content instead of the .raw, so it always goes through logging
-#
-# So we override the DefaultNetwork's log function to avoid logging big things
-#
-# Note: another option would be to try to use response_as_stream instead, but it would
-# require rewrapping boxsdk.object.file, so looks more dangerous
-MAX_LOGGED_RESPONSE_SIZE = 2048
-
-
-class LessVerboseLoggingNetwork(DefaultNetwork):
-    @property
-    def network_response_constructor(self):
-        return LessVerboseLoggingNetworkResponse
+from box_crawler import BoxCrawler
+from listing_cache import FolderListingCache
+from utils import get_full_path, get_rel_path, get_normalized_path, get_item_size, get_cache_file_name
 
+from box_network import LessVerboseLoggingNetwork
+from client_registry import ClientRegistry
+from event_sync import EventSync
+from upload_queue import UploadQueue
+from operation_metrics import OperationMetrics
+from boxsdk.exception import BoxAPIException
 
-class LessVerboseLoggingNetworkResponse(DefaultNetworkResponse):
-    def log(self, can_safely_log_content=False):
-        if self._did_log:
-            return
-        self._did_log = True
-        content_length = self.headers.get('Content-Length', None)
-        content = "<stream not logged>"
-
-        if can_safely_log_content:
-            if content_length is None:
-                content_length = text_type(len(self.content))
-
-            if len(self.content) > MAX_LOGGED_RESPONSE_SIZE:
-                content = "<Content not logged (size=%s)>" % len(self.content)
-            else:
-                # If possible, get the content as a JSON `dict`, that way
-                # `pformat(content)` will return pretty-printed JSON.
-                try:
-                    content = self.json()
-                except ValueError:
-                    content = self.content
-                content = pformat(sanitize_dictionary(content))
-        if content_length is None:
-            content_length = '?'
-        if self.ok:
-            logger_method, response_format = self._logger.info, self.SUCCESSFUL_RESPONSE_FORMAT
-        else:
-            logger_method, response_format = self._logger.warning, self.ERROR_RESPONSE_FORMAT
-        logger_method(
-            response_format,
-            {
-                'method': self.request_response.request.method,
-                'url': self.request_response.request.url,
-                'status_code': self.status_code,
-                'content_length': content_length,
-                'headers': pformat(self.headers),
-                'content': content,
-            },
-        )
+logger = logging.getLogger(__name__)
 
-# End of logging fixes
-############################
+
+def box_operation(method):
+    # Attributes the requests, retries and cache lookups to the provider operation being run
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.metrics.start_operation(method.__name__)
+        start_time = time.time()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.metrics.end_operation(time.time() - start_time)
+    return wrapper
 
 
 class BoxComFSProvider(FSProvider):
@@ -86,40 +41,128 @@ class BoxComFSProvider(FSProvider):
         :param config: the dict of the configuration of the object
         :param plugin_config: contains the plugin settings
         """
+        start_time = time.time()
         if len(root) > 0 and root[0] == '/':
             root = root[1:]
         self.root = root
         self.connection = client.get("box_com_connection")
         self.access_token = self.connection['access_token']
         self.cache_enabled = config.get("cache_enabled")
-        if self.cache_enabled:
-            cache_file_name = hashlib.sha1(self.access_token.encode('utf-8')).hexdigest()
+        token_hash = hashlib.sha1(self.access_token.encode('utf-8')).hexdigest()
+        self.token_hash = token_hash
+        self.metrics_dump = config.get("metrics_dump", False)
+        if self.cache_enabled and config.get("cache_partition_by_root", False):
+            # Each root gets its own, smaller, cache file
+            cache_file_name = get_cache_file_name(token_hash, root)
+        elif self.cache_enabled:
+            cache_file_name = get_cache_file_name(token_hash)
         else:
             cache_file_name = None
 
-        auth = OAuth2(
-            client_id="",
-            client_secret="",
-            access_token=self.access_token
+        upload_threads = int(config.get("upload_threads", BoxItem.DEFAULT_UPLOAD_THREADS))
+        listing_threads = int(config.get("listing_threads", BoxCrawler.DEFAULT_THREADS))
+        download_threads = int(config.get("download_threads", BoxItem.DEFAULT_DOWNLOAD_THREADS))
+        rate_limit = int(config.get("rate_limit", 0))
+        async_upload_threads = int(config.get("async_upload_threads", UploadQueue.DEFAULT_WORKERS))
+        if config.get("async_uploads", False):
+            self.upload_queue = UploadQueue(
+                workers=async_upload_threads,
+                max_bytes=int(config.get("async_upload_spool_size", UploadQueue.DEFAULT_MAX_BYTES // 1024 // 1024)) * 1024 * 1024
+            )
+        else:
+            self.upload_queue = None
+            async_upload_threads = 0
+        # Each listing thread may also prefetch a page, keep some room for the main thread
+        client, self.network = ClientRegistry.get_client(
+            self.access_token, token_hash,
+            pool_size=max(
+                2 * listing_threads + upload_threads + download_threads + async_upload_threads + 2,
+                LessVerboseLoggingNetwork.DEFAULT_POOL_SIZE
+            ),
+            max_retries=int(config.get("max_retries", LessVerboseLoggingNetwork.DEFAULT_MAX_RETRIES)),
+            rate_limit=rate_limit
+        )
+        # The network is shared by the providers of the process, each one counts its own requests
+        self.metrics = OperationMetrics()
+        self.client = ClientRegistry.with_metrics(client, self.metrics)
+        self.box_user = None
+        cache = ClientRegistry.get_cache(
+            cache_file_name, config.get("cache_backend"),
+            max_entries=int(config.get("cache_max_entries", BoxItem.DEFAULT_CACHE_MAX_ENTRIES))
+        )
+        events = None
+        if cache_file_name is not None and config.get("events_sync", False):
+            events = ClientRegistry.get_event_sync(
+                cache_file_name, config.get("cache_backend"), client, cache,
+                interval=int(config.get("events_sync_interval", EventSync.DEFAULT_INTERVAL))
+            )
+        self.box_item = BoxItem(
+            cache_file_name, root, self.client,
+            chunked_upload_threshold=int(config.get("chunked_upload_threshold", 50)) * 1024 * 1024,
+            upload_threads=upload_threads,
+            cache_backend=config.get("cache_backend"),
+            validation_policy=config.get("cache_validation", BoxItem.VALIDATION_ALWAYS),
+            validation_ttl=int(config.get("cache_validation_ttl", BoxItem.DEFAULT_VALIDATION_TTL)),
+            listing_cache_ttl=int(config.get("listing_cache_ttl", FolderListingCache.DEFAULT_TTL)),
+            listing_threads=listing_threads,
+            cache=cache,
+            content_cache_size=int(config.get("content_cache_size", 0)) * 1024 * 1024,
+            download_threads=download_threads,
+            metrics=self.metrics,
+            events=events
         )
-
-        main_session = AuthorizedSession(auth, network_layer=LessVerboseLoggingNetwork())
-        self.client = Client(auth, main_session)
-        self.user = self.client.user().get()
-        self.box_item = BoxItem(cache_file_name, root, self.client)
         self.box_item.check_path_format(get_normalized_path(root))
+        self.crawler = BoxCrawler(
+            self.box_item.listings, cache=self.box_item.cache,
+            threads=listing_threads
+        )
+        logger.info("Provider ready in {:.3f}s".format(time.time() - start_time))
+
+    @property
+    def user(self):
+        # Only looked up when needed, it costs a round trip to box.com
+        if self.box_user is None:
+            self.box_user = self.client.user().get()
+        return self.box_user
 
     def close(self):
         """
         Perform any necessary cleanup
         """
-        self.box_item.close()
-
+        try:
+            if self.upload_queue is not None:
+                # Raises the errors of the background uploads
+                self.upload_queue.close()
+        finally:
+            self.box_item.close()
+            self.metrics.log_summary()
+            if self.metrics_dump:
+                self.metrics.dump(self.token_hash[:8])
+            self.metrics.reset()
+
+    def on_item(self, full_path, operation):
+        """
+        Run operation on the item at full_path. If the item id came from the id cache or a cached
+        listing and box.com answers 404, both are dropped and the path is resolved again
+        """
+        item = self.box_item.get_by_path(full_path)
+        try:
+            return operation(item)
+        except BoxAPIException as err:
+            if err.status != BoxItem.BOX_ERR_NOT_FOUND or not item.from_cache:
+                raise
+            logger.info("Cached id of {} is stale, resolving the path again".format(full_path))
+            self.box_item.listings.invalidate_item(item.get_id())
+            self.box_item.cache.remove(item.get_id())
+            return operation(self.box_item.get_by_path(full_path, force_no_cache=True))
+
+    @box_operation
     def stat(self, path):
         """
         Get the info about the object at the given path inside the provider's root, or None 
         if the object doesn't exist
         """
+        self.wait_for_uploads()
         full_path = get_full_path(self.root, path)
         box_item = self.box_item.get_by_path(full_path)
         if box_item.not_exists():
@@ -132,13 +175,17 @@ class BoxComFSProvider(FSProvider):
         """
         return False
 
+    @box_operation
     def browse(self, path):
         """
         List the file or directory at the given path, and its children (if directory)
         """
+        self.wait_for_uploads()
         normalized_path = get_normalized_path(path)
         full_path = get_full_path(self.root, path)
-        item = self.box_item.get_by_path(get_rel_path(full_path))
+        return self.on_item(get_rel_path(full_path), lambda item: self.browse_item(item, normalized_path))
+
+    def browse_item(self, item, normalized_path):
         if item.not_exists():
             return {
                 'fullPath': normalized_path, 'exists': False
@@ -152,59 +199,53 @@ class BoxComFSProvider(FSProvider):
         else:
             return item.get_as_browse()
 
+    @box_operation
     def enumerate(self, path, first_non_empty):
         """
         Enumerate files recursively from prefix. If first_non_empty, stop at the first non-empty file.
         If the prefix doesn't denote a file or folder, return None
         """
+        self.wait_for_uploads()
         full_path = get_full_path(self.root, path)
         normalized_path = get_normalized_path(path)
+        return self.on_item(full_path, lambda item: self.enumerate_item(item, full_path, normalized_path, first_non_empty))
 
-        item = self.box_item.get_by_path(full_path)
+    def enumerate_item(self, item, full_path, normalized_path, first_non_empty):
         if item.not_exists():
             return None
 
         paths = []
         if item.is_folder():
-            paths = self.list_recursive(normalized_path, item.id, first_non_empty)
+            paths = self.list_recursive(normalized_path, item.id, first_non_empty, cache_path=get_rel_path(full_path))
         else:
             paths.append({
                 'path': normalized_path.split("/")[-1], 'size': get_item_size(item), 'lastModified': int(0) * 1000
             })
         return paths
 
-    def list_recursive(self, path, folder_id, first_non_empty):
-        paths = []
-        if path == "/":
-            path = ""
-        for child in self.client.folder(folder_id).get_items(fields=['modified_at', 'name', 'type', 'size']):
-            if child.type == self.box_item.BOX_FOLDER:
-                paths.extend(self.list_recursive(path + '/' + child.name, child.id, first_non_empty))
-            else:
-                paths.append({
-                    'path': path + '/' + child.name, 'size': get_item_size(child)
-                })
-                if first_non_empty:
-                    return paths
-        return paths
+    def list_recursive(self, path, folder_id, first_non_empty, cache_path=''):
+        return self.crawler.crawl(path, cache_path, folder_id, first_non_empty=first_non_empty)
 
+    @box_operation
     def delete_recursive(self, path):
         """
         Delete recursively from path. Return the number of deleted files (optional)
         """
+        self.wait_for_uploads()
         full_path = get_full_path(self.root, path)
         item = self.box_item.get_by_path(full_path, force_no_cache=True)
         if item.not_exists():
             return 0
         else:
-            ret = item.delete()
-            self.box_item.cache.reset()
-            return ret
+            # item.delete() drops the deleted subtree from the cache
+            return item.delete()
 
+    @box_operation
     def move(self, from_path, to_path):
         """
         Move a file or folder to a new path inside the provider's root. Return false if the moved file didn't exist
         """
+        self.wait_for_uploads()
         full_from_path = get_full_path(self.root, from_path)
         full_to_path = get_full_path(self.root, to_path)
         _, from_item_name = os.path.split(full_from_path)
@@ -234,9 +275,16 @@ class BoxComFSProvider(FSProvider):
         else:
             source.rename(to_item_name)
 
+        # Only the moved subtree is invalidated, it will be resolved again at its new location
+        self.box_item.listings.invalidate_item(from_item_id)
+        self.box_item.listings.invalidate(to_item.get_id())
+        self.box_item.cache.remove(from_item_id)
+        self.box_item.cache.remove_path(get_rel_path(full_to_path))
         return True
 
+    @box_operation
     def read(self, path, stream, limit):
+        self.wait_for_uploads()
         full_path = get_full_path(self.root, path)
         byte_range = None
 
@@ -245,18 +293,43 @@ class BoxComFSProvider(FSProvider):
             if int_limit > 0:
                 byte_range = (0, int(limit) - 1)
 
-        item = self.box_item.get_by_path(full_path)
+        self.on_item(full_path, lambda item: self.read_item(item, stream, byte_range))
+
+    def read_item(self, item, stream, byte_range):
         if item.not_exists():
             raise Exception('Path doesn t exist')
-        shutil.copyfileobj(item.get_stream(byte_range), stream)
+        item.write_content_to(stream, byte_range)
 
+    @box_operation
     def write(self, path, stream):
         """
         Write the stream to the object denoted by path into the stream
         """
         full_path = get_full_path(self.root, path)
+        if self.upload_queue is not None:
+            # Spooled now, uploaded in the background
+            self.upload_queue.wait_for_room(full_path)
+            spool_file, size, content_sha1 = self.box_item.spool_stream(stream)
+            self.upload_queue.submit(
+                full_path, spool_file, size,
+                self.metrics.bind(lambda: self.upload_spooled(full_path, spool_file, size, content_sha1), "write")
+            )
+            return
         item = self.box_item.create_path(full_path, force_no_cache=True)
         if item.is_folder():
             item.write_stream(stream)
         else:
             raise Exception('Not a file name')
+
+    def upload_spooled(self, full_path, spool_file, size, content_sha1):
+        # Runs in an upload worker, with an item of its own
+        item = self.box_item.clone().create_path(full_path, force_no_cache=True)
+        if item.is_folder():
+            item.upload_spooled(spool_file, size, content_sha1)
+        else:
+            raise Exception('Not a file name')
+
+    def wait_for_uploads(self):
+        # Other operations see the files written so far, failed uploads are raised by close()
+        if self.upload_queue is not None:
+            self.upload_queue.wait()
@@ -0,0 +1,157 @@
+import os
+import uuid
+import logging
+import threading
+
+from operation_metrics import OperationMetrics
+from utils import get_cache_location, create_dir
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class BlockCache():
+    """
+    Local disk cache of file contents, split in fixed-size blocks so that byte ranges can be
+    served partially from it. Blocks are stored per file id and SHA1, so a new version of a file
+    never hits the blocks of the previous one. The least recently used blocks are evicted
+    once the cache outgrows max_size, using the files' modification time shared by all processes.
+    """
+
+    BLOCK_SIZE = 4 * 1024 * 1024
+    BLOCKS_DIRECTORY = 'blocks'
+    EVICTION_TARGET = 0.9
+
+    def __init__(self, max_size, block_size=BLOCK_SIZE, metrics=None):
+        self.max_size = max_size
+        self.metrics = metrics if metrics is not None else OperationMetrics()
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.total_size = None
+        self.hits = 0
+        self.misses = 0
+        self.cache_enabled = "DIP_HOME" in os.environ and max_size > 0
+        if self.cache_enabled:
+            self.cache_location = get_cache_location(self.BLOCKS_DIRECTORY)
+        else:
+            logger.info("Content cache disabled")
+
+    def get_block_location(self, file_id, sha1, index):
+        return os.path.join(self.cache_location, "{}-{}".format(file_id, sha1), str(index))
+
+    def get_block_count(self, size):
+        return (size + self.block_size - 1) // self.block_size
+
+    def get_block_length(self, size, index):
+        return min(self.block_size, size - index * self.block_size)
+
+    def contains(self, file_id, sha1, index):
+        return self.cache_enabled and os.path.exists(self.get_block_location(file_id, sha1, index))
+
+    def get(self, file_id, sha1, index, length):
+        # A block of another length than the one expected at this index is never served
+        if not self.cache_enabled:
+            return None
+        block_location = self.get_block_location(file_id, sha1, index)
+        block = None
+        try:
+            with open(block_location, "rb") as file_handle:
+                block = file_handle.read()
+            if len(block) != length:
+                logger.warning("Content cache block {} has {} bytes instead of {}, dropped".format(block_location, len(block), length))
+                block = None
+                os.remove(block_location)
+            else:
+                os.utime(block_location, None)
+        except (IOError, OSError):
+            pass
+        if block is None:
+            with self.lock:
+                self.misses = self.misses + 1
+            self.metrics.record_cache("content", False)
+            return None
+        with self.lock:
+            self.hits = self.hits + 1
+        self.metrics.record_cache("content", True)
+        return block
+
+    def put(self, file_id, sha1, index, block, length):
+        if not self.cache_enabled:
+            return
+        if len(block) != length:
+            logger.error("Content cache block {} of file {} has {} bytes instead of {}, not stored".format(index, file_id, len(block), length))
+            return
+        block_location = self.get_block_location(file_id, sha1, index)
+        # Written aside then renamed, so that concurrent readers never see a partial block
+        temporary_location = block_location + "." + str(uuid.uuid4())
+        try:
+            create_dir(block_location)
+            with open(temporary_location, "wb") as file_handle:
+                file_handle.write(block)
+            os.rename(temporary_location, block_location)
+        except (IOError, OSError) as error:
+            logger.error('Error while writing content cache:{}'.format(error))
+            return
+        with self.lock:
+            if self.total_size is None:
+                self.total_size = self.get_disk_usage()
+            else:
+                self.total_size = self.total_size + len(block)
+            must_evict = self.total_size > self.max_size
+        if must_evict:
+            self.evict()
+
+    def get_blocks(self):
+        blocks = []
+        for folder_entry in os.scandir(self.cache_location):
+            if not folder_entry.is_dir():
+                continue
+            for block_entry in os.scandir(folder_entry.path):
+                try:
+                    block_stat = block_entry.stat()
+                except OSError:
+                    # Evicted by another process
+                    continue
+                blocks.append((block_stat.st_mtime, block_stat.st_size, block_entry.path))
+        return blocks
+
+    def get_disk_usage(self):
+        try:
+            return sum([block[1] for block in self.get_blocks()])
+        except OSError:
+            return 0
+
+    def evict(self):
+        with self.lock:
+            try:
+                blocks = self.get_blocks()
+            except OSError as error:
+                logger.error('Error while evicting content cache:{}'.format(error))
+                return
+            blocks.sort()
+            total_size = sum([block[1] for block in blocks])
+            target_size = self.max_size * self.EVICTION_TARGET
+            evicted = 0
+            for _, block_size, block_location in blocks:
+                if total_size <= target_size:
+                    break
+                try:
+                    os.remove(block_location)
+                    os.rmdir(os.path.dirname(block_location))
+                except OSError:
+                    # Other blocks are left in the folder, or it was evicted by another process
+                    pass
+                total_size = total_size - block_size
+                evicted = evicted + 1
+            self.total_size = total_size
+        logger.info("Content cache: {} blocks evicted, {} bytes left".format(evicted, total_size))
+
+    def log_summary(self):
+        if not self.cache_enabled:
+            return
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        if hits + misses > 0:
+            logger.info("Content cache: {} block hits, {} block misses".format(hits, misses))
@@ -0,0 +1,121 @@
+import os
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class CrawledFile():
+    __slots__ = ('path', 'size', 'modified_at')
+
+    def __init__(self, path, size, modified_at):
+        self.path = path
+        self.size = size
+        self.modified_at = modified_at
+
+    def to_dict(self):
+        ret = {'path': self.path, 'size': self.size}
+        if self.modified_at is not None:
+            ret['lastModified'] = self.modified_at
+        return ret
+
+
+class BoxCrawler():
+    """
+    Breadth-first listing of a box.com folder tree. Sibling folders are listed
+    concurrently, and each discovered subfolder is fed back into the pool.
+    Files are yielded as soon as their folder is listed, as compact CrawledFile records.
+    """
+
+    BOX_FOLDER = "folder"
+    DEFAULT_THREADS = 8
+
+    def __init__(self, listings, cache=None, threads=DEFAULT_THREADS):
+        self.listings = listings
+        self.cache = cache
+        self.threads = max(threads, 1)
+
+    def crawl(self, path, cache_path, folder_id, first_non_empty=False):
+        """
+        Return the files found below folder_id as {'path', 'size', 'lastModified'} dicts
+        """
+        return [crawled_file.to_dict() for crawled_file in self.iter_files(path, cache_path, folder_id, first_non_empty)]
+
+    def iter_files(self, path, cache_path, folder_id, first_non_empty=False):
+        """
+        Yield the files found below folder_id as CrawledFile, path being prefixed by path.
+        Discovered items are added to the cache under cache_path.
+        If first_non_empty, stop as soon as a file with a size > 0 is found.
+        """
+        folders = self.iter_folders(path, cache_path, folder_id, first_non_empty)
+        try:
+            for folder_files, cache_entries in folders:
+                self.add_to_cache(cache_entries)
+                for folder_file in folder_files:
+                    yield folder_file
+        finally:
+            folders.close()
+
+    def iter_folders(self, path, cache_path, folder_id, first_non_empty=False):
+        """
+        Yield, for each folder listed below folder_id, its files and the cache entries of its children
+        """
+        if path == "/":
+            path = ""
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            # Listings are counted under the operation of the calling thread
+            list_folder = self.listings.metrics.bind(self.list_folder)
+            pending = {executor.submit(list_folder, path, cache_path, folder_id, first_non_empty, stop)}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        folder_files, sub_folders, cache_entries = future.result()
+                        yield folder_files, cache_entries
+                        if first_non_empty and any(folder_file.size > 0 for folder_file in folder_files):
+                            stop.set()
+                        if stop.is_set():
+                            continue
+                        for sub_path, sub_cache_path, sub_folder_id in sub_folders:
+                            pending.add(executor.submit(
+                                list_folder, sub_path, sub_cache_path, sub_folder_id, first_non_empty, stop
+                            ))
+                    if stop.is_set():
+                        break
+            finally:
+                # Also reached when the caller stops iterating early
+                stop.set()
+                for future in pending:
+                    future.cancel()
+
+    def list_folder(self, path, cache_path, folder_id, first_non_empty, stop):
+        # Runs in the pool: only lists, the cache is updated by the calling thread
+        files = []
+        sub_folders = []
+        cache_entries = []
+        if stop.is_set():
+            return files, sub_folders, cache_entries
+        for child in self.listings.get_items(folder_id):
+            child_path = path + '/' + child.name
+            child_cache_path = os.path.join(cache_path, child.name)
+            cache_entries.append((child_cache_path, child.id, child.type, child.size, child.modified_at))
+            if child.type == self.BOX_FOLDER:
+                sub_folders.append((child_path, child_cache_path, child.id))
+            else:
+                files.append(CrawledFile(child_path, child.size, child.modified_at))
+                if first_non_empty and child.size > 0:
+                    break
+            if stop.is_set():
+                break
+        return files, sub_folders, cache_entries
+
+    def add_to_cache(self, cache_entries):
+        if self.cache is None:
+            return
+        self.cache.add_batch(cache_entries)
@@ -1,17 +1,21 @@
 import os
-import shutil
+import copy
 import time
 import string
+import hashlib
 import logging
+import tempfile
+import threading
 
-try:
-    from BytesIO import BytesIO  # for Python 2
-except ImportError:
-    from io import BytesIO  # for Python 3
-
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from cache_handler import CacheHandler
-from utils import get_rel_path, get_normalized_path, get_item_size
+from sqlite_cache_handler import SQLiteCacheHandler
+from listing_cache import FolderListingCache
+from block_cache import BlockCache
+from folder_creator import FolderCreator
+from operation_metrics import OperationMetrics
+from utils import get_rel_path, get_normalized_path, get_item_size, get_item_last_modified, format_date
 from boxsdk.exception import BoxAPIException
 
 
@@ -26,18 +30,62 @@ class BoxItem():
     BOX_FILE = "file"
     BOX_ERR_NOT_FOUND = 404
     BOX_ERR_CONFLICT = 409
-    BOX_ERR_RESERVED = 'name_temporarily_reserved'
     BOX_ERR_DUPLICATE = 'item_name_in_use'
-
-    def __init__(self, cache_file_name, root, client):
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+    DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+    DEFAULT_DOWNLOAD_THREADS = 1
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+    SPOOL_MEMORY_SIZE = 4 * UPLOAD_CHUNK_SIZE
+    BOX_MIN_CHUNKED_UPLOAD_SIZE = 20 * 1024 * 1024
+    DEFAULT_CHUNKED_UPLOAD_THRESHOLD = 50 * 1024 * 1024
+    DEFAULT_UPLOAD_THREADS = 4
+    DEFAULT_LISTING_THREADS = 8
+    CACHE_BACKEND_SQLITE = "sqlite"
+    VALIDATION_ALWAYS = "always"
+    VALIDATION_TTL = "ttl"
+    VALIDATION_NEVER = "never"
+    DEFAULT_VALIDATION_TTL = 300
+    DEFAULT_CACHE_MAX_ENTRIES = 200000
+
+    def __init__(self, cache_file_name, root, client,
+                 chunked_upload_threshold=DEFAULT_CHUNKED_UPLOAD_THRESHOLD, upload_threads=DEFAULT_UPLOAD_THREADS,
+                 cache_backend=None, validation_policy=VALIDATION_ALWAYS, validation_ttl=DEFAULT_VALIDATION_TTL,
+                 listing_cache_ttl=FolderListingCache.DEFAULT_TTL, listing_threads=DEFAULT_LISTING_THREADS, cache=None,
+                 content_cache_size=0, download_threads=DEFAULT_DOWNLOAD_THREADS, metrics=None, events=None):
         self.path = ''
         self.id = "0"
         self.type = self.BOX_FOLDER
         self.modified_at = None
         self.size = 0
-        self.cache = CacheHandler(cache_file_name)
+        self.sha1 = None
+        if cache is not None:
+            # Already loaded, shared with other instances of the process
+            self.cache = cache
+        elif cache_backend == self.CACHE_BACKEND_SQLITE:
+            self.cache = SQLiteCacheHandler(cache_file_name)
+        else:
+            self.cache = CacheHandler(cache_file_name)
         self.root = root
         self.client = client
+        self.metrics = metrics if metrics is not None else OperationMetrics()
+        self.listings = FolderListingCache(client, ttl=listing_cache_ttl, metrics=self.metrics)
+        self.content_cache = BlockCache(content_cache_size, metrics=self.metrics) if content_cache_size > 0 else None
+        # Box.com refuses upload sessions for files below 20MB
+        self.chunked_upload_threshold = max(chunked_upload_threshold, self.BOX_MIN_CHUNKED_UPLOAD_SIZE)
+        self.upload_threads = max(upload_threads, 1)
+        self.listing_threads = max(listing_threads, 1)
+        self.download_threads = max(download_threads, 1)
+        # How much a cache hit is trusted before checking the id still exists on box.com
+        self.validation_policy = validation_policy or self.VALIDATION_ALWAYS
+        self.validation_ttl = validation_ttl
+        self.from_cache = False
+        # Optional EventSync keeping the cache up to date with the changes made outside of the plugin
+        self.events = events
+        if self.events is not None:
+            self.events.add_listings(self.listings)
+        # Shared with the clones of this item
+        self.upload_stats = {"skipped_files": 0, "skipped_bytes": 0}
+        self.upload_stats_lock = threading.Lock()
 
     def get_by_path(self, path, create_if_not_exist=False, force_no_cache=False):
         rel_path = get_rel_path(path)
@@ -45,88 +93,148 @@ class BoxItem():
             self.set_root()
             return self
 
-        item_id, item_type = self.cache.query(rel_path, force_no_cache)
+        self.from_cache = False
+        if self.events is not None:
+            self.events.apply_pending()
+        entry = self.cache.query_entry(rel_path, force_no_cache)
+        if self.cache.cache_enabled and not force_no_cache:
+            self.metrics.record_cache("ids", entry is not None)
 
-        if item_id is not None:
+        if entry is not None:
+            item_id, item_type = entry["item_id"], entry["item_type"]
+            if self.can_trust(entry):
+                self.path = rel_path
+                self.id = item_id
+                self.type = item_type
+                self.size = (entry["size"] if self.is_file() else 0)
+                self.modified_at = entry["modified_at"]
+                self.sha1 = None
+                self.from_cache = True
+                return self
             try:
                 item = self.get_details(item_id, item_type)
                 self.path = rel_path
                 self.id = item_id
                 self.type = item_type
                 self.size = (get_item_size(item) if self.is_file() else 0)
+                self.modified_at = get_item_last_modified(item)
+                self.sha1 = item['sha1'] if self.is_file() and 'sha1' in item else None
+                if self.validation_policy == self.VALIDATION_TTL or self.events is not None:
+                    self.cache.add(rel_path, item_id, item_type, self.size, self.modified_at)
                 return self
             except Exception as error:
                 logger.info("Exception:{}".format(error))
-                self.cache.reset()
+                # Only the stale entry and what was cached below it are dropped
+                self.cache.remove(item_id)
 
-        # Start iterating path from root id "0"
-        item_id = '0'
-        item_type = self.BOX_FOLDER
-
-        elts = rel_path.split('/')
+        # Start iterating path from the deepest cached folder above it, or from root id "0"
+        ancestor_path, ancestor_id = self.cache.query_ancestor(rel_path, self.BOX_FOLDER, force_no_cache)
+        while ancestor_id is not None:
+            try:
+                if self.check_ancestor(ancestor_path, ancestor_id):
+                    return self.walk_path(rel_path, ancestor_path, ancestor_id, create_if_not_exist, force_no_cache)
+                logger.info("Cached folder {} was moved or renamed".format(ancestor_path))
+            except BoxAPIException as err:
+                if err.status != self.BOX_ERR_NOT_FOUND:
+                    raise
+                logger.info("Cached folder {} does not exist anymore".format(ancestor_path))
+            # The listings naming it are stale too, the cached folders above it are checked in turn
+            self.listings.invalidate_item(ancestor_id)
+            self.cache.remove(ancestor_id)
+            ancestor_path, ancestor_id = self.cache.query_ancestor(rel_path, self.BOX_FOLDER, force_no_cache)
+        return self.walk_path(rel_path, '', '0', create_if_not_exist, force_no_cache)
+
+    def walk_path(self, rel_path, start_path, start_id, create_if_not_exist=False, force_no_cache=False):
+        # Lists each folder from start_path down to rel_path, bypassing the cached listings when force_no_cache is set
+        self.id = start_id
+        self.type = self.BOX_FOLDER
+        start_elts = [elt for elt in start_path.split('/') if len(elt) > 0]
+        elts = rel_path.split('/')[len(start_elts):]
+        logger.debug("Resolving {} from '{}': {} listing request(s) saved".format(rel_path, start_path, len(start_elts)))
 
-        current_path = ''
+        current_path = start_path
         for elt in elts:
             current_path = os.path.join(current_path, elt)
-            items_iter = self.client.folder(folder_id=item_id).get_items(fields=['modified_at', 'name', 'type', 'size'])
             found = False
-            for item in items_iter:
+            for item in self.listings.get_items(self.id, refresh=force_no_cache):
                 if item.name == elt:
-                    self.path = rel_path
+                    # An id from a cached listing may be stale, as one from the id cache
+                    self.from_cache = not force_no_cache and self.listings.ttl > 0
                     self.id = item.id
-                    item_id = item.id
                     self.type = item.type
-                    self.modified_at = self.format_date(item.modified_at)
-                    self.size = get_item_size(item)
-                    self.cache.add(current_path, item.id, item.type)
+                    self.modified_at = item.modified_at
+                    self.size = item.size
+                    self.sha1 = item.sha1
+                    self.cache.add(current_path, item.id, item.type, self.size, self.modified_at)
                     found = True
                     break
 
             if not found:
                 if create_if_not_exist:
-                    new_folder = self.create_subfolder(elt)
-                    item_id = new_folder.id
-                    self.cache.add(current_path, new_folder.id, self.BOX_FOLDER)
+                    self.create_subfolder(elt)
+                    self.cache.add(current_path, self.id, self.BOX_FOLDER)
                 else:
                     self.set_none()
+                    return self
+        self.path = rel_path
         return self
 
+    def check_ancestor(self, ancestor_path, ancestor_id):
+        # The folder a path is resolved from is subject to the validation policy too, its path is checked on box.com
+        entry = self.cache.query_entry(ancestor_path)
+        if entry is not None and entry["item_id"] == ancestor_id and self.can_trust(entry):
+            return True
+        folder = self.client.folder(ancestor_id).get(fields=['name', 'path_collection', 'modified_at'])
+        names = [parent['name'] for parent in folder['path_collection']['entries'] if parent['id'] != '0']
+        if '/'.join(names + [folder['name']]) != ancestor_path:
+            return False
+        if self.validation_policy == self.VALIDATION_TTL or self.events is not None:
+            self.cache.add(ancestor_path, ancestor_id, self.BOX_FOLDER, 0, get_item_last_modified(folder))
+        return True
+
+    def can_trust(self, entry):
+        if entry["item_type"] == self.BOX_FILE and entry["size"] is None:
+            # Entries from older caches lack what stat needs
+            return False
+        if self.events is not None and self.events.covers(entry["confirmed_at"]):
+            return True
+        if self.validation_policy == self.VALIDATION_NEVER:
+            return True
+        if self.validation_policy == self.VALIDATION_TTL:
+            confirmed_at = entry["confirmed_at"]
+            return confirmed_at is not None and time.time() - confirmed_at < self.validation_ttl
+        return False
+
     def get_details(self, id, type):
         if type == self.BOX_FOLDER:
             return self.client.folder(id).get(fields=['modified_at', 'name', 'type', 'size'])
         elif type == self.BOX_FILE:
-            return self.client.file(id).get(fields=['modified_at', 'name', 'type', 'size'])
+            return self.client.file(id).get(fields=['modified_at', 'name', 'type', 'size', 'sha1'])
+
+    def clone(self):
+        # Item of its own, for another thread, sharing the client and the caches
+        item = copy.copy(self)
+        item.set_root()
+        item.from_cache = False
+        return item
 
     def set_root(self):
+        self.path = ''
         self.id = "0"
         self.type = self.BOX_FOLDER
         self.size = 0
+        self.sha1 = None
 
     def set_none(self):
         self.id = None
         self.type = None
         self.modified_at = None
         self.size = None
+        self.sha1 = None
 
     def create_subfolder(self, name):
-        new_folder = {}
-        new_id = None
-        while new_id is None:
-            try:
-                new_folder = self.client.folder(self.id).create_subfolder(name)
-                new_id = self.fix_any_duplicate(name, new_folder['id'])
-            except BoxAPIException as err:
-                if err.status == self.BOX_ERR_CONFLICT:
-                    if err.code == self.BOX_ERR_RESERVED:
-                        # Item name is reserved but there is no ID yet, so we have to loop until we get a BOX_ERR_DUPLICATE
-                        time.sleep(1)
-                        pass
-                    elif err.code == self.BOX_ERR_DUPLICATE:
-                        new_id = err.context_info['conflicts'][0]['id']
-                    else:
-                        raise Exception('Unimplemented Box.com conflict error while creating subfolder')
-                else:
-                    raise Exception('Unimplemented Box.com error while creating subfolder')
+        new_id = FolderCreator.create(self.client, self.id, name, self.listings)
+        self.listings.invalidate(self.id)
         self.id = new_id
         self.type = self.BOX_FOLDER
         self.size = 0
@@ -141,12 +249,7 @@ class BoxItem():
             return
 
     def format_date(self, date):
-        if date is not None:
-            utc_time = datetime.strptime(date, "%Y-%m-%dT%H:%M:%S-%f:00")
-            epoch_time = (utc_time - datetime(1970, 1, 1)).total_seconds()
-            return int(epoch_time) * 1000
-        else:
-            return None
+        return format_date(date)
 
     def not_exists(self):
         return (self.id is None)
@@ -172,14 +275,14 @@ class BoxItem():
 
     def get_children(self, internal_path):
         children = []
-        for sub in self.client.folder(self.id).get_items(fields=['modified_at', 'name', 'type', 'size']):
+        for sub in self.listings.get_items(self.id):
             sub_path = get_normalized_path(os.path.join(internal_path, sub.name))
             ret = {
                 'fullPath': sub_path, 'exists': True, 'directory': sub.type == self.BOX_FOLDER,
-                'size': get_item_size(sub), 'lastModified': self.get_last_modified(sub)
+                'size': sub.size, 'lastModified': sub.modified_at
             }
             children.append(ret)
-            self.cache.add(get_rel_path(sub.name), sub.id, sub.type)
+            self.cache.add(os.path.join(self.path, sub.name), sub.id, sub.type, ret['size'], ret['lastModified'])
         return children
 
     def get_id(self):
@@ -192,22 +295,349 @@ class BoxItem():
         }
 
     def get_stream(self, byte_range=None):
+        # Returns the raw HTTP response so the body can be consumed chunk by chunk,
+        # instead of loading the whole file in memory with file.content()
+        box_file = self.client.file(self.id)
+        headers = None
         if byte_range:
-            ws = self.client.file(self.id).content(byte_range=byte_range)
-        else:
-            ws = self.client.file(self.id).content()
-        return BytesIO(ws)
+            headers = {'Range': 'bytes={}-{}'.format(byte_range[0], byte_range[1])}
+        box_response = self.client.session.get(
+            box_file.get_url('content'),
+            expect_json_response=False,
+            stream=True,
+            headers=headers
+        )
+        raw_stream = box_response.network_response.response_as_stream
+        raw_stream.decode_content = True
+        return raw_stream
+
+    def get_content_version(self):
+        # Blocks are laid out from the size of the version they are stored for, so both are read
+        # together from box.com, whatever the cached entry or folder listing said
+        box_file = self.client.file(self.id).get(fields=['sha1', 'size'])
+        self.sha1 = box_file['sha1']
+        self.size = box_file['size']
+        return self.sha1, self.size
+
+    def write_content_to(self, stream, byte_range=None):
+        if self.content_cache is not None and self.content_cache.cache_enabled and self.size:
+            return self.write_cached_content_to(stream, byte_range)
+        if self.download_threads > 1 and self.size and self.size > self.DOWNLOAD_PART_SIZE:
+            # The known size only hints that parts are worth it, they are laid out from the size box.com returns
+            start, end = byte_range if byte_range else (0, self.size - 1)
+            end = min(end, self.size - 1)
+            if end - start >= self.DOWNLOAD_PART_SIZE:
+                return self.write_parallel_content_to(stream, byte_range)
+        return self.write_single_content_to(stream, byte_range)
+
+    def write_single_content_to(self, stream, byte_range=None):
+        start_time = time.time()
+        raw_stream = self.get_stream(byte_range)
+        time_to_first_byte = None
+        transferred = 0
+        try:
+            while True:
+                chunk = raw_stream.read(self.DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if time_to_first_byte is None:
+                    time_to_first_byte = time.time() - start_time
+                    logger.info("First byte of file {} received after {:.3f}s".format(self.id, time_to_first_byte))
+                stream.write(chunk)
+                transferred = transferred + len(chunk)
+        finally:
+            raw_stream.close()
+        logger.info("Downloaded {} bytes of file {} in {:.3f}s".format(transferred, self.id, time.time() - start_time))
+        return transferred
+
+    def write_parallel_content_to(self, stream, byte_range=None):
+        # The first part is requested alone, the other ones are laid out from the total size in its Content-Range
+        start_time = time.time()
+        start = byte_range[0] if byte_range else 0
+        raw_stream = self.get_stream((start, start + self.DOWNLOAD_PART_SIZE - 1))
+        try:
+            size = self.get_content_range_size(raw_stream)
+            if size is None:
+                logger.info("No content range returned for file {}, downloaded over a single connection".format(self.id))
+            else:
+                self.size = size
+                end = min(byte_range[1], size - 1) if byte_range else size - 1
+                first_part = self.read_exactly(raw_stream, min(start + self.DOWNLOAD_PART_SIZE - 1, end) - start + 1)
+        finally:
+            raw_stream.close()
+        if size is None:
+            return self.write_single_content_to(stream, byte_range)
+        stream.write(first_part)
+        transferred = len(first_part)
+        parts = [
+            (offset, min(offset + self.DOWNLOAD_PART_SIZE, end + 1) - 1)
+            for offset in range(start + self.DOWNLOAD_PART_SIZE, end + 1, self.DOWNLOAD_PART_SIZE)
+        ]
+        for part in self.run_in_order(self.download_range, parts):
+            stream.write(part)
+            transferred = transferred + len(part)
+        logger.info("Downloaded {} bytes of file {} in {:.3f}s over {} connections".format(
+            transferred, self.id, time.time() - start_time, self.download_threads
+        ))
+        return transferred
+
+    def get_content_range_size(self, raw_stream):
+        # Content-Range: bytes <first>-<last>/<total>, only on partial responses
+        content_range = raw_stream.headers.get('Content-Range') if raw_stream.status == 206 else None
+        if not content_range or '/' not in content_range:
+            return None
+        total = content_range.split('/')[-1].strip()
+        return int(total) if total.isdigit() else None
+
+    def run_in_order(self, function, arguments):
+        # Yields function's results in the order of arguments, with a bounded number of results held for reordering
+        max_pending = 2 * self.download_threads
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.download_threads) as executor:
+            try:
+                for argument in arguments:
+                    pending.append(executor.submit(self.metrics.bind(function), argument))
+                    if len(pending) >= max_pending:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def download_range(self, byte_range):
+        raw_stream = self.get_stream(byte_range)
+        try:
+            return self.read_exactly(raw_stream, byte_range[1] - byte_range[0] + 1)
+        finally:
+            raw_stream.close()
+
+    def write_cached_content_to(self, stream, byte_range=None):
+        # Blocks missing from the content cache are downloaded by runs of consecutive blocks, one request per run
+        start_time = time.time()
+        sha1, size = self.get_content_version()
+        if size == 0:
+            return 0
+        start, end = byte_range if byte_range else (0, size - 1)
+        end = min(end, size - 1)
+        content_cache = self.content_cache
+        block_size = content_cache.block_size
+        last_index = end // block_size
+        index = start // block_size
+        hits = 0
+        transferred = 0
+        if self.download_threads > 1:
+            # Missing blocks are downloaded concurrently, one request per block
+            blocks = self.run_in_order(lambda block_index: self.get_block(sha1, size, block_index), range(index, last_index + 1))
+            for block, from_cache in blocks:
+                hits = hits + (1 if from_cache else 0)
+                transferred = transferred + self.write_block_slice(stream, block, index, start, end)
+                index = index + 1
+        while index <= last_index:
+            block = content_cache.get(self.id, sha1, index, content_cache.get_block_length(size, index))
+            if block is not None:
+                hits = hits + 1
+                transferred = transferred + self.write_block_slice(stream, block, index, start, end)
+                index = index + 1
+                continue
+            run_end = index
+            while run_end < last_index and not content_cache.contains(self.id, sha1, run_end + 1):
+                run_end = run_end + 1
+            range_end = min((run_end + 1) * block_size, size) - 1
+            raw_stream = self.get_stream((index * block_size, range_end))
+            try:
+                for block_index in range(index, run_end + 1):
+                    block_length = content_cache.get_block_length(size, block_index)
+                    block = self.read_exactly(raw_stream, block_length)
+                    content_cache.put(self.id, sha1, block_index, block, block_length)
+                    transferred = transferred + self.write_block_slice(stream, block, block_index, start, end)
+            finally:
+                raw_stream.close()
+            index = run_end + 1
+        logger.info("Read {} bytes of file {} in {:.3f}s, {} of {} blocks from the content cache".format(
+            transferred, self.id, time.time() - start_time, hits, last_index - start // block_size + 1
+        ))
+        return transferred
+
+    def get_block(self, sha1, size, index):
+        block_length = self.content_cache.get_block_length(size, index)
+        block = self.content_cache.get(self.id, sha1, index, block_length)
+        if block is not None:
+            return block, True
+        block_start = index * self.content_cache.block_size
+        block = self.download_range((block_start, block_start + block_length - 1))
+        self.content_cache.put(self.id, sha1, index, block, block_length)
+        return block, False
+
+    def write_block_slice(self, stream, block, index, start, end):
+        block_start = index * self.content_cache.block_size
+        data = block[max(start - block_start, 0):end - block_start + 1]
+        stream.write(data)
+        return len(data)
+
+    def read_exactly(self, raw_stream, length):
+        chunks = []
+        remaining = length
+        while remaining > 0:
+            chunk = raw_stream.read(min(remaining, self.DOWNLOAD_CHUNK_SIZE))
+            if not chunk:
+                raise Exception('Unexpected end of box.com content stream')
+            chunks.append(chunk)
+            remaining = remaining - len(chunk)
+        return b"".join(chunks)
 
     def write_stream(self, stream):
+        # Small contents stay in memory, larger ones roll over to a local temporary file
+        content_sha1 = hashlib.sha1()
+        with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MEMORY_SIZE) as spool_file:
+            size = self.spool(stream, spool_file, content_sha1)
+            return self.upload_spooled(spool_file, size, content_sha1)
+
+    def spool_stream(self, stream):
+        # Whole content in a local temporary file, to be uploaded later with upload_spooled
+        content_sha1 = hashlib.sha1()
+        spool_file = tempfile.TemporaryFile()
+        try:
+            size = self.spool(stream, spool_file, content_sha1)
+        except Exception:
+            spool_file.close()
+            raise
+        return spool_file, size, content_sha1
+
+    def upload_spooled(self, spool_file, size, content_sha1):
+        # Files already on box.com with the same SHA1 are left untouched, others are uploaded as a new version
         file_name = self.path.split('/')[-1]
-        sio = BytesIO()
-        shutil.copyfileobj(stream, sio)
-        sio.seek(0)
-        ret = self.client.folder(self.id).upload_stream(sio, file_name=file_name)
+        existing_id, existing_sha1 = self.find_file(file_name)
+        ret = unchanged = self.get_unchanged_file(existing_id, existing_sha1, content_sha1.hexdigest())
+        if unchanged is None and size < self.chunked_upload_threshold:
+            # Single shot upload
+            ret = self.upload_content(
+                existing_id,
+                lambda: self.client.folder(self.id).upload_stream(
+                    self.rewind(spool_file), file_name=file_name, sha1=content_sha1.hexdigest()
+                ),
+                lambda file_id: self.client.file(file_id).update_contents_with_stream(
+                    self.rewind(spool_file), sha1=content_sha1.hexdigest()
+                )
+            )
+        elif unchanged is None:
+            ret = self.upload_content(
+                existing_id,
+                lambda: self.upload_in_chunks(spool_file, size, content_sha1.digest(), file_name),
+                lambda file_id: self.upload_in_chunks(spool_file, size, content_sha1.digest(), file_name, file_id)
+            )
+        else:
+            with self.upload_stats_lock:
+                self.upload_stats["skipped_files"] = self.upload_stats["skipped_files"] + 1
+                self.upload_stats["skipped_bytes"] = self.upload_stats["skipped_bytes"] + size
+            logger.info("File {} unchanged, {} bytes not uploaded".format(self.path, size))
+        self.listings.invalidate(self.id)
         self.id = ret.id
-        self.cache.add(self.path, ret.id, ret.type)
+        self.cache.add(self.path, ret.id, ret.type, get_item_size(ret), get_item_last_modified(ret))
         return self
 
+    def rewind(self, stream):
+        stream.seek(0)
+        return stream
+
+    def find_file(self, file_name):
+        for item in self.listings.get_items(self.id):
+            if item.name == file_name and item.type == self.BOX_FILE:
+                return item.id, item.sha1
+        return None, None
+
+    def get_unchanged_file(self, file_id, file_sha1, content_sha1):
+        # The listing may be stale, the SHA1 is checked again before skipping the upload
+        if file_id is None or file_sha1 != content_sha1:
+            return None
+        try:
+            item = self.client.file(file_id).get(fields=['type', 'sha1', 'size', 'modified_at'])
+        except BoxAPIException as err:
+            if err.status != self.BOX_ERR_NOT_FOUND:
+                raise
+            return None
+        return item if item['sha1'] == content_sha1 else None
+
+    def upload_content(self, existing_id, upload_file, upload_version):
+        if existing_id is not None:
+            try:
+                return upload_version(existing_id)
+            except BoxAPIException as err:
+                if err.status != self.BOX_ERR_NOT_FOUND:
+                    raise
+                logger.info("File {} was deleted meanwhile, uploading it again".format(existing_id))
+        try:
+            return upload_file()
+        except BoxAPIException as err:
+            conflicting_id = self.get_conflicting_file_id(err)
+            if conflicting_id is None:
+                raise
+            # Created by a competing process, or missing from a stale listing
+            return upload_version(conflicting_id)
+
+    def get_conflicting_file_id(self, err):
+        if err.status != self.BOX_ERR_CONFLICT or err.code != self.BOX_ERR_DUPLICATE or not err.context_info:
+            return None
+        conflicts = err.context_info.get('conflicts')
+        if isinstance(conflicts, list):
+            conflicts = conflicts[0] if conflicts else None
+        if not conflicts or conflicts.get('type') != self.BOX_FILE:
+            return None
+        return conflicts.get('id')
+
+    def spool(self, stream, spool_file, content_sha1, limit=None):
+        size = 0
+        while limit is None or size < limit:
+            chunk_size = self.UPLOAD_CHUNK_SIZE if limit is None else min(self.UPLOAD_CHUNK_SIZE, limit - size)
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            content_sha1.update(chunk)
+            spool_file.write(chunk)
+            size = size + len(chunk)
+        return size
+
+    def upload_in_chunks(self, spool_file, total_size, content_sha1, file_name, file_id=None):
+        start_time = time.time()
+        spool_file.seek(0)
+        if file_id is None:
+            upload_session = self.client.folder(self.id).create_upload_session(total_size, file_name)
+        else:
+            # New version of an existing file
+            upload_session = self.client.file(file_id).create_upload_session(total_size, file_name)
+        part_size = upload_session.part_size
+        logger.info("Uploading {} bytes in {} parts of {} bytes using {} connections".format(
+            total_size, upload_session.total_parts, part_size, self.upload_threads
+        ))
+        parts = []
+        try:
+            # At most upload_threads parts are held in memory at any time
+            with ThreadPoolExecutor(max_workers=self.upload_threads) as executor:
+                pending = set()
+                offset = 0
+                while offset < total_size:
+                    part_bytes = spool_file.read(part_size)
+                    pending.add(executor.submit(self.metrics.bind(upload_session.upload_part_bytes), part_bytes, offset, total_size))
+                    offset = offset + len(part_bytes)
+                    if len(pending) >= self.upload_threads:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        parts.extend([future.result() for future in done])
+                done, pending = wait(pending)
+                parts.extend([future.result() for future in done])
+        except Exception as error:
+            logger.error("Chunked upload failed, aborting upload session:{}".format(error))
+            try:
+                upload_session.abort()
+            except Exception as abort_error:
+                logger.info("Exception while aborting upload session:{}".format(abort_error))
+            raise
+        parts.sort(key=lambda part: part['offset'])
+        ret = upload_session.commit(content_sha1, parts=parts)
+        if ret is None:
+            raise Exception('Box.com did not process the commit of the chunked upload')
+        logger.info("Chunked upload of {} bytes done in {:.3f}s".format(total_size, time.time() - start_time))
+        return ret
+
     def create_path(self, path, force_no_cache=False):
         target_path = '/'.join(path.split('/')[:-1])
         ret = self.get_by_path(target_path, create_if_not_exist=True, force_no_cache=force_no_cache)
@@ -225,76 +655,99 @@ class BoxItem():
                 else:
                     raise Exception("Error while deleting box.com item")
             self.cache.remove(self.id)
+            self.listings.invalidate_item(self.id)
             return 1
         if self.is_folder():
-            return self.recursive_delete()
+            counter = self.recursive_delete()
+            self.listings.invalidate_item(self.id)
+            return counter
 
-    def recursive_delete(self, id=None):
-        counter = 0
-        if id is None:
-            id = self.id
-        try:
-            for child in self.client.folder(id).get_items():
-                if child.type == self.BOX_FOLDER:
-                    counter = counter + self.recursive_delete(id=child.id)
-                    try:
-                        self.cache.remove(child.id)
-                        counter = counter + 1
-                    except Exception as error:
-                        logger.info("Exception:{}".format(error))
-                elif child.type == self.BOX_FILE:
-                    try:
-                        self.client.file(child.id).delete()
-                        self.cache.remove(child.id)
-                        counter = counter + 1
-                    except Exception as error:
-                        # File already deleted
-                        logger.info("Exception:{}".format(error))
-        except Exception:
-            logger.info("Folder already deleted")
+    def recursive_delete(self):
+        counter = self.delete_tree(self.id)
         self.cache.remove(self.id)
         return counter
 
-    def fix_any_duplicate(self, name, new_id):
-        # Several plugin instances creating the same folder on box.com can lead to duplicate folder names
-        if self.is_duplicated(name, new_id):
-            self.cache.reset()
-            time.sleep(1)  # waiting for dust to settle on box.com side
-            id_default_folder = self.id_default_folder(name)
-            if id_default_folder != new_id:
-                try:
-                    self.client.folder(new_id).delete()
-                except Exception as error:
-                    logger.info("Folder already deleted:{}".format(error))
-                return id_default_folder
-        return new_id
-
-    def is_duplicated(self, name, new_id):
-        instances = 0
-        my_child = False
+    def delete_tree(self, id):
+        if self.is_root(id):
+            # The provider's root folder itself is kept, only its content goes
+            return self.delete_children(id)
+        # box.com deletes a whole tree in a single call, so files are counted beforehand
+        folder_ids, file_ids = self.list_tree(id)
         try:
-            for child in self.client.folder(self.id).get_items():
-                if child.name == name:
-                    instances = instances + 1
-                    if child.id == new_id:
-                        my_child = True
+            self.client.folder(id).delete(recursive=True)
         except BoxAPIException as err:
-            raise Exception('Error while accessing box.com item:{0}'.format(err))
-        return (instances > 1) and my_child
-
-    def id_default_folder(self, name):
+            if err.status == self.BOX_ERR_NOT_FOUND:
+                logger.info("Folder already deleted")
+                return 0
+            logger.info("Recursive deletion refused by box.com ({}), deleting items one by one".format(err.code))
+            return self.delete_items(file_ids, [id] + folder_ids)
+        return len(file_ids)
+
+    def is_root(self, id):
+        return id == "0" or (id == self.id and self.path == get_rel_path(get_normalized_path(self.root)))
+
+    def list_tree(self, folder_id):
+        # Breadth-first, so that sub folders come after their parent in folder_ids
+        folder_ids = []
+        file_ids = []
+        with ThreadPoolExecutor(max_workers=self.listing_threads) as executor:
+            list_folder_names = self.metrics.bind(self.list_folder_names)
+            pending = {executor.submit(list_folder_names, folder_id)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for child in future.result():
+                        if child.type == self.BOX_FOLDER:
+                            folder_ids.append(child.id)
+                            pending.add(executor.submit(list_folder_names, child.id))
+                        elif child.type == self.BOX_FILE:
+                            file_ids.append(child.id)
+        return folder_ids, file_ids
+
+    def list_folder_names(self, folder_id):
         try:
-            probe_folder = self.client.folder(self.id).create_subfolder(name)
-            return probe_folder.id
+            return self.listings.list_folder(folder_id, fields=['name'])
         except BoxAPIException as err:
-            if err.status == self.BOX_ERR_CONFLICT:
-                if err.code == self.BOX_ERR_DUPLICATE:
-                    return err.context_info['conflicts'][0]['id']
-                else:
-                    raise Exception('Unimplemented Box.com conflict error while creating subfolder')
+            if err.status != self.BOX_ERR_NOT_FOUND:
+                raise
+            logger.info("Folder already deleted")
+            return []
+
+    def delete_children(self, folder_id):
+        counter = 0
+        children = self.list_folder_names(folder_id)
+        with ThreadPoolExecutor(max_workers=self.listing_threads) as executor:
+            futures = []
+            for child in children:
+                if child.type == self.BOX_FOLDER:
+                    futures.append((child.id, executor.submit(self.metrics.bind(self.delete_tree), child.id)))
+                elif child.type == self.BOX_FILE:
+                    futures.append((child.id, executor.submit(self.metrics.bind(self.delete_item), child.id, self.BOX_FILE)))
+            for child_id, future in futures:
+                counter = counter + future.result()
+                self.cache.remove(child_id)
+        self.listings.invalidate(folder_id)
+        return counter
+
+    def delete_items(self, file_ids, folder_ids):
+        # Fallback when box.com refuses to delete a tree at once: files in parallel, then the emptied folders, deepest first
+        with ThreadPoolExecutor(max_workers=self.listing_threads) as executor:
+            counter = sum(executor.map(self.metrics.bind(lambda file_id: self.delete_item(file_id, self.BOX_FILE)), file_ids))
+        for folder_id in reversed(folder_ids):
+            self.delete_item(folder_id, self.BOX_FOLDER)
+        return counter
+
+    def delete_item(self, id, type):
+        try:
+            if type == self.BOX_FOLDER:
+                self.client.folder(id).delete(recursive=False)
             else:
-                raise Exception('Unimplemented Box.com error while creating subfolder: {0}'.format(err))
-        return None
+                self.client.file(id).delete()
+        except BoxAPIException as error:
+            # Already deleted by a competing process, or not deletable
+            logger.info("Exception:{}".format(error))
+            return 0
+        return 1
 
     def check_path_format(self, path):
         special_names = [".", ".."]
@@ -309,4 +762,14 @@ class BoxItem():
                 raise Exception('An element of the path contains a trailing space')
 
     def close(self):
-        self.cache.write_onto_disk()
+        if self.events is not None:
+            # Also persists the stream position reached
+            self.events.apply_pending()
+            self.events.log_summary()
+        self.cache.flush()
+        with self.upload_stats_lock:
+            skipped_files, skipped_bytes = self.upload_stats["skipped_files"], self.upload_stats["skipped_bytes"]
+        if skipped_files > 0:
+            logger.info("{} unchanged files not uploaded, {} bytes saved".format(skipped_files, skipped_bytes))
+        if self.content_cache is not None:
+            self.content_cache.log_summary()
@@ -0,0 +1,198 @@
+import re
+import time
+import random
+import threading
+import logging
+
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from boxsdk.network.default_network import DefaultNetwork, DefaultNetworkResponse
+from six import text_type
+from pprint import pformat
+from boxsdk.util.log import sanitize_dictionary
+from operation_metrics import OperationMetrics
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+# The DefaultNetwork of box.com logs all network queries and responses, INCLUDING CONTENT
+# This is crazy but it is how it is, and it of course lead to incredible disk usage
+# and various failures because these insane log lines can find their way to a LogTail in DSS
+#
+# The DefaultNetwork has provision to avoid logging when the response is a stream
+# (see response_as_stream in DefaultNetworkResponse), but boxsdk.object.file always uses
+# the .content instead of the .raw, so it always goes through logging
+#
+# So we override the DefaultNetwork's log function to avoid logging big things
+#
+# Note: another option would be to try to use response_as_stream instead, but it would
+# require rewrapping boxsdk.object.file, so looks more dangerous
+MAX_LOGGED_RESPONSE_SIZE = 2048
+
+
+class LessVerboseLoggingNetwork(DefaultNetwork):
+    """
+    On top of the logging fix, this network layer keeps a keep-alive connection pool sized
+    for our concurrent listings and transfers, and retries throttled (429), failed (5xx) and
+    dropped requests with a jittered exponential backoff honouring Retry-After. max_retries caps the
+    retries of a request, including the ones the SDK session makes on its own.
+    Requests, their latency, transferred bytes and retries are counted per operation, in the metrics of
+    the provider that issued them, passed along by its session, or else in the network's own metrics.
+    An optional RateLimiter paces every attempt and is told about throttling.
+    """
+
+    RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    DEFAULT_POOL_SIZE = 16
+    DEFAULT_MAX_RETRIES = 5
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 60
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, rate_limiter=None):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+        # Attempts of the request in progress on each thread
+        self.local = threading.local()
+        self.metrics = OperationMetrics()
+
+    @property
+    def network_response_constructor(self):
+        return LessVerboseLoggingNetworkResponse
+
+    def request(self, method, url, access_token, **kwargs):
+        # The SDK session calls this again through retry_after when it retries, which is counted
+        # as more attempts of the same request rather than as a new one
+        metrics = kwargs.pop('metrics', None)
+        if metrics is None:
+            metrics = self.metrics
+        if not getattr(self.local, 'retrying', False):
+            self.local.attempts = 0
+        self.local.response = None
+        self.local.metrics = metrics
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            retries = self.local.attempts
+            self.local.attempts = self.local.attempts + 1
+            start_time = time.time()
+            try:
+                response = super().request(method, url, access_token, **kwargs)
+                self.record_request(metrics, method, url, response, time.time() - start_time)
+            except (ConnectionError, Timeout):
+                if not self.can_retry(method, retries, **kwargs) or method.upper() not in self.IDEMPOTENT_METHODS:
+                    raise
+                delay = self.get_backoff(retries)
+            else:
+                if response.status_code == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.on_throttled()
+                if response.status_code not in self.RETRYABLE_STATUSES or not self.can_retry(method, retries, **kwargs):
+                    self.local.response = response
+                    return response
+                delay = self.get_backoff(retries, response.headers.get('Retry-After'))
+                response.request_response.close()
+            logger.info("Retrying {} {} in {:.2f}s (attempt {})".format(method, url, delay, retries + 1))
+            metrics.record_retry(delay)
+            time.sleep(delay)
+
+    def retry_after(self, delay, request_method, *args, **kwargs):
+        # The SDK session retries 429s, 5xx and some failures on its own, on top of the retries made above.
+        # Only the attempts left within max_retries are made, eg for streamed bodies the session rewinds,
+        # otherwise the session is handed the last response again, or None to raise the last error
+        if self.local.attempts > self.max_retries:
+            return self.local.response
+        self.local.metrics.record_retry(delay)
+        time.sleep(delay)
+        self.local.retrying = True
+        try:
+            return request_method(*args, **kwargs)
+        finally:
+            self.local.retrying = False
+
+    def can_retry(self, method, retries, **kwargs):
+        if retries >= self.max_retries:
+            return False
+        # Streamed bodies can't be replayed from here, the SDK session rewinds and retries those
+        if kwargs.get('files'):
+            return False
+        data = kwargs.get('data')
+        return data is None or isinstance(data, (bytes, text_type))
+
+    def get_backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after) + random.uniform(0, self.BACKOFF_BASE)
+            except (TypeError, ValueError):
+                pass
+        backoff = min(self.BACKOFF_MAX, self.BACKOFF_BASE * (2 ** attempt))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def record_request(self, metrics, method, url, response, latency):
+        # Ids are removed from the path so that calls are grouped by endpoint, eg "GET /folders/{id}/items"
+        path = urlparse(url).path
+        path = re.sub(r'^/(api/)?2\.0', '', path)
+        path = re.sub(r'/[^/]*[0-9][^/]*', '/{id}', path)
+        request_response = response.request_response
+        metrics.record_request(
+            "{} {}".format(method.upper(), path), latency,
+            self.get_content_length(request_response.request.headers),
+            self.get_content_length(request_response.headers)
+        )
+
+    def get_content_length(self, headers):
+        # Unknown for chunked transfers
+        try:
+            return int(headers.get('Content-Length', 0))
+        except (TypeError, ValueError):
+            return 0
+
+
+class LessVerboseLoggingNetworkResponse(DefaultNetworkResponse):
+    def log(self, can_safely_log_content=False):
+        if self._did_log:
+            return
+        self._did_log = True
+        content_length = self.headers.get('Content-Length', None)
+        content = "<stream not logged>"
+
+        if can_safely_log_content:
+            if content_length is None:
+                content_length = text_type(len(self.content))
+
+            if len(self.content) > MAX_LOGGED_RESPONSE_SIZE:
+                content = "<Content not logged (size=%s)>" % len(self.content)
+            else:
+                # If possible, get the content as a JSON `dict`, that way
+                # `pformat(content)` will return pretty-printed JSON.
+                try:
+                    content = self.json()
+                except ValueError:
+                    content = self.content
+                content = pformat(sanitize_dictionary(content))
+        if content_length is None:
+            content_length = '?'
+        if self.ok:
+            logger_method, response_format = self._logger.info, self.SUCCESSFUL_RESPONSE_FORMAT
+        else:
+            logger_method, response_format = self._logger.warning, self.ERROR_RESPONSE_FORMAT
+        logger_method(
+            response_format,
+            {
+                'method': self.request_response.request.method,
+                'url': self.request_response.request.url,
+                'status_code': self.status_code,
+                'content_length': content_length,
+                'headers': pformat(self.headers),
+                'content': content,
+            },
+        )
+
+# End of logging fixes
+############################
@@ -1,88 +1,317 @@
 import os
 import json
 import uuid
-import errno
+import time
+import fcntl
 import logging
+import functools
+import threading
 from shutil import move
+from path_trie import PathTrie
+from utils import get_cache_location, create_dir
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO,  # avoid getting log from 3rd party module
                     format='box-com plugin %(levelname)s - %(message)s')
 
 
+def synchronized(method):
+    # The cache is shared by the threads of the provider, such as the write-behind upload workers
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class CacheHandler():
-    def __init__(self, cache_file_name):
+    """
+    Path to box.com id cache, held in memory as a PathTrie so that removing an item
+    invalidates exactly its subtree. The cache is stored as a JSON snapshot plus an append-only
+    journal of add / remove / reset records, so that each update costs O(1) on disk.
+    Records are buffered in memory and appended to the journal by batches, and the journal
+    is compacted into the snapshot once it outgrows the cache itself.
+    Above max_entries, the least recently used entries are evicted.
+    Public methods hold a reentrant lock, so that threads can share the cache.
+    """
+
+    JOURNAL_SUFFIX = '.journal'
+    JOURNAL_BUFFER_SIZE = 500
+    COMPACTION_MIN_RECORDS = 10000
+    EVICTION_TARGET = 0.9
+
+    def __init__(self, cache_file_name, max_entries=0):
+        self.lock = threading.RLock()
+        self.max_entries = max_entries
         if cache_file_name is None:
             self.cache_enabled = False
         else:
             self.cache_enabled = True
         if self.cache_enabled:
-            self.cache_location = os.environ["DIP_HOME"] + '/caches/plugins/box-com/' + cache_file_name
+            self.cache_location = get_cache_location(cache_file_name)
+            self.journal_location = self.cache_location + self.JOURNAL_SUFFIX
+            self.pending_records = []
+            self.journal_records = 0
             self.load_cache()
             self.uuid = uuid.uuid4()
             self.removed = []
 
     def load_cache(self):
+        # Versioned before reading, so that a compaction happening meanwhile triggers a reload
+        self.snapshot_version = self.get_snapshot_version()
+        self.cache = self.read_snapshot()
+        self.journal_records, self.journal_offset = self.replay_journal(self.cache)
+
+    def get_snapshot_version(self):
+        try:
+            snapshot_stat = os.stat(self.cache_location)
+            return (snapshot_stat.st_ino, snapshot_stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    @synchronized
+    def refresh(self):
+        # Catch up with the records appended by other processes since the cache was loaded
+        if not self.cache_enabled:
+            return
+        self.flush_journal()
+        try:
+            journal_size = os.path.getsize(self.journal_location)
+        except OSError:
+            journal_size = 0
+        if self.get_snapshot_version() != self.snapshot_version or journal_size < self.journal_offset:
+            self.load_cache()
+        else:
+            records, self.journal_offset = self.replay_journal(self.cache, self.journal_offset)
+            self.journal_records = self.journal_records + records
+
+    def read_snapshot(self):
         try:
             with open(self.cache_location, "r") as file_handle:
-                self.cache = json.load(file_handle)
-                file_handle.close()
+                return PathTrie.from_dict(json.load(file_handle))
         except Exception:
-            self.cache = {}
+            return PathTrie()
+
+    def replay_journal(self, cache, offset=0):
+        # Returns the number of records applied and the offset of the first line not read yet
+        records = 0
+        try:
+            with open(self.journal_location, "rb") as file_handle:
+                file_handle.seek(offset)
+                for line in file_handle:
+                    if not line.endswith(b"\n"):
+                        # Line still being written by another process
+                        break
+                    offset = offset + len(line)
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # Partially written line from an interrupted process
+                        continue
+                    self.apply_record(cache, record)
+                    records = records + 1
+        except (IOError, OSError):
+            pass
+        return records, offset
+
+    def apply_record(self, cache, record):
+        operation = record.get("op")
+        if operation == "add":
+            cache.set(
+                record["path"], record["item_id"], record["item_type"],
+                record.get("size"), record.get("modified_at"), record.get("confirmed_at")
+            )
+        elif operation == "remove":
+            cache.remove_path(record["path"])
+        elif operation == "evict":
+            cache.evict_path(record["path"])
+        elif operation == "reset":
+            cache.clear()
+
+    def journal(self, record):
+        self.pending_records.append(record)
+        if len(self.pending_records) >= self.JOURNAL_BUFFER_SIZE:
+            self.flush_journal()
+
+    @synchronized
+    def flush_journal(self):
+        if not self.pending_records:
+            return
+        lines = "".join([json.dumps(record) + "\n" for record in self.pending_records])
+        try:
+            create_dir(self.journal_location)
+            with open(self.journal_location, "a") as file_handle:
+                fcntl.flock(file_handle, fcntl.LOCK_EX)
+                file_handle.write(lines)
+            self.journal_records = self.journal_records + len(self.pending_records)
+        except (IOError, OSError) as error:
+            logger.error('Error while writing cache journal:{}'.format(error))
+        self.pending_records = []
+        if self.journal_records > max(self.COMPACTION_MIN_RECORDS, len(self.cache)):
+            self.compact()
+
+    @synchronized
+    def compact(self):
+        # Rebuild the snapshot from disk so that records appended by other processes are kept
+        try:
+            create_dir(self.journal_location)
+            with open(self.journal_location, "a") as journal_handle:
+                fcntl.flock(journal_handle, fcntl.LOCK_EX)
+                cache = self.read_snapshot()
+                self.replay_journal(cache)
+                self.merge_access_times(cache)
+                self.cache = cache
+                if self.max_entries > 0 and len(self.cache) > self.max_entries:
+                    # Written in the snapshot, no need to journal the evictions
+                    self.evict(journal=False)
+                self.write_onto_disk()
+                journal_handle.truncate(0)
+                self.snapshot_version = self.get_snapshot_version()
+            self.journal_records = 0
+            self.journal_offset = 0
+        except (IOError, OSError) as error:
+            logger.error('Error while compacting cache journal:{}'.format(error))
+
+    def merge_access_times(self, cache):
+        # Accesses are not journaled, this process' ones are kept over a compaction
+        for path, node in cache.items():
+            previous = self.cache.find(path)
+            if previous is not None and previous.item_id == node.item_id and previous.accessed_at is not None:
+                node.accessed_at = max(node.accessed_at or 0, previous.accessed_at)
 
+    @synchronized
+    def evict(self, journal=True):
+        entries = sorted(self.cache.items(), key=lambda entry: entry[1].accessed_at or 0)
+        evicted = len(self.cache) - int(self.max_entries * self.EVICTION_TARGET)
+        for path, node in entries[:evicted]:
+            self.cache.evict_node(node)
+            if journal:
+                self.journal({"op": "evict", "path": path})
+        logger.info("{} least recently used cache entries evicted".format(max(evicted, 0)))
+
+    @synchronized
+    def flush(self):
+        if not self.cache_enabled:
+            return
+        self.flush_journal()
+
+    @synchronized
     def reset(self):
         if not self.cache_enabled:
             return
-        if self.cache != {}:
-            self.cache = {}
-            self.write_onto_disk()
+        if len(self.cache) > 0:
+            self.cache = PathTrie()
+            self.pending_records = []
+            self.journal({"op": "reset"})
+            self.flush_journal()
 
+    @synchronized
     def write_onto_disk(self):
         if not self.cache_enabled:
             return
         try:
             temporary_location = self.cache_location + str(self.uuid)
-            self.create_dir(temporary_location)
+            create_dir(temporary_location)
             with open(temporary_location, "w") as file_handle:
-                file_handle.write(json.dumps(self.cache))
+                file_handle.write(json.dumps(self.cache.to_dict()))
                 file_handle.close()
             move(temporary_location, self.cache_location)
         except (IOError, ValueError, EOFError) as error:
-            logger.error('Error while saving cache:' + error)
+            logger.error('Error while saving cache:{}'.format(error))
         except Exception as error:
-            logger.error('Error while saving cache' + error)
-
-    def create_dir(self, filename):
-        if not os.path.exists(os.path.dirname(filename)):
-            try:
-                os.makedirs(os.path.dirname(filename))
-                return 1
-            except OSError as error:  # Guard against race condition
-                if error.errno != errno.EEXIST:
-                    raise
-                logger.info("Error :" + error)
-                return 0
-        return 0
-
-    def add(self, path, item_id, item_type):
+            logger.error('Error while saving cache:{}'.format(error))
+
+    @synchronized
+    def add(self, path, item_id, item_type, size=None, modified_at=None):
+        # Entries are added right after box.com returned them, so they are confirmed as of now
+        if not self.cache_enabled:
+            return
+        confirmed_at = time.time()
+        self.cache.set(path, item_id, item_type, size, modified_at, confirmed_at)
+        self.journal({
+            "op": "add", "path": path, "item_id": item_id, "item_type": item_type,
+            "size": size, "modified_at": modified_at, "confirmed_at": confirmed_at
+        })
+        if self.max_entries > 0 and len(self.cache) > self.max_entries:
+            self.evict()
+
+    @synchronized
+    def add_batch(self, entries):
         if not self.cache_enabled:
             return
-        self.cache[path] = {"item_id": item_id, "item_type": item_type}
-        self.write_onto_disk()
+        confirmed_at = time.time()
+        added = 0
+        for entry in entries:
+            path, item_id, item_type = entry[:3]
+            size = entry[3] if len(entry) > 3 else None
+            modified_at = entry[4] if len(entry) > 4 else None
+            self.cache.set(path, item_id, item_type, size, modified_at, confirmed_at)
+            self.journal({
+                "op": "add", "path": path, "item_id": item_id, "item_type": item_type,
+                "size": size, "modified_at": modified_at, "confirmed_at": confirmed_at
+            })
+            added = added + 1
+        if added >= self.COMPACTION_MIN_RECORDS:
+            # Large batches go to the snapshot right away, rather than being replayed by every load
+            self.flush_journal()
+            if self.journal_records > 0:
+                self.compact()
+        elif self.max_entries > 0 and len(self.cache) > self.max_entries:
+            self.evict()
+
+    @synchronized
+    def count_entries(self):
+        if not self.cache_enabled:
+            return 0
+        return len(self.cache)
 
     def query(self, path, force_no_cache=False):
+        entry = self.query_entry(path, force_no_cache)
+        if entry is None:
+            return None, None
+        return entry["item_id"], entry["item_type"]
+
+    @synchronized
+    def query_entry(self, path, force_no_cache=False):
+        if not self.cache_enabled or force_no_cache:
+            return None
+        node = self.cache.find(path)
+        if node is None or node.item_id is None:
+            return None
+        node.accessed_at = time.time()
+        return node.get_entry()
+
+    @synchronized
+    def query_ancestor(self, path, item_type, force_no_cache=False):
         if not self.cache_enabled or force_no_cache:
             return None, None
-        if path in self.cache:
-            return self.cache[path]["item_id"], self.cache[path]["item_type"]
-        else:
+        ancestor_path, node = self.cache.closest_ancestor(path, item_type)
+        if node is None:
             return None, None
+        node.accessed_at = time.time()
+        return ancestor_path, node.item_id
+
+    @synchronized
+    def query_path(self, item_id):
+        if not self.cache_enabled:
+            return None
+        return self.cache.path_of_id(item_id)
 
+    @synchronized
     def remove(self, id):
+        # Removes the item and everything cached below it
         if not self.cache_enabled:
             return 0
-        for key, value in self.cache.items():
-            if value["item_id"] == id:
-                self.removed.append(key)
-                self.cache.pop(key, None)
-                return 1
-        return 0
+        path = self.cache.path_of_id(id)
+        if path is None:
+            return 0
+        return self.remove_path(path)
+
+    @synchronized
+    def remove_path(self, path):
+        if not self.cache_enabled:
+            return 0
+        if self.cache.remove_path(path) == 0:
+            return 0
+        self.removed.append(path)
+        self.journal({"op": "remove", "path": path})
+        return 1
@@ -0,0 +1,97 @@
+import logging
+import threading
+
+from collections import OrderedDict
+from boxsdk import OAuth2, Client
+from boxsdk.session.session import AuthorizedSession
+from box_network import LessVerboseLoggingNetwork
+from rate_limiter import RateLimiter
+from cache_handler import CacheHandler
+from sqlite_cache_handler import SQLiteCacheHandler
+from event_sync import EventSync
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class ClientRegistry():
+    """
+    Process-level registry of what is costly to build for each provider instance:
+    authenticated clients with their network layer and connection pool, keyed by access token
+    hash and network settings, and loaded id caches, keyed by cache file name and backend, along with
+    the events stream followers keeping them in sync.
+    A cache handed out again first catches up with the changes made by other processes.
+    """
+
+    MAX_CLIENTS = 16
+    CACHE_BACKEND_SQLITE = "sqlite"
+
+    clients = OrderedDict()
+    caches = {}
+    event_syncs = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls, access_token, token_hash, pool_size, max_retries, rate_limit):
+        key = (token_hash, pool_size, max_retries, rate_limit)
+        with cls.lock:
+            entry = cls.clients.get(key)
+            if entry is not None:
+                cls.clients.move_to_end(key)
+                return entry
+            auth = OAuth2(
+                client_id="",
+                client_secret="",
+                access_token=access_token
+            )
+            network = LessVerboseLoggingNetwork(
+                pool_size=pool_size,
+                max_retries=max_retries,
+                rate_limiter=(RateLimiter.get(token_hash, rate_limit) if rate_limit > 0 else None)
+            )
+            session = AuthorizedSession(auth, network_layer=network)
+            entry = (Client(auth, session), network)
+            cls.clients[key] = entry
+            # Expired tokens are never used again
+            while len(cls.clients) > cls.MAX_CLIENTS:
+                cls.clients.popitem(last=False)
+            return entry
+
+    @classmethod
+    def with_metrics(cls, client, metrics):
+        # Client of its own for a provider, sharing the network layer and connection pool of client,
+        # whose requests are counted in the provider's metrics
+        session = client.session.with_default_network_request_kwargs({'metrics': metrics})
+        return Client(client.auth, session)
+
+    @classmethod
+    def get_cache(cls, cache_file_name, cache_backend=None, max_entries=0):
+        if cache_file_name is None:
+            return CacheHandler(None)
+        key = (cache_file_name, cache_backend == cls.CACHE_BACKEND_SQLITE)
+        with cls.lock:
+            cache = cls.caches.get(key)
+            if cache is None:
+                if cache_backend == cls.CACHE_BACKEND_SQLITE:
+                    cache = SQLiteCacheHandler(cache_file_name, max_entries=max_entries)
+                else:
+                    cache = CacheHandler(cache_file_name, max_entries=max_entries)
+                cls.caches[key] = cache
+            else:
+                cache.max_entries = max_entries
+                cache.refresh()
+            return cache
+
+    @classmethod
+    def get_event_sync(cls, cache_file_name, cache_backend, client, cache, interval):
+        key = (cache_file_name, cache_backend == cls.CACHE_BACKEND_SQLITE)
+        with cls.lock:
+            event_sync = cls.event_syncs.get(key)
+            if event_sync is None or event_sync.cache is not cache:
+                event_sync = EventSync(cache_file_name, client, cache, interval=interval)
+                cls.event_syncs[key] = event_sync
+            else:
+                event_sync.interval = max(interval, 1)
+            return event_sync
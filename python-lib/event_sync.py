@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import weakref
+
+from collections import deque
+from utils import format_date, get_cache_location, create_dir
+from boxsdk.exception import BoxAPIException
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class EventSync():
+    """
+    Keeps an id cache in sync with the changes made on box.com outside of this process, by following
+    the events stream of the account from a stream position persisted next to the cache.
+    Events are fetched by a background thread and applied to the cache by the thread using it, at its
+    next lookup. Entries confirmed since the stream is followed can then be trusted without checking
+    them on box.com, as long as the stream was read less than two intervals ago.
+    """
+
+    POSITION_SUFFIX = '.events'
+    STREAM_TYPE = 'changes'
+    EVENTS_LIMIT = 500
+    DEFAULT_INTERVAL = 10
+    # The thread stops once nothing used the cache for that long, and restarts at the next lookup
+    IDLE_TIMEOUT = 600
+    MAX_PENDING_EVENTS = 10000
+    BOX_ROOT_ID = "0"
+    BOX_ERR_BAD_REQUEST = 400
+    REMOVE_EVENTS = ['ITEM_TRASH', 'COLLAB_REMOVE']
+    UPDATE_EVENTS = [
+        'ITEM_CREATE', 'ITEM_UPLOAD', 'ITEM_COPY', 'ITEM_MOVE', 'ITEM_RENAME',
+        'ITEM_UNDELETE_VIA_TRASH', 'ITEM_MAKE_CURRENT_VERSION'
+    ]
+
+    def __init__(self, cache_file_name, client, cache, interval=DEFAULT_INTERVAL):
+        self.client = client
+        self.cache = cache
+        self.interval = max(interval, 1)
+        self.position_location = get_cache_location(cache_file_name + self.POSITION_SUFFIX)
+        self.lock = threading.Lock()
+        # Batches are applied one at a time, in the order they were fetched
+        self.apply_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.listings = weakref.WeakSet()
+        self.pending = deque()
+        self.used_at = time.time()
+        self.synced_at = None
+        self.applied = 0
+        self.position, self.since = self.read_position()
+        self.fetched_position = self.position
+        # Records journaled before the position was persisted must be visible before events are applied on top
+        self.cache.refresh()
+
+    def add_listings(self, listings):
+        # Folder listings to invalidate along with the cache
+        with self.lock:
+            self.listings.add(listings)
+
+    def read_position(self):
+        try:
+            with open(self.position_location, "r") as file_handle:
+                state = json.load(file_handle)
+            return state["stream_position"], state["since"]
+        except Exception:
+            return None, None
+
+    def write_position(self, position, since):
+        try:
+            create_dir(self.position_location)
+            temporary_location = self.position_location + "." + str(uuid.uuid4())
+            with open(temporary_location, "w") as file_handle:
+                json.dump({"stream_position": position, "since": since}, file_handle)
+            os.rename(temporary_location, self.position_location)
+        except (IOError, OSError) as error:
+            logger.error('Error while saving events stream position:{}'.format(error))
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="box-com-events")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if time.time() - self.used_at > self.IDLE_TIMEOUT:
+                logger.info("Events stream idle, polling stopped")
+                return
+            self.poll()
+            self.stopped.wait(self.interval)
+
+    def poll(self):
+        try:
+            while True:
+                with self.lock:
+                    position = self.fetched_position
+                    if len(self.pending) >= self.MAX_PENDING_EVENTS:
+                        # Not applied yet, the lookups will not trust the cache until they are
+                        return
+                if position is None:
+                    self.start_stream()
+                    return
+                response = self.get_events(position)
+                entries = response.get('entries', [])
+                with self.lock:
+                    if self.fetched_position != position:
+                        # Restarted meanwhile
+                        return
+                    self.pending.extend(entries)
+                    self.fetched_position = response.get('next_stream_position', position)
+                    if len(entries) < self.EVENTS_LIMIT:
+                        self.synced_at = time.time()
+                        return
+        except BoxAPIException as error:
+            if error.status != self.BOX_ERR_BAD_REQUEST:
+                logger.error("Error while reading box.com events:{}".format(error))
+                return
+            # Stream position expired, cached entries confirmed before now cannot be trusted anymore
+            logger.warning("Events stream position {} rejected, following the stream from now".format(position))
+            self.start_stream()
+        except Exception as error:
+            logger.error("Error while reading box.com events:{}".format(error))
+
+    def start_stream(self):
+        position = self.get_events('now').get('next_stream_position')
+        with self.lock:
+            self.pending.clear()
+            self.fetched_position = position
+            self.position = None
+            # Only what is confirmed from now on is covered by the stream
+            self.since = time.time()
+            self.synced_at = self.since
+        logger.info("Following box.com events from stream position {}".format(position))
+
+    def get_events(self, position):
+        url = self.client.events().get_url()
+        params = {'stream_position': position, 'stream_type': self.STREAM_TYPE, 'limit': self.EVENTS_LIMIT}
+        return self.client.session.get(url, params=params).json()
+
+    def apply_pending(self):
+        self.used_at = time.time()
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        with self.apply_lock:
+            with self.lock:
+                events = list(self.pending)
+                self.pending.clear()
+                position, since = self.fetched_position, self.since
+                listings = list(self.listings)
+                persist = position is not None and position != self.position
+                self.position = position
+            for event in events:
+                self.apply(event, listings)
+            self.applied = self.applied + len(events)
+            if persist:
+                # The cache must hold the applied events before another process starts from this position
+                self.cache.flush()
+                self.write_position(position, since)
+
+    def apply(self, event, listings):
+        source = event.get('source') or {}
+        item_id = source.get('id')
+        item_type = source.get('type')
+        if item_id is None or item_type not in ['file', 'folder']:
+            return
+        event_type = event.get('event_type')
+        parent_id = (source.get('parent') or {}).get('id')
+        for folder_listings in listings:
+            folder_listings.invalidate_item(item_id)
+            if parent_id is not None:
+                folder_listings.invalidate(parent_id)
+        if event_type in self.REMOVE_EVENTS:
+            self.cache.remove(item_id)
+        elif event_type in self.UPDATE_EVENTS:
+            # Cached at its new path when its folder is known, what was cached below it is resolved again
+            self.cache.remove(item_id)
+            parent_path = self.get_folder_path(parent_id)
+            if parent_path is not None and source.get('name'):
+                self.cache.add(
+                    os.path.join(parent_path, source['name']), item_id, item_type,
+                    source.get('size'), format_date(source.get('modified_at'))
+                )
+
+    def get_folder_path(self, folder_id):
+        if folder_id is None:
+            return None
+        if folder_id == self.BOX_ROOT_ID:
+            return ''
+        return self.cache.query_path(folder_id)
+
+    def covers(self, confirmed_at):
+        with self.lock:
+            since, synced_at = self.since, self.synced_at
+        if confirmed_at is None or since is None or synced_at is None:
+            return False
+        return confirmed_at >= since and time.time() - synced_at < 2 * self.interval
+
+    def log_summary(self):
+        if self.applied > 0:
+            logger.info("{} box.com events applied to the cache".format(self.applied))
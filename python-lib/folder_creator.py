@@ -0,0 +1,148 @@
+import os
+import time
+import fcntl
+import hashlib
+import logging
+import threading
+
+from contextlib import contextmanager
+from concurrent.futures import Future
+from boxsdk.exception import BoxAPIException
+from utils import get_cache_location, create_dir
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class FolderCreator():
+    """
+    Creates box.com folders so that concurrent writers of the same new folder end up sharing one.
+    Within the process, a single thread creates a given (parent id, name) while the others wait for its
+    result. Across the processes of the host, creations are serialized by local lock files, one per
+    bucket of (parent id, name). Names still reserved by a creation in progress elsewhere are retried
+    with a short exponential backoff.
+    """
+
+    BOX_ERR_CONFLICT = 409
+    BOX_ERR_RESERVED = 'name_temporarily_reserved'
+    BOX_ERR_DUPLICATE = 'item_name_in_use'
+    LOCK_DIRECTORY = 'locks'
+    LOCK_BUCKETS = 64
+    INITIAL_BACKOFF = 0.05
+    MAX_BACKOFF = 2.0
+    MAX_ATTEMPTS = 10
+
+    in_flight = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def create(cls, client, parent_id, name, listings):
+        """
+        Return the id of the folder name in parent_id, creating it if needed.
+        listings is the FolderListingCache used to look for duplicates
+        """
+        key = (parent_id, name)
+        with cls.lock:
+            future = cls.in_flight.get(key)
+            is_creator = future is None
+            if is_creator:
+                future = Future()
+                cls.in_flight[key] = future
+        if not is_creator:
+            return future.result()
+        try:
+            with cls.host_lock(parent_id, name):
+                folder_id = cls.create_or_get(client, parent_id, name, listings)
+            future.set_result(folder_id)
+            return folder_id
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with cls.lock:
+                del cls.in_flight[key]
+
+    @classmethod
+    @contextmanager
+    def host_lock(cls, parent_id, name):
+        lock_fd = None
+        if "DIP_HOME" in os.environ:
+            bucket = int(hashlib.sha1("{}/{}".format(parent_id, name).encode('utf-8')).hexdigest(), 16) % cls.LOCK_BUCKETS
+            lock_location = get_cache_location(cls.LOCK_DIRECTORY, "folders-{}.lock".format(bucket))
+            try:
+                create_dir(lock_location)
+                lock_fd = os.open(lock_location, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            except OSError as error:
+                logger.warning("Folder creation not coordinated across processes:{}".format(error))
+                if lock_fd is not None:
+                    os.close(lock_fd)
+                    lock_fd = None
+        try:
+            yield
+        finally:
+            if lock_fd is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+                os.close(lock_fd)
+
+    @classmethod
+    def create_or_get(cls, client, parent_id, name, listings):
+        backoff = cls.INITIAL_BACKOFF
+        for attempt in range(cls.MAX_ATTEMPTS):
+            try:
+                new_folder = client.folder(parent_id).create_subfolder(name)
+                return cls.fix_any_duplicate(client, parent_id, name, new_folder['id'], listings)
+            except BoxAPIException as err:
+                if err.status != cls.BOX_ERR_CONFLICT:
+                    raise Exception('Unimplemented Box.com error while creating subfolder: {0}'.format(err))
+                if err.code == cls.BOX_ERR_DUPLICATE:
+                    # Created by another process, or before us
+                    return err.context_info['conflicts'][0]['id']
+                if err.code != cls.BOX_ERR_RESERVED:
+                    raise Exception('Unimplemented Box.com conflict error while creating subfolder')
+            # Item name is reserved but there is no ID yet, so we have to wait until we get a BOX_ERR_DUPLICATE
+            time.sleep(backoff)
+            backoff = min(backoff * 2, cls.MAX_BACKOFF)
+        raise Exception('Box.com folder name {} still reserved after {} attempts'.format(name, cls.MAX_ATTEMPTS))
+
+    @classmethod
+    def fix_any_duplicate(cls, client, parent_id, name, new_id, listings):
+        # Processes of other hosts creating the same folder on box.com can lead to duplicate folder names
+        if not cls.is_duplicated(parent_id, name, new_id, listings):
+            return new_id
+        default_id = cls.get_default_folder_id(client, parent_id, name)
+        if default_id is not None and default_id != new_id:
+            try:
+                client.folder(new_id).delete()
+            except Exception as error:
+                logger.info("Folder already deleted:{}".format(error))
+            return default_id
+        return new_id
+
+    @classmethod
+    def is_duplicated(cls, parent_id, name, new_id, listings):
+        instances = 0
+        my_child = False
+        try:
+            # Fresh listing, as the point is to see what competing processes just created
+            for child in listings.list_folder(parent_id, fields=['name']):
+                if child.name == name:
+                    instances = instances + 1
+                    if child.id == new_id:
+                        my_child = True
+        except BoxAPIException as err:
+            raise Exception('Error while accessing box.com item:{0}'.format(err))
+        return (instances > 1) and my_child
+
+    @classmethod
+    def get_default_folder_id(cls, client, parent_id, name):
+        # The folder box.com reports on name conflicts is the one every process keeps
+        try:
+            probe_folder = client.folder(parent_id).create_subfolder(name)
+            return probe_folder.id
+        except BoxAPIException as err:
+            if err.status == cls.BOX_ERR_CONFLICT and err.code == cls.BOX_ERR_DUPLICATE:
+                return err.context_info['conflicts'][0]['id']
+            raise Exception('Unimplemented Box.com error while creating subfolder: {0}'.format(err))
@@ -0,0 +1,136 @@
+import time
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils import format_date
+from operation_metrics import OperationMetrics
+
+
+class ListingEntry():
+    __slots__ = ('name', 'id', 'type', 'size', 'modified_at', 'sha1')
+
+    def __init__(self, name, id, type, size, modified_at, sha1=None):
+        self.name = name
+        self.id = id
+        self.type = type
+        self.size = size
+        self.modified_at = modified_at
+        self.sha1 = sha1
+
+
+class FolderListingCache():
+    """
+    In-process cache of folder listings (folder id -> child entries), shared by browse, stat,
+    enumerate and path resolution. Listings expire after ttl seconds, the least recently used
+    ones are evicted once the cached entries exceed max_entries, and our own writes, deletes
+    and moves invalidate the listings they change.
+    """
+
+    # id and type are always returned by box.com
+    LISTING_FIELDS = ['name', 'size', 'modified_at', 'sha1']
+    PAGE_SIZE = 1000  # Maximum allowed by box.com
+    DEFAULT_TTL = 60
+    DEFAULT_MAX_ENTRIES = 100000
+
+    def __init__(self, client, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, metrics=None):
+        self.client = client
+        self.metrics = metrics if metrics is not None else OperationMetrics()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.listings = OrderedDict()
+        self.parents = {}
+        self.total_entries = 0
+        self.lock = threading.Lock()
+
+    def get_items(self, folder_id, refresh=False):
+        if not refresh:
+            with self.lock:
+                listing = self.listings.get(folder_id)
+                if listing is not None:
+                    listed_at, entries = listing
+                    if time.time() - listed_at < self.ttl:
+                        self.listings.move_to_end(folder_id)
+                        self.metrics.record_cache("listings", True)
+                        return entries
+            if self.ttl > 0:
+                self.metrics.record_cache("listings", False)
+        entries = self.list_folder(folder_id)
+        self.store(folder_id, entries)
+        return entries
+
+    def list_folder(self, folder_id, fields=LISTING_FIELDS):
+        entries = []
+        for item in self.iter_items(folder_id, fields):
+            entries.append(ListingEntry(
+                item.get('name'), item['id'], item['type'], item.get('size', 0), format_date(item.get('modified_at')),
+                item.get('sha1')
+            ))
+        return entries
+
+    def iter_items(self, folder_id, fields=LISTING_FIELDS):
+        # Marker based pagination with the largest pages, the next page is requested while the current one is consumed
+        url = self.client.folder(folder_id).get_url('items')
+        params = {'limit': self.PAGE_SIZE, 'usemarker': True, 'fields': ','.join(fields)}
+        items, next_marker = self.get_page(url, params, None)
+        if next_marker is None:
+            for item in items:
+                yield item
+            return
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            while True:
+                next_page = None
+                if next_marker is not None:
+                    next_page = prefetcher.submit(self.metrics.bind(self.get_page), url, params, next_marker)
+                for item in items:
+                    yield item
+                if next_page is None:
+                    break
+                items, next_marker = next_page.result()
+
+    def get_page(self, url, params, marker):
+        page_params = dict(params)
+        if marker is not None:
+            page_params['marker'] = marker
+        response = self.client.session.get(url, params=page_params).json()
+        return response.get('entries', []), response.get('next_marker') or None
+
+    def store(self, folder_id, entries):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.drop(folder_id)
+            self.listings[folder_id] = (time.time(), entries)
+            self.total_entries = self.total_entries + len(entries)
+            for entry in entries:
+                self.parents[entry.id] = folder_id
+            while self.total_entries > self.max_entries and len(self.listings) > 1:
+                self.drop(next(iter(self.listings)))
+
+    def drop(self, folder_id):
+        listing = self.listings.pop(folder_id, None)
+        if listing is None:
+            return
+        _, entries = listing
+        self.total_entries = self.total_entries - len(entries)
+        for entry in entries:
+            if self.parents.get(entry.id) == folder_id:
+                del self.parents[entry.id]
+
+    def invalidate(self, folder_id):
+        with self.lock:
+            self.drop(folder_id)
+
+    def invalidate_item(self, item_id):
+        # Drops the listing of the folder containing the item, and the item's own listing
+        with self.lock:
+            parent_id = self.parents.get(item_id)
+            if parent_id is not None:
+                self.drop(parent_id)
+            self.drop(item_id)
+
+    def clear(self):
+        with self.lock:
+            self.listings = OrderedDict()
+            self.parents = {}
+            self.total_entries = 0
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from utils import get_cache_location, create_dir
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class OperationMetrics():
+    """
+    Counters per provider operation (stat, browse, read...): API calls by endpoint, bytes sent and
+    received, retries, cache hits and misses, and histograms of operation durations and request latencies.
+    The current operation is per thread, work submitted to a thread pool through bind() is counted under the
+    operation of the submitting thread. Requests made outside of any operation are counted under "other".
+    """
+
+    OTHER_OPERATION = "other"
+    # Upper bounds of the histogram buckets, in seconds, the last bucket holds everything above
+    LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    METRICS_DIRECTORY = 'metrics'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.operations = {}
+
+    def get_counters(self, operation):
+        operation = operation or self.OTHER_OPERATION
+        counters = self.operations.get(operation)
+        if counters is None:
+            counters = {
+                "count": 0, "duration": 0.0, "durations": [0] * (len(self.LATENCY_BUCKETS) + 1),
+                "api_calls": {}, "latencies": [0] * (len(self.LATENCY_BUCKETS) + 1),
+                "bytes_in": 0, "bytes_out": 0, "retries": 0, "retry_wait": 0.0,
+                "cache_hits": {}, "cache_misses": {}
+            }
+            self.operations[operation] = counters
+        return counters
+
+    def get_bucket(self, duration):
+        for index, upper_bound in enumerate(self.LATENCY_BUCKETS):
+            if duration <= upper_bound:
+                return index
+        return len(self.LATENCY_BUCKETS)
+
+    def get_operation(self):
+        return getattr(self.local, "operation", None)
+
+    def start_operation(self, operation):
+        self.local.operation = operation
+
+    def bind(self, function, operation=None):
+        # Wraps function to run under operation, by default the calling thread's, whichever thread runs it
+        operation = operation or self.get_operation()
+
+        def run_under_operation(*args, **kwargs):
+            previous_operation = self.get_operation()
+            self.local.operation = operation
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.operation = previous_operation
+        return run_under_operation
+
+    def end_operation(self, duration):
+        operation = self.get_operation()
+        with self.lock:
+            counters = self.get_counters(operation)
+            counters["count"] = counters["count"] + 1
+            counters["duration"] = counters["duration"] + duration
+            counters["durations"][self.get_bucket(duration)] += 1
+            retries, retry_wait = counters["retries"], counters["retry_wait"]
+        if retries > 0:
+            logger.info("{}: {} retries so far, {:.2f}s spent waiting".format(operation, retries, retry_wait))
+        self.local.operation = None
+
+    def record_request(self, endpoint, latency, bytes_out, bytes_in):
+        with self.lock:
+            counters = self.get_counters(self.get_operation())
+            counters["api_calls"][endpoint] = counters["api_calls"].get(endpoint, 0) + 1
+            counters["latencies"][self.get_bucket(latency)] += 1
+            counters["bytes_out"] = counters["bytes_out"] + bytes_out
+            counters["bytes_in"] = counters["bytes_in"] + bytes_in
+
+    def record_retry(self, delay):
+        with self.lock:
+            counters = self.get_counters(self.get_operation())
+            counters["retries"] = counters["retries"] + 1
+            counters["retry_wait"] = counters["retry_wait"] + delay
+
+    def record_cache(self, cache_name, hit):
+        with self.lock:
+            counters = self.get_counters(self.get_operation())
+            hits_or_misses = counters["cache_hits"] if hit else counters["cache_misses"]
+            hits_or_misses[cache_name] = hits_or_misses.get(cache_name, 0) + 1
+
+    def get_api_calls(self, operation=None):
+        with self.lock:
+            counters = self.operations.get(operation or self.OTHER_OPERATION)
+            return sum(counters["api_calls"].values()) if counters is not None else 0
+
+    def get_percentile_bound(self, histogram, percentile):
+        # Upper bound of the bucket holding the percentile, None if above the last bound
+        total = sum(histogram)
+        if total == 0:
+            return 0
+        seen = 0
+        for index, count in enumerate(histogram):
+            seen = seen + count
+            if seen >= total * percentile:
+                return self.LATENCY_BUCKETS[index] if index < len(self.LATENCY_BUCKETS) else None
+        return None
+
+    def get_summary(self):
+        with self.lock:
+            operations = dict(self.operations)
+        summaries = []
+        for operation in sorted(operations):
+            counters = operations[operation]
+            p90 = self.get_percentile_bound(counters["latencies"], 0.9)
+            hits = sum(counters["cache_hits"].values())
+            lookups = hits + sum(counters["cache_misses"].values())
+            summaries.append("{} x{} {:.2f}s, {} calls (p90 {}), {}B in, {}B out, {} retries, {}/{} cache hits".format(
+                operation, counters["count"], counters["duration"], sum(counters["api_calls"].values()),
+                "<={}s".format(p90) if p90 is not None else ">{}s".format(self.LATENCY_BUCKETS[-1]),
+                counters["bytes_in"], counters["bytes_out"], counters["retries"], hits, lookups
+            ))
+        return " | ".join(summaries)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "latency_buckets": self.LATENCY_BUCKETS,
+                "operations": json.loads(json.dumps(self.operations))
+            }
+
+    def log_summary(self):
+        summary = self.get_summary()
+        if summary:
+            logger.info("Operations summary: {}".format(summary))
+
+    def dump(self, name):
+        if "DIP_HOME" not in os.environ:
+            return None
+        location = get_cache_location(
+            self.METRICS_DIRECTORY, "{}-{}-{}.json".format(name, time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+        )
+        try:
+            create_dir(location)
+            with open(location, "w") as file_handle:
+                json.dump(self.to_dict(), file_handle)
+        except (IOError, OSError) as error:
+            logger.error('Error while writing metrics:{}'.format(error))
+            return None
+        logger.info("Metrics written to {}".format(location))
+        return location
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
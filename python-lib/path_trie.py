@@ -0,0 +1,195 @@
+class PathTrieNode():
+    __slots__ = ('name', 'parent', 'children', 'item_id', 'item_type', 'size', 'modified_at', 'confirmed_at', 'accessed_at')
+
+    def __init__(self, name=None, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.item_id = None
+        self.item_type = None
+        self.size = None
+        self.modified_at = None
+        self.confirmed_at = None
+        self.accessed_at = None
+
+    def get_entry(self):
+        return {
+            "item_id": self.item_id, "item_type": self.item_type, "size": self.size,
+            "modified_at": self.modified_at, "confirmed_at": self.confirmed_at, "accessed_at": self.accessed_at
+        }
+
+
+class PathTrie():
+    """
+    Box.com ids and types stored by path segments, with a reverse id -> node index.
+    Lookups and removals cost O(depth), and removing an item drops its whole subtree.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.root = PathTrieNode()
+        self.index = {}
+        self.size = 0
+
+    def split(self, path):
+        return [element for element in path.split('/') if len(element) > 0]
+
+    def find(self, path):
+        node = self.root
+        for segment in self.split(path):
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def get(self, path):
+        node = self.find(path)
+        if node is None or node.item_id is None:
+            return None, None
+        return node.item_id, node.item_type
+
+    def closest_ancestor(self, path, item_type=None):
+        # Deepest strict ancestor of path holding an id, as (path, node)
+        segments = self.split(path)
+        node = self.root
+        ancestor = None
+        depth = 0
+        for position, segment in enumerate(segments[:-1]):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.item_id is not None and (item_type is None or node.item_type == item_type):
+                ancestor = node
+                depth = position + 1
+        if ancestor is None:
+            return None, None
+        return '/'.join(segments[:depth]), ancestor
+
+    def set(self, path, item_id, item_type, size=None, modified_at=None, confirmed_at=None, accessed_at=None):
+        segments = self.split(path)
+        if len(segments) == 0:
+            return
+        previous = self.index.get(item_id)
+        if previous is not None and self.path_of(previous) != '/'.join(segments):
+            # The item was known at another path: it moved, so its old subtree is stale
+            self.remove_node(previous)
+        node = self.root
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                child = PathTrieNode(segment, node)
+                node.children[segment] = child
+            node = child
+        if node.item_id is not None and node.item_id != item_id:
+            # The path now denotes another item, so nothing cached below it can be trusted
+            for child in list(node.children.values()):
+                self.remove_node(child)
+            self.index.pop(node.item_id, None)
+            node.item_id = None
+            self.size = self.size - 1
+        if node.item_id is None:
+            self.size = self.size + 1
+        node.item_id = item_id
+        node.item_type = item_type
+        node.size = size
+        node.modified_at = modified_at
+        node.confirmed_at = confirmed_at
+        node.accessed_at = accessed_at or confirmed_at
+        self.index[item_id] = node
+
+    def path_of(self, node):
+        segments = []
+        while node is not None and node.parent is not None:
+            segments.append(node.name)
+            node = node.parent
+        return '/'.join(reversed(segments))
+
+    def path_of_id(self, item_id):
+        node = self.index.get(item_id)
+        if node is None:
+            return None
+        return self.path_of(node)
+
+    def remove_id(self, item_id):
+        node = self.index.get(item_id)
+        if node is None:
+            return 0
+        return self.remove_node(node)
+
+    def remove_path(self, path):
+        node = self.find(path)
+        if node is None or node is self.root:
+            return 0
+        return self.remove_node(node)
+
+    def remove_node(self, node):
+        removed = 0
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            stack.extend(current.children.values())
+            if current.item_id is not None:
+                if self.index.get(current.item_id) is current:
+                    del self.index[current.item_id]
+                self.size = self.size - 1
+                removed = removed + 1
+        parent = node.parent
+        if parent is not None:
+            parent.children.pop(node.name, None)
+        self.prune(parent)
+        return removed
+
+    def evict_path(self, path):
+        node = self.find(path)
+        if node is None or node is self.root:
+            return 0
+        return self.evict_node(node)
+
+    def evict_node(self, node):
+        # Forgets the node's own id, unlike remove_node what is cached below it is kept
+        if node.item_id is None:
+            return 0
+        if self.index.get(node.item_id) is node:
+            del self.index[node.item_id]
+        node.item_id = None
+        node.item_type = None
+        node.size = None
+        node.modified_at = None
+        node.confirmed_at = None
+        node.accessed_at = None
+        self.size = self.size - 1
+        self.prune(node)
+        return 1
+
+    def prune(self, node):
+        # Drops the intermediate nodes left without id nor children
+        while node is not None and node is not self.root and node.item_id is None and not node.children:
+            node.parent.children.pop(node.name, None)
+            node = node.parent
+
+    def items(self):
+        stack = [(self.root, '')]
+        while stack:
+            node, path = stack.pop()
+            if node.item_id is not None:
+                yield path, node
+            for name, child in node.children.items():
+                stack.append((child, name if path == '' else path + '/' + name))
+
+    def to_dict(self):
+        return dict((path, node.get_entry()) for path, node in self.items())
+
+    @staticmethod
+    def from_dict(paths):
+        trie = PathTrie()
+        for path, value in paths.items():
+            trie.set(
+                path, value["item_id"], value["item_type"],
+                value.get("size"), value.get("modified_at"), value.get("confirmed_at"), value.get("accessed_at")
+            )
+        return trie
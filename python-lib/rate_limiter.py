@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+
+from utils import get_cache_location, create_dir
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class RateLimiter():
+    """
+    Adaptive token bucket for all the requests made with one access token.
+    There is one instance per token in the process, shared by all its threads and providers,
+    and its state lives in a locked local file so that the processes of the host share it too.
+    The rate is halved when box.com throttles us, and grows back step by step once it stops.
+    """
+
+    STATE_SUFFIX = '.rate'
+    MIN_RATE = 1.0
+    MAX_RATE_FACTOR = 4
+    DECREASE_INTERVAL = 1.0
+    INCREASE_INTERVAL = 5.0
+    INCREASE_STEP = 1.0
+
+    limiters = {}
+    limiters_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key, rate):
+        with cls.limiters_lock:
+            limiter = cls.limiters.get(key)
+            if limiter is None:
+                limiter = RateLimiter(key, rate)
+                cls.limiters[key] = limiter
+            return limiter
+
+    def __init__(self, key, rate):
+        self.initial_rate = float(rate)
+        self.max_rate = self.initial_rate * self.MAX_RATE_FACTOR
+        self.burst = max(1.0, self.initial_rate)
+        self.lock = threading.Lock()
+        self.state = self.get_initial_state()
+        self.state_fd = None
+        if "DIP_HOME" in os.environ:
+            state_location = get_cache_location(key + self.STATE_SUFFIX)
+            try:
+                create_dir(state_location)
+                self.state_fd = os.open(state_location, os.O_RDWR | os.O_CREAT, 0o600)
+            except OSError as error:
+                logger.warning("Rate limiter state not shared across processes:{}".format(error))
+
+    def get_initial_state(self):
+        return {
+            "rate": self.initial_rate, "next_slot": 0.0,
+            "last_throttled": 0.0, "last_change": 0.0
+        }
+
+    def update(self, change):
+        """
+        Apply change to the shared state and return its result. The state is re-read from
+        the state file under an exclusive lock, so that concurrent processes see each other's changes
+        """
+        with self.lock:
+            if self.state_fd is None:
+                return change(self.state)
+            fcntl.flock(self.state_fd, fcntl.LOCK_EX)
+            try:
+                os.lseek(self.state_fd, 0, os.SEEK_SET)
+                content = os.read(self.state_fd, 4096)
+                try:
+                    self.state = json.loads(content.decode('utf-8'))
+                except ValueError:
+                    self.state = self.get_initial_state()
+                result = change(self.state)
+                os.lseek(self.state_fd, 0, os.SEEK_SET)
+                os.ftruncate(self.state_fd, 0)
+                os.write(self.state_fd, json.dumps(self.state).encode('utf-8'))
+                return result
+            finally:
+                fcntl.flock(self.state_fd, fcntl.LOCK_UN)
+
+    def acquire(self):
+        delay = self.update(self.reserve_slot)
+        if delay > 0:
+            time.sleep(delay)
+
+    def reserve_slot(self, state):
+        now = time.time()
+        rate = state["rate"]
+        if now - state["last_throttled"] >= self.INCREASE_INTERVAL and now - state["last_change"] >= self.INCREASE_INTERVAL:
+            if rate < self.max_rate:
+                rate = min(self.max_rate, rate + self.INCREASE_STEP)
+                state["rate"] = rate
+            state["last_change"] = now
+        # Generic cell rate algorithm: a request may run up to burst - 1 intervals ahead of its theoretical slot
+        theoretical_slot = max(state["next_slot"], now)
+        state["next_slot"] = theoretical_slot + 1.0 / rate
+        return theoretical_slot - (self.burst - 1) / rate - now
+
+    def on_throttled(self):
+        self.update(self.decrease_rate)
+
+    def decrease_rate(self, state):
+        now = time.time()
+        state["last_throttled"] = now
+        # Concurrent requests hitting the same throttling window only count once
+        if now - state["last_change"] >= self.DECREASE_INTERVAL:
+            state["rate"] = max(self.MIN_RATE, state["rate"] / 2)
+            state["last_change"] = now
+            logger.info("Throttled by box.com, request rate lowered to {:.1f}/s".format(state["rate"]))
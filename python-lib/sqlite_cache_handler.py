@@ -0,0 +1,238 @@
+import time
+import sqlite3
+import logging
+import threading
+from utils import get_cache_location, create_dir
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,  # avoid getting log from 3rd party module
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class SQLiteCacheHandler():
+    """
+    Path to box.com id cache stored in a SQLite database in WAL mode.
+    Reads and writes are done per key, so nothing is loaded at startup, and concurrent
+    processes sharing the same access token share and grow the same index.
+    Removing an item also removes the keys of its subtree.
+    Above max_entries, the least recently used keys are evicted.
+    """
+
+    DATABASE_SUFFIX = '.sqlite'
+    BUSY_TIMEOUT = 30
+    ENTRY_COLUMNS = ["item_id", "item_type", "size", "modified_at", "confirmed_at", "accessed_at"]
+    # Access times are only written back when older than this, to keep reads from writing
+    ACCESS_RESOLUTION = 60
+    EVICTION_TARGET = 0.9
+    EVICTION_CHECK_INTERVAL = 1000
+
+    def __init__(self, cache_file_name, max_entries=0):
+        self.max_entries = max_entries
+        self.added_since_check = 0
+        if cache_file_name is None:
+            self.cache_enabled = False
+        else:
+            self.cache_enabled = True
+        if self.cache_enabled:
+            self.cache_location = get_cache_location(cache_file_name + self.DATABASE_SUFFIX)
+            self.lock = threading.Lock()
+            self.connection = None
+            self.connect()
+
+    def connect(self):
+        create_dir(self.cache_location)
+        try:
+            self.connection = sqlite3.connect(self.cache_location, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS items (path TEXT PRIMARY KEY, item_id TEXT NOT NULL, item_type TEXT NOT NULL, "
+                    "size INTEGER, modified_at INTEGER, confirmed_at REAL, accessed_at REAL)"
+                )
+                columns = [row[1] for row in self.connection.execute("PRAGMA table_info(items)")]
+                for column, column_type in [
+                        ("size", "INTEGER"), ("modified_at", "INTEGER"), ("confirmed_at", "REAL"), ("accessed_at", "REAL")]:
+                    if column not in columns:
+                        self.connection.execute("ALTER TABLE items ADD COLUMN {} {}".format(column, column_type))
+                self.connection.execute("CREATE INDEX IF NOT EXISTS items_item_id ON items (item_id)")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS items_accessed_at ON items (accessed_at)")
+        except sqlite3.Error as error:
+            logger.error('Error while opening cache database, cache disabled:{}'.format(error))
+            self.cache_enabled = False
+
+    def execute(self, statement, parameters=(), many=False):
+        with self.lock:
+            try:
+                with self.connection:
+                    if many:
+                        return self.connection.executemany(statement, parameters)
+                    return self.connection.execute(statement, parameters)
+            except sqlite3.Error as error:
+                logger.error('Error while accessing cache database:{}'.format(error))
+                return None
+
+    def add(self, path, item_id, item_type, size=None, modified_at=None):
+        # Entries are added right after box.com returned them, so they are confirmed as of now
+        if not self.cache_enabled:
+            return
+        self.add_batch([(path, item_id, item_type, size, modified_at)])
+
+    def add_batch(self, entries):
+        if not self.cache_enabled:
+            return
+        confirmed_at = time.time()
+        rows = []
+        for entry in entries:
+            path, item_id, item_type = entry[:3]
+            size = entry[3] if len(entry) > 3 else None
+            modified_at = entry[4] if len(entry) > 4 else None
+            rows.append((path, item_id, item_type, size, modified_at, confirmed_at, confirmed_at))
+        self.execute(
+            "INSERT OR REPLACE INTO items (path, item_id, item_type, size, modified_at, confirmed_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows, many=True
+        )
+        if self.max_entries > 0:
+            # Counting is a full scan, it is only done every EVICTION_CHECK_INTERVAL additions
+            self.added_since_check = self.added_since_check + len(rows)
+            if self.added_since_check >= min(self.EVICTION_CHECK_INTERVAL, self.max_entries // 10 + 1):
+                self.added_since_check = 0
+                self.evict()
+
+    def evict(self):
+        with self.lock:
+            try:
+                count = self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            except sqlite3.Error as error:
+                logger.error('Error while reading cache database:{}'.format(error))
+                return
+        if count <= self.max_entries:
+            return
+        evicted = count - int(self.max_entries * self.EVICTION_TARGET)
+        self.execute(
+            "DELETE FROM items WHERE path IN (SELECT path FROM items ORDER BY accessed_at LIMIT ?)", (evicted,)
+        )
+        logger.info("{} least recently used cache entries evicted".format(evicted))
+
+    def count_entries(self):
+        if not self.cache_enabled:
+            return 0
+        with self.lock:
+            try:
+                return self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            except sqlite3.Error as error:
+                logger.error('Error while reading cache database:{}'.format(error))
+                return 0
+
+    def query(self, path, force_no_cache=False):
+        entry = self.query_entry(path, force_no_cache)
+        if entry is None:
+            return None, None
+        return entry["item_id"], entry["item_type"]
+
+    def query_entry(self, path, force_no_cache=False):
+        if not self.cache_enabled or force_no_cache:
+            return None
+        with self.lock:
+            try:
+                row = self.connection.execute(
+                    "SELECT {} FROM items WHERE path = ?".format(", ".join(self.ENTRY_COLUMNS)), (path,)
+                ).fetchone()
+            except sqlite3.Error as error:
+                logger.error('Error while reading cache database:{}'.format(error))
+                row = None
+        if row is None:
+            return None
+        entry = dict(zip(self.ENTRY_COLUMNS, row))
+        self.touch(path, entry["accessed_at"])
+        return entry
+
+    def touch(self, path, accessed_at):
+        now = time.time()
+        if accessed_at is None or now - accessed_at > self.ACCESS_RESOLUTION:
+            self.execute("UPDATE items SET accessed_at = ? WHERE path = ?", (now, path))
+
+    def query_ancestor(self, path, item_type, force_no_cache=False):
+        if not self.cache_enabled or force_no_cache:
+            return None, None
+        segments = [element for element in path.split('/') if len(element) > 0]
+        ancestors = ['/'.join(segments[:depth]) for depth in range(1, len(segments))]
+        if not ancestors:
+            return None, None
+        with self.lock:
+            try:
+                row = self.connection.execute(
+                    "SELECT path, item_id, accessed_at FROM items WHERE item_type = ? AND path IN ({}) "
+                    "ORDER BY length(path) DESC LIMIT 1".format(
+                        ", ".join(["?"] * len(ancestors))
+                    ),
+                    [item_type] + ancestors
+                ).fetchone()
+            except sqlite3.Error as error:
+                logger.error('Error while reading cache database:{}'.format(error))
+                row = None
+        if row is None:
+            return None, None
+        self.touch(row[0], row[2])
+        return row[0], row[1]
+
+    def query_path(self, item_id):
+        if not self.cache_enabled:
+            return None
+        with self.lock:
+            try:
+                row = self.connection.execute("SELECT path FROM items WHERE item_id = ? LIMIT 1", (item_id,)).fetchone()
+            except sqlite3.Error as error:
+                logger.error('Error while reading cache database:{}'.format(error))
+                row = None
+        return row[0] if row is not None else None
+
+    def remove(self, id):
+        # Removes the item and everything cached below it
+        if not self.cache_enabled:
+            return 0
+        with self.lock:
+            try:
+                with self.connection:
+                    rows = self.connection.execute("SELECT path FROM items WHERE item_id = ?", (id,)).fetchall()
+                    for row in rows:
+                        self.delete_subtree(row[0])
+            except sqlite3.Error as error:
+                logger.error('Error while accessing cache database:{}'.format(error))
+                return 0
+        return 1 if rows else 0
+
+    def remove_path(self, path):
+        if not self.cache_enabled:
+            return 0
+        with self.lock:
+            try:
+                with self.connection:
+                    return self.delete_subtree(path)
+            except sqlite3.Error as error:
+                logger.error('Error while accessing cache database:{}'.format(error))
+                return 0
+
+    def delete_subtree(self, path):
+        # Descendants of "a/b" are the keys in ["a/b/", "a/b0"), '0' being the character following '/'
+        cursor = self.connection.execute(
+            "DELETE FROM items WHERE path = ? OR (path >= ? AND path < ?)",
+            (path, path + '/', path + '0')
+        )
+        return 1 if cursor.rowcount > 0 else 0
+
+    def reset(self):
+        if not self.cache_enabled:
+            return
+        self.execute("DELETE FROM items")
+
+    def refresh(self):
+        # Always read from the database, other processes' changes are already visible
+        return
+
+    def flush(self):
+        # Every update is committed in its own transaction
+        return
+
+    def write_onto_disk(self):
+        return
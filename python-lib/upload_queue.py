@@ -0,0 +1,99 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format='box-com plugin %(levelname)s - %(message)s')
+
+
+class UploadQueue():
+    """
+    Write-behind uploads: contents are spooled to local temporary files by the writer, then uploaded
+    by a bounded pool of workers. Writers wait while 2 uploads per worker or max_bytes of spooled content
+    are pending, so that the spool stays capped, and a path still being uploaded is only queued again
+    once that upload is done. wait() returns once every upload is done, and close() then raises one
+    exception listing the uploads that failed.
+    """
+
+    DEFAULT_WORKERS = 8
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    MAX_REPORTED_ERRORS = 10
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_bytes=DEFAULT_MAX_BYTES):
+        workers = max(workers, 1)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_files = 2 * workers
+        self.max_bytes = max_bytes
+        self.condition = threading.Condition()
+        self.pending_paths = set()
+        self.pending_bytes = 0
+        self.uploaded = 0
+        self.errors = []
+
+    def wait_for_room(self, path):
+        with self.condition:
+            while path in self.pending_paths or len(self.pending_paths) >= self.max_files or (
+                    self.pending_paths and self.pending_bytes >= self.max_bytes):
+                self.condition.wait()
+
+    def submit(self, path, spool_file, size, upload):
+        # spool_file is closed, hence deleted, once upload() returned
+        with self.condition:
+            self.pending_paths.add(path)
+            self.pending_bytes = self.pending_bytes + size
+        try:
+            self.executor.submit(self.run, path, spool_file, size, upload)
+        except Exception:
+            self.done(path, spool_file, size)
+            raise
+
+    def run(self, path, spool_file, size, upload):
+        try:
+            upload()
+            with self.condition:
+                self.uploaded = self.uploaded + 1
+        except Exception as error:
+            logger.error("Upload of {} failed:{}".format(path, error))
+            with self.condition:
+                self.errors.append((path, error))
+        finally:
+            self.done(path, spool_file, size)
+
+    def done(self, path, spool_file, size):
+        spool_file.close()
+        with self.condition:
+            self.pending_paths.discard(path)
+            self.pending_bytes = self.pending_bytes - size
+            self.condition.notify_all()
+
+    def wait(self):
+        # Failed uploads are kept for close(), not reported to whichever operation waited first
+        with self.condition:
+            while self.pending_paths:
+                self.condition.wait()
+
+    def raise_errors(self):
+        with self.condition:
+            errors = self.errors
+            self.errors = []
+        if errors:
+            raise Exception("{} uploads failed: {}{}".format(
+                len(errors),
+                "; ".join(["{}: {}".format(path, error) for path, error in errors[:self.MAX_REPORTED_ERRORS]]),
+                "; ..." if len(errors) > self.MAX_REPORTED_ERRORS else ""
+            ))
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown(wait=True)
+            with self.condition:
+                uploaded = self.uploaded
+                self.uploaded = 0
+            if uploaded > 0:
+                logger.info("{} files uploaded in the background".format(uploaded))
+        self.raise_errors()
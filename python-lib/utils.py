@@ -1,3 +1,10 @@
+import os
+import errno
+import hashlib
+
+from datetime import datetime
+
+
 def get_rel_path(path):
     if len(path) > 0 and path[0] == '/':
         path = path[1:]
@@ -20,9 +27,49 @@ def get_full_path(root, path):
         return get_normalized_path(root) + normalized_path
 
 
+def get_cache_file_name(token_hash, root=None):
+    # One cache for the whole account, or one per provider root when root is given
+    if root is None:
+        return token_hash
+    # "/a/b/", "a//b" and "a/b" name the same root, and so the same cache
+    root = get_rel_path(get_normalized_path(root))
+    return "{}-{}".format(token_hash, hashlib.sha1(root.encode('utf-8')).hexdigest()[:16])
+
+
+def get_cache_location(*names):
+    # Caches, locks and state files of the plugin, shared by the processes of the host
+    return os.path.join(os.environ["DIP_HOME"], 'caches', 'plugins', 'box-com', *names)
+
+
+def create_dir(filename):
+    if not os.path.exists(os.path.dirname(filename)):
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError as error:  # Guard against race condition
+            if error.errno != errno.EEXIST:
+                raise
+
+
 def get_item_size(item):
     # Some file types (links) don't have a size parameter.
     if "size" in dir(item):
         return item.size
     else:
         return 0
+
+
+def format_date(date):
+    if date is not None:
+        utc_time = datetime.strptime(date, "%Y-%m-%dT%H:%M:%S-%f:00")
+        epoch_time = (utc_time - datetime(1970, 1, 1)).total_seconds()
+        return int(epoch_time) * 1000
+    else:
+        return None
+
+
+def get_item_last_modified(item):
+    # The root folder has no modification date.
+    if "modified_at" in dir(item):
+        return format_date(item.modified_at)
+    else:
+        return None
@@ -2,23 +2,109 @@ from dataiku.runnables import Runnable
 import os
 import hashlib
 
+from cache_handler import CacheHandler
+from sqlite_cache_handler import SQLiteCacheHandler
+from utils import get_cache_file_name, get_cache_location, get_rel_path, get_normalized_path
+
 
 class CleanCache(Runnable):
 
+    SCOPE_ALL = "all"
+    SCOPE_ROOT = "root"
+    SCOPE_LEAST_RECENTLY_USED = "lru"
+
     def __init__(self, project_key, config, plugin_config):
         self.project_key = project_key
         self.config = config
         self.plugin_config = plugin_config
         self.connection = self.plugin_config.get("box_com_connection")
         self.access_token = self.connection['access_token']
-        self.cache_location = os.environ["DIP_HOME"] + '/caches/plugins/box-com/' + hashlib.sha1(self.access_token.encode('utf-8')).hexdigest()
+        self.token_hash = hashlib.sha1(self.access_token.encode('utf-8')).hexdigest()
+        self.cache_location = get_cache_location(self.token_hash)
 
     def get_progress_target(self):
         return None
 
+    def get_cache_locations(self):
+        # The account wide cache and the per root ones, named <token hash>-<root hash>, with their journal or database files
+        cache_directory, cache_name = os.path.split(self.cache_location)
+        locations = []
+        if not os.path.isdir(cache_directory):
+            return locations
+        for file_name in os.listdir(cache_directory):
+            base_name = file_name.split('.')[0]
+            if base_name != cache_name and not base_name.startswith(cache_name + '-'):
+                continue
+            if file_name.endswith('.rate'):
+                # Rate limiter state, not a cache
+                continue
+            location = os.path.join(cache_directory, file_name)
+            if os.path.isfile(location):
+                locations.append(location)
+        return locations
+
+    def get_caches(self):
+        # One handler per cache file name and backend found on disk
+        caches = {}
+        for location in self.get_cache_locations():
+            file_name = os.path.basename(location)
+            cache_file_name = file_name.split('.')[0]
+            if SQLiteCacheHandler.DATABASE_SUFFIX in file_name:
+                key = (cache_file_name, True)
+            elif file_name == cache_file_name or file_name.endswith(CacheHandler.JOURNAL_SUFFIX):
+                key = (cache_file_name, False)
+            else:
+                continue
+            if key not in caches:
+                caches[key] = SQLiteCacheHandler(cache_file_name) if key[1] else CacheHandler(cache_file_name)
+        return list(caches.values())
+
     def run(self, progress_callback):
-        if os.path.isfile(self.cache_location):
-            os.remove(self.cache_location)
+        scope = self.config.get("scope", self.SCOPE_ALL)
+        root = get_rel_path(self.config.get("root") or "")
+        if scope == self.SCOPE_ROOT and get_rel_path(get_normalized_path(root)) != '':
+            return self.clean_root(root)
+        if scope == self.SCOPE_LEAST_RECENTLY_USED:
+            return self.evict_least_recently_used(int(self.config.get("max_entries", 0)))
+        locations = self.get_cache_locations()
+        if locations:
+            for location in locations:
+                os.remove(location)
             return "Done!"
         else:
             return "Error: no cache found"
+
+    def clean_root(self, root):
+        # The cache dedicated to this root is deleted, the ids below it are removed from the others
+        root_cache_name = get_cache_file_name(self.token_hash, root)
+        deleted = 0
+        for location in self.get_cache_locations():
+            if os.path.basename(location).split('.')[0] == root_cache_name:
+                os.remove(location)
+                deleted = deleted + 1
+        rel_path = get_rel_path(get_normalized_path(root))
+        cleaned = 0
+        for cache in self.get_caches():
+            cleaned = cleaned + cache.remove_path(rel_path)
+            cache.flush()
+        if deleted == 0 and cleaned == 0:
+            return "Error: no cached id below {}".format(get_normalized_path(root))
+        return "Done! {} cache files deleted, ids below {} removed from {} caches".format(
+            deleted, get_normalized_path(root), cleaned
+        )
+
+    def evict_least_recently_used(self, max_entries):
+        caches = self.get_caches()
+        if not caches:
+            return "Error: no cache found"
+        before = 0
+        after = 0
+        for cache in caches:
+            count = cache.count_entries()
+            before = before + count
+            if count > max_entries:
+                cache.max_entries = max_entries
+                cache.evict()
+                cache.flush()
+            after = after + cache.count_entries()
+        return "Done! {} cached ids evicted, {} left".format(before - after, after)
@@ -0,0 +1,93 @@
+from dataiku.runnables import Runnable
+import os
+import time
+import hashlib
+
+from box_item import BoxItem
+from box_crawler import BoxCrawler
+from box_network import LessVerboseLoggingNetwork
+from client_registry import ClientRegistry
+from operation_metrics import OperationMetrics
+from utils import get_cache_file_name, get_cache_location, get_rel_path, get_normalized_path
+
+
+class WarmUpCache(Runnable):
+
+    OPERATION = "warm_up"
+
+    def __init__(self, project_key, config, plugin_config):
+        self.project_key = project_key
+        self.config = config
+        self.plugin_config = plugin_config
+        self.connection = self.plugin_config.get("box_com_connection")
+        self.access_token = self.connection['access_token']
+        self.token_hash = hashlib.sha1(self.access_token.encode('utf-8')).hexdigest()
+        # Same root and cache file as the provider's
+        self.root = get_rel_path(self.config.get("root") or "")
+        self.cache_backend = self.config.get("cache_backend")
+        if self.config.get("cache_partition_by_root", False):
+            self.cache_file_name = get_cache_file_name(self.token_hash, self.root)
+        else:
+            self.cache_file_name = get_cache_file_name(self.token_hash)
+        self.listing_threads = max(int(self.config.get("listing_threads", BoxCrawler.DEFAULT_THREADS)), 1)
+        self.max_entries = int(self.config.get("cache_max_entries", BoxItem.DEFAULT_CACHE_MAX_ENTRIES))
+
+    def get_progress_target(self):
+        return None
+
+    def get_cache_size(self):
+        cache_directory = get_cache_location()
+        size = 0
+        for file_name in os.listdir(cache_directory):
+            if file_name != self.cache_file_name and not file_name.startswith(self.cache_file_name + '.'):
+                continue
+            try:
+                size = size + os.path.getsize(os.path.join(cache_directory, file_name))
+            except OSError:
+                continue
+        return size
+
+    def run(self, progress_callback):
+        start_time = time.time()
+        client, _ = ClientRegistry.get_client(
+            self.access_token, self.token_hash,
+            pool_size=max(2 * self.listing_threads + 2, LessVerboseLoggingNetwork.DEFAULT_POOL_SIZE),
+            max_retries=LessVerboseLoggingNetwork.DEFAULT_MAX_RETRIES,
+            rate_limit=0
+        )
+        metrics = OperationMetrics()
+        client = ClientRegistry.with_metrics(client, metrics)
+        cache = ClientRegistry.get_cache(self.cache_file_name, self.cache_backend, max_entries=self.max_entries)
+        # Listings are read once, there is no point keeping them
+        box_item = BoxItem(
+            self.cache_file_name, self.root, client, cache=cache, cache_backend=self.cache_backend,
+            listing_cache_ttl=0, metrics=metrics
+        )
+        crawler = BoxCrawler(box_item.listings, threads=self.listing_threads)
+        full_path = get_normalized_path(self.root)
+        entries = []
+        files = 0
+        metrics.start_operation(self.OPERATION)
+        try:
+            folder = box_item.get_by_path(full_path, force_no_cache=True)
+            if folder.not_exists():
+                return "Error: {} not found".format(full_path)
+            if not folder.is_folder():
+                return "Error: {} is not a folder".format(full_path)
+            for folder_files, cache_entries in crawler.iter_folders(full_path, get_rel_path(full_path), folder.get_id()):
+                entries.extend(cache_entries)
+                files = files + len(folder_files)
+            cache.add_batch(entries)
+            cache.flush()
+        finally:
+            metrics.end_operation(time.time() - start_time)
+        rows = [
+            ("Root", full_path),
+            ("Entries added", "{} ({} files, {} folders)".format(len(entries), files, len(entries) - files)),
+            ("API calls", metrics.get_api_calls(self.OPERATION)),
+            ("Elapsed time", "{:.1f}s".format(time.time() - start_time)),
+            ("Cache size", "{} entries, {} bytes".format(cache.count_entries(), self.get_cache_size()))
+        ]
+        return "<table>{}</table>".format("".join(
+            ["<tr><th>{}</th><td>{}</td></tr>".format(label, value) for label, value in rows]
+        ))
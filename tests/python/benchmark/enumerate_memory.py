@@ -0,0 +1,70 @@
+"""
+Peak memory of the enumeration pipeline on a synthetic tree, without network.
+
+Folders are listed from an in-process generator, so only the crawler and what it keeps are measured:
+streaming the entries, then materializing the dicts handed to DSS.
+
+    python tests/python/benchmark/enumerate_memory.py --entries 1000000 --files-per-folder 1000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.abspath(os.path.join(BENCHMARK_DIR, "..", "..", ".."))
+sys.path.insert(0, os.path.join(PLUGIN_DIR, "python-lib"))
+
+from box_crawler import BoxCrawler  # noqa: E402
+from listing_cache import ListingEntry  # noqa: E402
+
+
+class SyntheticListings():
+    """
+    Folder tree of `entries` files, `files_per_folder` files and `fanout` sub folders per folder.
+    Folder ids are their breadth-first index, so that the tree needs no storage.
+    """
+
+    def __init__(self, entries, files_per_folder, fanout):
+        self.files_per_folder = files_per_folder
+        self.fanout = fanout
+        self.folders = (entries + files_per_folder - 1) // files_per_folder
+
+    def get_items(self, folder_id):
+        index = int(folder_id)
+        items = []
+        for child in range(index * self.fanout + 1, min(index * self.fanout + self.fanout + 1, self.folders)):
+            items.append(ListingEntry("folder_{}".format(child), str(child), "folder", 0, 1600000000000))
+        for position in range(self.files_per_folder):
+            file_id = "{}_{}".format(index, position)
+            items.append(ListingEntry("file_{}.csv".format(file_id), file_id, "file", 1024 + position, 1600000000000))
+        return items
+
+
+def measure(label, function):
+    tracemalloc.start()
+    start = time.time()
+    result = function()
+    duration = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<12} {:>10} entries {:>8.1f} s {:>10.1f} MB peak".format(label, result, duration, peak / 1024.0 / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the box.com enumeration on a synthetic tree")
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--files-per-folder", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=BoxCrawler.DEFAULT_THREADS)
+    arguments = parser.parse_args()
+
+    listings = SyntheticListings(arguments.entries, arguments.files_per_folder, arguments.fanout)
+    crawler = BoxCrawler(listings, threads=arguments.threads)
+    measure("streamed", lambda: sum(1 for _ in crawler.iter_files("/", "", "0")))
+    measure("materialized", lambda: len(crawler.crawl("/", "", "0")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+"""
+Local stand-in for the box.com API endpoints used by the plugin, to benchmark it without a box.com account.
+
+Serves folders and their paginated items, file details and content (with byte ranges), folder creation,
+single shot and chunked uploads (with new versions and 409 name conflicts), moves, renames and deletions,
+and the events stream of these changes.
+Every request can be delayed, and one request out of throttle_every answered with a 429.
+Call counts per endpoint and transferred bytes are served on GET /_stats, and reset by POST /_reset.
+
+Run standalone with: python mock_box_server.py --port 8765 --depth 2 --fanout 4 --files 10
+"""
+import re
+import json
+import time
+import uuid
+import email
+import hashlib
+import argparse
+import threading
+
+from email.policy import HTTP
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+PATTERN_SIZE = 64 * 1024
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+ROOT_ID = "0"
+
+
+class MockBox():
+    """
+    In-memory box.com tree. Generated files have no stored content, it is derived from their id on the fly.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+        self.children = {}
+        self.upload_sessions = {}
+        self.events = []
+        self.next_id = 1
+        self.add_item(ROOT_ID, "folder", "All Files", None)
+
+    def new_id(self):
+        self.next_id = self.next_id + 1
+        return str(self.next_id)
+
+    def add_item(self, item_id, item_type, name, parent_id, size=0, content=None):
+        item = {
+            "id": item_id, "type": item_type, "name": name, "parent": parent_id,
+            "size": size, "content": content, "sha1": None, "modified_at": self.now()
+        }
+        self.items[item_id] = item
+        if item_type == "folder":
+            self.children[item_id] = []
+        if parent_id is not None:
+            self.children[parent_id].append(item_id)
+        return item
+
+    def now(self):
+        return time.strftime("%Y-%m-%dT%H:%M:%S-00:00", time.gmtime())
+
+    def generate_tree(self, parent_id, name, depth, fanout, files, file_size):
+        folder = self.add_item(self.new_id(), "folder", name, parent_id)
+        for index in range(files):
+            self.add_item(self.new_id(), "file", "file_{}.csv".format(index), folder["id"], size=file_size)
+        if depth > 0:
+            for index in range(fanout):
+                self.generate_tree(folder["id"], "folder_{}".format(index), depth - 1, fanout, files, file_size)
+        return folder
+
+    def get_pattern(self, item):
+        seed = hashlib.sha1(item["id"].encode('utf-8')).digest()
+        return (seed * (PATTERN_SIZE // len(seed) + 1))[:PATTERN_SIZE]
+
+    def read(self, item, start, end):
+        if item["content"] is not None:
+            return item["content"][start:end + 1]
+        pattern = self.get_pattern(item)
+        chunks = []
+        offset = start
+        while offset <= end:
+            pattern_offset = offset % PATTERN_SIZE
+            length = min(PATTERN_SIZE - pattern_offset, end - offset + 1)
+            chunks.append(pattern[pattern_offset:pattern_offset + length])
+            offset = offset + length
+        return b"".join(chunks)
+
+    def get_sha1(self, item):
+        # Computed on demand, generated files may be large
+        if item["sha1"] is None:
+            content_sha1 = hashlib.sha1()
+            offset = 0
+            while offset < item["size"]:
+                end = min(offset + PATTERN_SIZE * 16, item["size"]) - 1
+                content_sha1.update(self.read(item, offset, end))
+                offset = end + 1
+            item["sha1"] = content_sha1.hexdigest()
+        return item["sha1"]
+
+    def to_json(self, item, fields=None):
+        ret = {"type": item["type"], "id": item["id"], "etag": "0"}
+        all_fields = {
+            "name": lambda: item["name"],
+            "size": lambda: item["size"] if item["type"] == "file" else self.get_folder_size(item["id"]),
+            "modified_at": lambda: item["modified_at"],
+            "sha1": lambda: self.get_sha1(item) if item["type"] == "file" else None,
+            "parent": lambda: {"type": "folder", "id": item["parent"]} if item["parent"] is not None else None,
+            "path_collection": lambda: self.get_path_collection(item)
+        }
+        for field in (fields or all_fields.keys()):
+            if field in all_fields:
+                value = all_fields[field]()
+                if value is not None:
+                    ret[field] = value
+        return ret
+
+    def get_path_collection(self, item):
+        entries = []
+        parent_id = item["parent"]
+        while parent_id is not None:
+            parent = self.items[parent_id]
+            entries.insert(0, {"type": "folder", "id": parent["id"], "name": parent["name"]})
+            parent_id = parent["parent"]
+        return {"total_count": len(entries), "entries": entries}
+
+    def get_folder_size(self, folder_id):
+        size = 0
+        for child_id in self.children[folder_id]:
+            child = self.items[child_id]
+            size = size + (child["size"] if child["type"] == "file" else self.get_folder_size(child_id))
+        return size
+
+    def find_child(self, folder_id, name):
+        for child_id in self.children.get(folder_id, []):
+            if self.items[child_id]["name"] == name:
+                return self.items[child_id]
+        return None
+
+    def remove(self, item_id):
+        item = self.items.pop(item_id)
+        if item["parent"] is not None and item["parent"] in self.children:
+            self.children[item["parent"]].remove(item_id)
+        for child_id in list(self.children.pop(item_id, [])):
+            self.items[child_id]["parent"] = None
+            self.remove(child_id)
+
+    def record_event(self, event_type, item):
+        # The stream position is the number of events recorded so far
+        self.events.append({
+            "type": "event", "event_id": uuid.uuid4().hex, "event_type": event_type, "created_at": self.now(),
+            "source": self.to_json(item, ["name", "size", "modified_at", "parent"])
+        })
+
+    def set_content(self, item, content):
+        item["content"] = content
+        item["size"] = len(content)
+        item["sha1"] = hashlib.sha1(content).hexdigest()
+        item["modified_at"] = self.now()
+
+
+class BoxError(Exception):
+    def __init__(self, status, code, context_info=None):
+        super(BoxError, self).__init__(code)
+        self.status = status
+        self.code = code
+        self.context_info = context_info
+
+
+class MockBoxServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, box, latency=0.0, throttle_every=0):
+        HTTPServer.__init__(self, address, MockBoxRequestHandler)
+        self.box = box
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.requests = 0
+            self.calls = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.throttled = 0
+
+    def count(self, endpoint, bytes_in):
+        # Returns True when the request must be throttled
+        with self.stats_lock:
+            self.requests = self.requests + 1
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.bytes_in = self.bytes_in + bytes_in
+            if self.throttle_every > 0 and self.requests % self.throttle_every == 0:
+                self.throttled = self.throttled + 1
+                return True
+        return False
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {
+                "calls": dict(self.calls), "total_calls": sum(self.calls.values()),
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out, "throttled": self.throttled
+            }
+
+
+class MockBoxRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        path = re.sub(r"^/(api/)?2\.0", "", url.path)
+        query = dict([(key, values[0]) for key, values in parse_qs(url.query).items()])
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if path.startswith("/_"):
+            return self.handle_control(method, path)
+        endpoint = "{} {}".format(method, re.sub(r"/[0-9a-f-]+(?=/|$)", "/{id}", path))
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        if self.server.count(endpoint, len(body)):
+            return self.send_json(429, {"type": "error", "status": 429, "code": "rate_limit_exceeded"}, {"Retry-After": "0"})
+        try:
+            with self.server.box.lock:
+                response = self.route(method, path, query, body)
+        except BoxError as error:
+            content = {"type": "error", "status": error.status, "code": error.code, "message": error.code}
+            if error.context_info is not None:
+                content["context_info"] = error.context_info
+            return self.send_json(error.status, content)
+        status, content = response[0], response[1]
+        if isinstance(content, bytes):
+            return self.send_bytes(status, content, response[2] if len(response) > 2 else {})
+        return self.send_json(status, content)
+
+    def handle_control(self, method, path):
+        if path == "/_stats":
+            return self.send_json(200, self.server.get_stats())
+        if path == "/_reset" and method == "POST":
+            self.server.reset_stats()
+            return self.send_json(204, None)
+        return self.send_json(404, {"type": "error", "status": 404, "code": "not_found"})
+
+    def route(self, method, path, query, body):
+        box = self.server.box
+        fields = query["fields"].split(",") if "fields" in query else None
+        match = re.match(r"^/(folders|files)/([^/]+)(/.*)?$", path)
+        if path == "/events" and method == "GET":
+            return self.list_events(query)
+        if path == "/users/me":
+            return 200, {"type": "user", "id": "1", "name": "Benchmark", "login": "benchmark@example.com"}
+        if path == "/folders" and method == "POST":
+            return self.create_folder(json.loads(body.decode("utf-8")))
+        if path == "/files/content" and method == "POST":
+            return self.upload(body)
+        if path == "/files/upload_sessions" and method == "POST":
+            return self.create_upload_session(json.loads(body.decode("utf-8")))
+        session_match = re.match(r"^/files/upload_sessions/([^/]+)(/commit)?$", path)
+        if session_match:
+            return self.handle_upload_session(method, session_match.group(1), session_match.group(2), body)
+        if match is None:
+            raise BoxError(404, "not_found")
+        item_type = match.group(1)[:-1]
+        item = box.items.get(match.group(2))
+        if item is None or item["type"] != item_type:
+            raise BoxError(404, "not_found")
+        action = match.group(3)
+        if action is None:
+            if method == "GET":
+                return 200, box.to_json(item, fields)
+            if method == "PUT":
+                return self.update_item(item, json.loads(body.decode("utf-8")), fields)
+            if method == "DELETE":
+                if item_type == "folder" and box.children[item["id"]] and query.get("recursive", "").lower() != "true":
+                    raise BoxError(400, "folder_not_empty")
+                box.record_event("ITEM_TRASH", item)
+                box.remove(item["id"])
+                return 204, None
+        if action == "/items" and method == "GET":
+            return self.list_items(item, query, fields)
+        if action == "/content" and method == "GET":
+            return self.get_content(item)
+        if action == "/content" and method == "POST":
+            return self.upload(body, item)
+        if action == "/upload_sessions" and method == "POST":
+            return self.create_upload_session(json.loads(body.decode("utf-8")), item)
+        raise BoxError(405, "method_not_allowed")
+
+    def list_items(self, folder, query, fields):
+        box = self.server.box
+        limit = min(int(query.get("limit", 100)), 1000)
+        start = int(query.get("marker") or query.get("offset") or 0)
+        child_ids = box.children[folder["id"]]
+        entries = [box.to_json(box.items[child_id], fields) for child_id in child_ids[start:start + limit]]
+        ret = {"entries": entries, "limit": limit}
+        if "usemarker" in query:
+            ret["next_marker"] = str(start + limit) if start + limit < len(child_ids) else None
+        else:
+            ret["offset"] = start
+            ret["total_count"] = len(child_ids)
+        return 200, ret
+
+    def list_events(self, query):
+        events = self.server.box.events
+        if query.get("stream_position", "0") == "now":
+            return 200, {"chunk_size": 0, "next_stream_position": len(events), "entries": []}
+        start = int(query.get("stream_position", 0))
+        if start > len(events):
+            raise BoxError(400, "invalid_stream_position")
+        entries = events[start:start + int(query.get("limit", 100))]
+        return 200, {"chunk_size": len(entries), "next_stream_position": start + len(entries), "entries": entries}
+
+    def get_content(self, item):
+        size = item["size"]
+        range_header = self.headers.get("Range")
+        if range_header:
+            start, end = re.match(r"bytes=(\d+)-(\d*)", range_header).groups()
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+            headers = {"Content-Range": "bytes {}-{}/{}".format(start, end, size)}
+            return 206, self.server.box.read(item, start, end), headers
+        return 200, self.server.box.read(item, 0, size - 1)
+
+    def check_name(self, parent_id, name, context_as_list):
+        conflict = self.server.box.find_child(parent_id, name)
+        if conflict is not None:
+            conflict_json = self.server.box.to_json(conflict, ["name"])
+            raise BoxError(409, "item_name_in_use", {"conflicts": [conflict_json] if context_as_list else conflict_json})
+
+    def create_folder(self, attributes):
+        box = self.server.box
+        parent_id = attributes["parent"]["id"]
+        if parent_id not in box.children:
+            raise BoxError(404, "not_found")
+        self.check_name(parent_id, attributes["name"], True)
+        folder = box.add_item(box.new_id(), "folder", attributes["name"], parent_id)
+        box.record_event("ITEM_CREATE", folder)
+        return 201, box.to_json(folder)
+
+    def update_item(self, item, attributes, fields):
+        box = self.server.box
+        parent_id = attributes.get("parent", {}).get("id", item["parent"])
+        name = attributes.get("name", item["name"])
+        if parent_id not in box.children:
+            raise BoxError(404, "not_found")
+        if parent_id != item["parent"] or name != item["name"]:
+            self.check_name(parent_id, name, True)
+            event_type = "ITEM_RENAME" if name != item["name"] else "ITEM_MOVE"
+            box.children[item["parent"]].remove(item["id"])
+            box.children[parent_id].append(item["id"])
+            item["parent"] = parent_id
+            item["name"] = name
+            box.record_event(event_type, item)
+        return 200, box.to_json(item, fields)
+
+    def upload(self, body, item=None):
+        box = self.server.box
+        message = email.message_from_bytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode("utf-8") + b"\r\n\r\n" + body, policy=HTTP
+        )
+        attributes, content = {}, b""
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "attributes":
+                attributes = json.loads(part.get_payload(decode=True).decode("utf-8"))
+            else:
+                content = part.get_payload(decode=True)
+        if item is None:
+            parent_id = attributes["parent"]["id"]
+            if parent_id not in box.children:
+                raise BoxError(404, "not_found")
+            self.check_name(parent_id, attributes["name"], False)
+            item = box.add_item(box.new_id(), "file", attributes["name"], parent_id)
+        box.set_content(item, content)
+        box.record_event("ITEM_UPLOAD", item)
+        return 201, {"total_count": 1, "entries": [box.to_json(item)]}
+
+    def create_upload_session(self, attributes, item=None):
+        box = self.server.box
+        if item is None:
+            if attributes["folder_id"] not in box.children:
+                raise BoxError(404, "not_found")
+            self.check_name(attributes["folder_id"], attributes["file_name"], False)
+        session_id = uuid.uuid4().hex
+        total_size = attributes["file_size"]
+        box.upload_sessions[session_id] = {"attributes": attributes, "item": item, "parts": {}}
+        return 201, {
+            "type": "upload_session", "id": session_id, "part_size": UPLOAD_PART_SIZE,
+            "total_parts": (total_size + UPLOAD_PART_SIZE - 1) // UPLOAD_PART_SIZE, "num_parts_processed": 0
+        }
+
+    def handle_upload_session(self, method, session_id, commit, body):
+        box = self.server.box
+        upload_session = box.upload_sessions.get(session_id)
+        if upload_session is None:
+            raise BoxError(404, "not_found")
+        if method == "DELETE":
+            del box.upload_sessions[session_id]
+            return 204, None
+        if method == "PUT":
+            offset = int(re.match(r"bytes (\d+)-", self.headers["Content-Range"]).group(1))
+            upload_session["parts"][offset] = body
+            part_id = hashlib.sha1(body).hexdigest()[:8]
+            return 200, {"part": {"part_id": part_id, "offset": offset, "size": len(body), "sha1": part_id}}
+        if method == "POST" and commit:
+            content = b"".join([upload_session["parts"][offset] for offset in sorted(upload_session["parts"])])
+            attributes = upload_session["attributes"]
+            item = upload_session["item"]
+            if item is None:
+                self.check_name(attributes["folder_id"], attributes["file_name"], False)
+                item = box.add_item(box.new_id(), "file", attributes["file_name"], attributes["folder_id"])
+            box.set_content(item, content)
+            box.record_event("ITEM_UPLOAD", item)
+            del box.upload_sessions[session_id]
+            return 201, {"total_count": 1, "entries": [box.to_json(item)]}
+        raise BoxError(405, "method_not_allowed")
+
+    def send_json(self, status, content, headers=None):
+        data = b"" if content is None else json.dumps(content).encode("utf-8")
+        all_headers = {"Content-Type": "application/json"}
+        all_headers.update(headers or {})
+        self.send_bytes(status, data, all_headers)
+
+    def send_bytes(self, status, data, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        with self.server.stats_lock:
+            self.server.bytes_out = self.server.bytes_out + len(data)
+
+
+def serve(port, depth, fanout, files, file_size, latency=0.0, throttle_every=0, ready=None):
+    box = MockBox()
+    box.generate_tree(ROOT_ID, "benchmark", depth, fanout, files, file_size)
+    server = MockBoxServer(("127.0.0.1", port), box, latency=latency, throttle_every=throttle_every)
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the box.com API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--depth", type=int, default=2, help="Levels of sub folders below /benchmark")
+    parser.add_argument("--fanout", type=int, default=4, help="Sub folders per folder")
+    parser.add_argument("--files", type=int, default=10, help="Files per folder")
+    parser.add_argument("--file-size", type=int, default=1024 * 1024, help="Size of the generated files, in bytes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to each request, in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer one request out of N with a 429")
+    args = parser.parse_args()
+    serve(args.port, args.depth, args.fanout, args.files, args.file_size, args.latency, args.throttle_every)
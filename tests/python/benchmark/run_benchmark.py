@@ -0,0 +1,203 @@
+"""
+Benchmark of BoxComFSProvider against the local mock box.com server.
+
+Runs stat, browse, enumerate, read, write, move and delete_recursive on a generated tree, and reports
+for each operation its wall time, the API calls it made and the peak memory it allocated.
+
+    python tests/python/benchmark/run_benchmark.py --depth 3 --fanout 4 --files 20 --latency 0.05
+    python tests/python/benchmark/run_benchmark.py --config listing_threads=16 --config cache_backend=sqlite
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import importlib.util
+import multiprocessing
+import tracemalloc
+
+from urllib.request import urlopen, Request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.abspath(os.path.join(BENCHMARK_DIR, "..", "..", ".."))
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(PLUGIN_DIR, "python-lib"))
+
+import mock_box_server  # noqa: E402
+
+
+class GeneratedStream():
+    def __init__(self, size):
+        self.remaining = size
+        self.pattern = os.urandom(64 * 1024)
+
+    def read(self, size=-1):
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        self.remaining = self.remaining - size
+        return (self.pattern * (size // len(self.pattern) + 1))[:size]
+
+
+class CountingStream():
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size = self.size + len(data)
+
+
+def load_provider_class():
+    try:
+        import dataiku.fsprovider  # noqa: F401
+    except ImportError:
+        # Outside of DSS, FSProvider is only an empty base class
+        import types
+        dataiku = types.ModuleType("dataiku")
+        fsprovider = types.ModuleType("dataiku.fsprovider")
+        fsprovider.FSProvider = type("FSProvider", (object,), {})
+        dataiku.fsprovider = fsprovider
+        sys.modules["dataiku"] = dataiku
+        sys.modules["dataiku.fsprovider"] = fsprovider
+    provider_file = os.path.join(PLUGIN_DIR, "python-fs-providers", "box-com_box-com", "fs-provider.py")
+    spec = importlib.util.spec_from_file_location("box_fs_provider", provider_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.BoxComFSProvider
+
+
+def point_sdk_to(base_url):
+    from boxsdk.config import API
+    API.BASE_API_URL = base_url + "/2.0"
+    API.UPLOAD_URL = base_url + "/api/2.0"
+
+
+def call_server(base_url, path, method="GET"):
+    request = Request(base_url + path, method=method, data=b"" if method == "POST" else None)
+    content = urlopen(request).read()
+    return json.loads(content.decode("utf-8")) if content else None
+
+
+def measure(base_url, name, operation):
+    call_server(base_url, "/_reset", "POST")
+    tracemalloc.start()
+    start_time = time.time()
+    try:
+        result = operation()
+        error = None
+    except Exception as exception:
+        result = None
+        error = str(exception)
+    wall_time = time.time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = call_server(base_url, "/_stats")
+    return {
+        "operation": name, "wall_time": wall_time, "api_calls": stats["total_calls"], "calls": stats["calls"],
+        "throttled": stats["throttled"], "bytes_in": stats["bytes_in"], "bytes_out": stats["bytes_out"],
+        "peak_memory": peak_memory, "result": result, "error": error
+    }
+
+
+def parse_config_value(value):
+    # Settings come as they would from the preset form: booleans and numbers, not strings
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def get_deepest_file(depth):
+    return "/" + "/".join(["folder_0"] * depth + ["file_0.csv"])
+
+
+def run(args):
+    base_url = "http://127.0.0.1:{}".format(args.port)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=mock_box_server.serve,
+        args=(args.port, args.depth, args.fanout, args.files, args.file_size, args.latency, args.throttle_every, ready)
+    )
+    server.daemon = True
+    server.start()
+    ready.wait(30)
+    dip_home = tempfile.mkdtemp()
+    os.environ["DIP_HOME"] = dip_home
+    point_sdk_to(base_url)
+    try:
+        provider_class = load_provider_class()
+        config = {"cache_enabled": True}
+        for option in args.config:
+            key, value = option.split("=", 1)
+            config[key] = parse_config_value(value)
+        plugin_config = {"box_com_connection": {"access_token": "benchmark"}}
+        provider = provider_class("/benchmark", config, plugin_config)
+
+        deepest_file = get_deepest_file(args.depth)
+        operations = [
+            ("stat", lambda: provider.stat(deepest_file) is not None),
+            ("stat (cached)", lambda: provider.stat(deepest_file) is not None),
+            ("browse", lambda: len(provider.browse("/")["children"])),
+            ("enumerate", lambda: len(provider.enumerate("/", False))),
+            ("read", lambda: read(provider, deepest_file, None)),
+            ("read (range)", lambda: read(provider, deepest_file, str(args.file_size // 2))),
+            ("write", lambda: provider.write("/written/new.csv", GeneratedStream(args.write_size)) or args.write_size),
+            ("write (existing)", lambda: provider.write(deepest_file, GeneratedStream(args.write_size)) or args.write_size),
+            ("move", lambda: provider.move("/written/new.csv", "/written/moved.csv")),
+            ("delete_recursive", lambda: provider.delete_recursive("/")),
+        ]
+        results = []
+        for name, operation in operations:
+            if args.operations and name.split(" ")[0] not in args.operations:
+                continue
+            results.append(measure(base_url, name, operation))
+        results.append(measure(base_url, "close", provider.close))
+    finally:
+        server.terminate()
+        shutil.rmtree(dip_home, ignore_errors=True)
+    return results
+
+
+def read(provider, path, limit):
+    stream = CountingStream()
+    provider.read(path, stream, limit)
+    return stream.size
+
+
+def print_results(results):
+    print("{:<20} {:>10} {:>10} {:>10} {:>12} {:>12}  {}".format(
+        "operation", "wall (s)", "API calls", "429s", "MB in+out", "peak MB", "result"
+    ))
+    for result in results:
+        print("{:<20} {:>10.3f} {:>10} {:>10} {:>12.1f} {:>12.1f}  {}".format(
+            result["operation"], result["wall_time"], result["api_calls"], result["throttled"],
+            (result["bytes_in"] + result["bytes_out"]) / 1024.0 / 1024.0, result["peak_memory"] / 1024.0 / 1024.0,
+            result["error"] if result["error"] is not None else result["result"]
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the box.com FS provider against a local mock server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--depth", type=int, default=2, help="Levels of sub folders below the provider's root")
+    parser.add_argument("--fanout", type=int, default=4, help="Sub folders per folder")
+    parser.add_argument("--files", type=int, default=10, help="Files per folder")
+    parser.add_argument("--file-size", type=int, default=1024 * 1024, help="Size of the generated files, in bytes")
+    parser.add_argument("--write-size", type=int, default=1024 * 1024, help="Size of the written files, in bytes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to each request, in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer one request out of N with a 429")
+    parser.add_argument("--operations", nargs="*", help="Only run these operations")
+    parser.add_argument("--config", action="append", default=[], help="Provider setting, as name=value")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the logs of every request")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger("boxsdk").setLevel(logging.WARNING)
+    results = run(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file_handle:
+            json.dump(results, file_handle, indent=2)
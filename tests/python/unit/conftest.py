@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "python-lib"))
+
+
+@pytest.fixture
+def dip_home(tmp_path, monkeypatch):
+    # Caches, locks and state files go to a temporary DIP_HOME
+    monkeypatch.setenv("DIP_HOME", str(tmp_path))
+    return tmp_path
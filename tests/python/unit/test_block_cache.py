@@ -0,0 +1,56 @@
+import os
+import time
+
+from block_cache import BlockCache
+
+
+def test_blocks_are_served_per_file_version(dip_home):
+    cache = BlockCache(1024, block_size=16)
+    cache.put("1", "sha", 0, b"a" * 16, 16)
+    assert cache.contains("1", "sha", 0)
+    assert cache.get("1", "sha", 0, 16) == b"a" * 16
+    assert cache.get("1", "other_sha", 0, 16) is None
+    assert cache.get("1", "sha", 1, 16) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_block_lengths(dip_home):
+    cache = BlockCache(1024, block_size=16)
+    assert cache.get_block_count(40) == 3
+    assert [cache.get_block_length(40, index) for index in range(3)] == [16, 16, 8]
+
+
+def test_block_of_unexpected_length_is_not_stored(dip_home):
+    cache = BlockCache(1024, block_size=16)
+    cache.put("1", "sha", 0, b"a" * 10, 16)
+    assert not cache.contains("1", "sha", 0)
+
+
+def test_block_of_unexpected_length_is_dropped(dip_home):
+    cache = BlockCache(1024, block_size=16)
+    cache.put("1", "sha", 2, b"a" * 8, 8)
+    assert cache.get("1", "sha", 2, 16) is None
+    assert not cache.contains("1", "sha", 2)
+
+
+def test_least_recently_used_blocks_are_evicted(dip_home):
+    cache = BlockCache(64, block_size=16)
+    for index in range(4):
+        cache.put("1", "sha", index, bytes([index]) * 16, 16)
+        # Access times of the blocks are their modification times
+        os.utime(cache.get_block_location("1", "sha", index), (1000 + index, 1000 + index))
+    os.utime(cache.get_block_location("1", "sha", 0), (time.time(), time.time()))
+    cache.put("2", "sha", 0, b"b" * 16, 16)
+    assert cache.total_size <= 64 * BlockCache.EVICTION_TARGET
+    assert cache.contains("1", "sha", 0)
+    assert not cache.contains("1", "sha", 1)
+    assert not cache.contains("1", "sha", 2)
+    assert cache.contains("1", "sha", 3)
+    assert cache.contains("2", "sha", 0)
+
+
+def test_cache_disabled_without_size(dip_home):
+    cache = BlockCache(0)
+    cache.put("1", "sha", 0, b"a", 1)
+    assert not cache.contains("1", "sha", 0)
+    assert cache.get("1", "sha", 0, 1) is None
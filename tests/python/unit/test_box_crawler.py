@@ -0,0 +1,75 @@
+import time
+import threading
+
+from box_crawler import BoxCrawler
+from listing_cache import ListingEntry
+from operation_metrics import OperationMetrics
+
+
+class FakeListings():
+    """
+    Folder listings from folders, a dict of folder id -> (name, type, size) children, named after their id
+    """
+    def __init__(self, folders, delay=0.0):
+        self.folders = folders
+        self.delay = delay
+        self.metrics = OperationMetrics()
+        self.listed = []
+        self.lock = threading.Lock()
+
+    def get_items(self, folder_id):
+        with self.lock:
+            self.listed.append(folder_id)
+        time.sleep(self.delay)
+        return [ListingEntry(child_id, child_id, child_type, size, None) for child_id, child_type, size in self.folders[folder_id]]
+
+
+class FakeCache():
+    def __init__(self):
+        self.entries = []
+
+    def add_batch(self, entries):
+        self.entries.extend(entries)
+
+
+def build_tree():
+    # "a" holds the only non-empty file, "b" and "c" hold deeper folders
+    folders = {
+        "root": [("a", "folder", 0), ("b", "folder", 0), ("c", "folder", 0), ("empty.csv", "file", 0)],
+        "a": [("data.csv", "file", 10)],
+        "b": [("b1", "folder", 0), ("b.csv", "file", 0)],
+        "c": [("c1", "folder", 0)],
+        "b1": [("b1.csv", "file", 0)],
+        "c1": [("c1.csv", "file", 0)],
+    }
+    return folders
+
+
+def test_crawl_lists_the_whole_tree():
+    cache = FakeCache()
+    crawler = BoxCrawler(FakeListings(build_tree()), cache=cache, threads=4)
+    files = crawler.crawl("/", "data", "root")
+    assert sorted(crawled["path"] for crawled in files) == [
+        "/a/data.csv", "/b/b.csv", "/b/b1/b1.csv", "/c/c1/c1.csv", "/empty.csv"
+    ]
+    assert ("data/b/b1", "b1", "folder", 0, None) in cache.entries
+    assert len(cache.entries) == 10
+
+
+def test_first_non_empty_stops_the_crawl():
+    listings = FakeListings(build_tree(), delay=0.05)
+    crawler = BoxCrawler(listings, threads=1)
+    files = crawler.crawl("/", "", "root", first_non_empty=True)
+    assert [crawled["path"] for crawled in files if crawled["size"] > 0] == ["/a/data.csv"]
+    # Listings queued when the file was found are cancelled, nothing below them is listed
+    assert "c" not in listings.listed
+    assert "b1" not in listings.listed and "c1" not in listings.listed
+
+
+def test_stopping_iteration_cancels_pending_listings():
+    listings = FakeListings(build_tree(), delay=0.05)
+    crawler = BoxCrawler(listings, threads=1)
+    crawled_files = crawler.iter_files("/", "", "root")
+    assert next(crawled_files).path == "/empty.csv"
+    crawled_files.close()
+    assert len(listings.listed) < len(build_tree())
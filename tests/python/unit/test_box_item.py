@@ -0,0 +1,257 @@
+import hashlib
+import threading
+
+from io import BytesIO
+
+import pytest
+
+from boxsdk.exception import BoxAPIException
+from block_cache import BlockCache
+from box_item import BoxItem
+
+
+class FakeResponse():
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+class FakeFolderObject():
+    def __init__(self, box, folder_id):
+        self.box = box
+        self.folder_id = folder_id
+
+    def get_url(self, endpoint):
+        return "folders/{}/{}".format(self.folder_id, endpoint)
+
+    def delete(self, recursive=True):
+        self.box.record(("delete_folder", self.folder_id, recursive))
+        if recursive and self.box.refuse_recursive_delete:
+            raise BoxAPIException(403, code="forbidden_by_policy")
+        if self.box.folders.pop(self.folder_id, None) is None:
+            raise BoxAPIException(404, code="not_found")
+
+
+class FakeFileObject():
+    def __init__(self, box, file_id):
+        self.box = box
+        self.file_id = file_id
+
+    def get_url(self, endpoint):
+        return "files/{}/{}".format(self.file_id, endpoint)
+
+    def get(self, fields=None):
+        content = self.box.files[self.file_id]
+        return {"id": self.file_id, "sha1": hashlib.sha1(content).hexdigest(), "size": len(content)}
+
+    def delete(self):
+        self.box.record(("delete_file", self.file_id))
+        if self.box.files.pop(self.file_id, None) is None:
+            raise BoxAPIException(404, code="not_found")
+
+
+class FakeRawStream(BytesIO):
+    def __init__(self, content, status, headers):
+        super(FakeRawStream, self).__init__(content)
+        self.status = status
+        self.headers = headers
+
+
+class FakeNetworkResponse():
+    def __init__(self, raw_stream):
+        self.response_as_stream = raw_stream
+
+
+class FakeContentResponse():
+    def __init__(self, raw_stream):
+        self.network_response = FakeNetworkResponse(raw_stream)
+
+
+class FakeSession():
+    def __init__(self, box):
+        self.box = box
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        collection, item_id, _ = url.split('/')
+        if collection == "folders":
+            return FakeResponse({"entries": self.box.folders[item_id], "next_marker": None})
+        content = self.box.files[item_id]
+        if headers is None or not self.box.ranges_supported:
+            self.box.record(("get_content", item_id, None))
+            return FakeContentResponse(FakeRawStream(content, 200, {}))
+        first, last = [int(bound) for bound in headers['Range'][len('bytes='):].split('-')]
+        last = min(last, len(content) - 1)
+        self.box.record(("get_content", item_id, (first, last)))
+        content_range = "bytes {}-{}/{}".format(first, last, len(content))
+        return FakeContentResponse(FakeRawStream(content[first:last + 1], 206, {'Content-Range': content_range}))
+
+
+class FakeBox():
+    """
+    Client serving folders, a dict of folder id -> child entries, and files, a dict of file id -> content,
+    and recording content requests and deletions
+    """
+    def __init__(self, folders, files, refuse_recursive_delete=False, ranges_supported=True):
+        self.folders = folders
+        self.files = files
+        self.refuse_recursive_delete = refuse_recursive_delete
+        self.ranges_supported = ranges_supported
+        self.session = FakeSession(self)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def record(self, call):
+        with self.lock:
+            self.calls.append(call)
+
+    def folder(self, folder_id):
+        return FakeFolderObject(self, folder_id)
+
+    def file(self, file_id):
+        return FakeFileObject(self, file_id)
+
+
+def folder(folder_id, name):
+    return {"id": folder_id, "type": "folder", "name": name}
+
+
+def file(file_id, name):
+    return {"id": file_id, "type": "file", "name": name}
+
+
+def build_tree(refuse_recursive_delete=False):
+    folders = {
+        "1": [file("11", "a.csv"), folder("2", "sub"), file("12", "b.csv")],
+        "2": [folder("3", "deeper"), file("21", "c.csv")],
+        "3": [file("31", "d.csv"), file("32", "e.csv")],
+    }
+    files = dict((file_id, b"") for file_id in ["11", "12", "21", "31", "32"])
+    return FakeBox(folders, files, refuse_recursive_delete)
+
+
+def get_folder_item(box, listing_threads=4):
+    item = BoxItem(None, "/root", box, listing_cache_ttl=0, listing_threads=listing_threads)
+    item.path = "root/data"
+    item.id = "1"
+    item.type = BoxItem.BOX_FOLDER
+    return item
+
+
+def test_folder_deleted_server_side():
+    box = build_tree()
+    assert get_folder_item(box).delete() == 5
+    assert box.calls == [("delete_folder", "1", True)]
+
+
+@pytest.mark.parametrize("listing_threads", [1, 4])
+def test_item_deletion_when_recursive_delete_is_refused(listing_threads):
+    box = build_tree(refuse_recursive_delete=True)
+    assert get_folder_item(box, listing_threads).delete() == 5
+    assert box.calls[0] == ("delete_folder", "1", True)
+    deletions = box.calls[1:]
+    # Files first, then the emptied folders, deepest first and the deleted folder itself last
+    assert sorted(deletions[:5]) == [("delete_file", file_id) for file_id in ["11", "12", "21", "31", "32"]]
+    assert deletions[5:] == [("delete_folder", "3", False), ("delete_folder", "2", False), ("delete_folder", "1", False)]
+    assert box.files == {}
+    assert box.folders == {}
+
+
+def test_item_deletion_counts_only_deleted_files():
+    box = build_tree(refuse_recursive_delete=True)
+    # Deleted meanwhile by another process
+    del box.files["31"]
+    assert get_folder_item(box).delete() == 4
+    assert box.folders == {}
+
+
+def get_file_item(box, file_id, size, **kwargs):
+    # size is the one cached or listed when the path was resolved, maybe outdated
+    item = BoxItem(None, "/root", box, listing_cache_ttl=0, **kwargs)
+    item.path = "root/file.csv"
+    item.id = file_id
+    item.type = BoxItem.BOX_FILE
+    item.size = size
+    return item
+
+
+def read(item, byte_range=None):
+    stream = BytesIO()
+    transferred = item.write_content_to(stream, byte_range)
+    assert transferred == len(stream.getvalue())
+    return stream.getvalue()
+
+
+def get_cached_file_item(box, file_id, size, download_threads=1):
+    item = get_file_item(box, file_id, size, content_cache_size=1024 * 1024, download_threads=download_threads)
+    item.content_cache = BlockCache(1024 * 1024, block_size=16, metrics=item.metrics)
+    return item
+
+
+def content_requests(box):
+    return [call for call in box.calls if call[0] == "get_content"]
+
+
+@pytest.mark.parametrize("download_threads", [1, 4])
+def test_cached_read_of_a_file_grown_since_it_was_listed(dip_home, download_threads):
+    content = bytes(range(100))
+    box = FakeBox({}, {"7": content})
+    assert read(get_cached_file_item(box, "7", 40, download_threads)) == content
+    assert read(get_cached_file_item(box, "7", 40, download_threads), (10, 70)) == content[10:71]
+    # All the blocks are cached by now
+    assert len(content_requests(box)) == (1 if download_threads == 1 else 7)
+
+
+@pytest.mark.parametrize("download_threads", [1, 4])
+def test_cached_read_of_a_file_shrunk_since_it_was_listed(dip_home, download_threads):
+    box = FakeBox({}, {"7": bytes(range(100))})
+    read(get_cached_file_item(box, "7", 100, download_threads))
+    box.files["7"] = bytes(range(30))
+    assert read(get_cached_file_item(box, "7", 100, download_threads)) == bytes(range(30))
+    assert read(get_cached_file_item(box, "7", 100, download_threads), (20, 99)) == bytes(range(20, 30))
+
+
+def test_cached_read_of_an_emptied_file(dip_home):
+    box = FakeBox({}, {"7": b""})
+    assert read(get_cached_file_item(box, "7", 100)) == b""
+    assert content_requests(box) == []
+
+
+def test_cached_read_with_missing_blocks_only_downloads_them(dip_home):
+    content = bytes(range(64))
+    box = FakeBox({}, {"7": content})
+    item = get_cached_file_item(box, "7", 64)
+    assert read(item, (16, 31)) == content[16:32]
+    assert read(item) == content
+    assert content_requests(box) == [("get_content", "7", (16, 31)), ("get_content", "7", (0, 15)), ("get_content", "7", (32, 63))]
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    monkeypatch.setattr(BoxItem, "DOWNLOAD_PART_SIZE", 16)
+
+
+def test_parallel_read_of_a_file_grown_since_it_was_listed(small_parts):
+    content = bytes(range(100))
+    box = FakeBox({}, {"7": content})
+    assert read(get_file_item(box, "7", 40, download_threads=4)) == content
+    # Parts are laid out from the size in the Content-Range of the first one
+    assert sorted(content_requests(box)) == [
+        ("get_content", "7", (offset, min(offset + 15, 99))) for offset in range(0, 100, 16)
+    ]
+    assert read(get_file_item(box, "7", 40, download_threads=4), (10, 80)) == content[10:81]
+
+
+def test_parallel_read_of_a_file_shrunk_since_it_was_listed(small_parts):
+    box = FakeBox({}, {"7": bytes(range(30))})
+    assert read(get_file_item(box, "7", 100, download_threads=4)) == bytes(range(30))
+    assert read(get_file_item(box, "7", 100, download_threads=4), (20, 99)) == bytes(range(20, 30))
+
+
+def test_parallel_read_without_content_range(small_parts):
+    # A full 200 response to the first ranged request, the file is then read over a single connection
+    content = bytes(range(100))
+    box = FakeBox({}, {"7": content}, ranges_supported=False)
+    assert read(get_file_item(box, "7", 40, download_threads=4)) == content
+    assert content_requests(box) == [("get_content", "7", None), ("get_content", "7", None)]
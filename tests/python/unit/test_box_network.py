@@ -0,0 +1,89 @@
+import threading
+
+from io import BytesIO
+
+import pytest
+import requests
+
+from boxsdk import OAuth2, Client
+from boxsdk.exception import BoxAPIException
+from boxsdk.session.session import AuthorizedSession
+from box_network import LessVerboseLoggingNetwork
+from operation_metrics import OperationMetrics
+
+
+class ThrottlingTransport():
+    """
+    Stands for the requests session of the network layer, and answers 429 to every request
+    """
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        files = kwargs.get('files')
+        if files:
+            # The body is consumed as it would be when sent
+            for _, file_tuple in files.items():
+                file_tuple[1].read()
+        with self.lock:
+            self.calls.append((method, url))
+        response = requests.models.Response()
+        response.status_code = 429
+        response.headers['Retry-After'] = '0'
+        response.headers['Content-Type'] = 'application/json'
+        response._content = b'{"type": "error", "status": 429, "code": "rate_limit_exceeded", "message": "Too many"}'
+        response.url = url
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(LessVerboseLoggingNetwork, "BACKOFF_BASE", 0)
+
+
+def get_network(max_retries):
+    network = LessVerboseLoggingNetwork(max_retries=max_retries)
+    network._session = ThrottlingTransport()
+    return network
+
+
+def get_client(network, metrics=None):
+    auth = OAuth2(client_id="", client_secret="", access_token="token")
+    session = AuthorizedSession(auth, network_layer=network)
+    if metrics is not None:
+        session = session.with_default_network_request_kwargs({'metrics': metrics})
+    return Client(auth, session)
+
+
+@pytest.mark.parametrize("max_retries", [0, 1, 2, 5, 7])
+def test_network_makes_max_retries_plus_one_attempts(max_retries):
+    network = get_network(max_retries)
+    response = network.request("GET", "https://api.box.com/2.0/folders/0", "token")
+    assert response.status_code == 429
+    assert len(network._session.calls) == max_retries + 1
+
+
+@pytest.mark.parametrize("max_retries", [0, 1, 2, 5, 7])
+def test_session_retries_count_as_attempts(max_retries):
+    network = get_network(max_retries)
+    metrics = OperationMetrics()
+    with pytest.raises(BoxAPIException) as error:
+        get_client(network, metrics).folder("0").get()
+    assert error.value.status == 429
+    assert len(network._session.calls) == max_retries + 1
+    assert metrics.get_api_calls() == max_retries + 1
+    assert network.metrics.get_api_calls() == 0
+
+
+@pytest.mark.parametrize("max_retries", [0, 1, 2, 5])
+def test_streamed_uploads_are_retried_by_the_session_within_max_retries(max_retries):
+    network = get_network(max_retries)
+    with pytest.raises(BoxAPIException):
+        get_client(network).session.post(
+            "https://upload.box.com/api/2.0/files/content",
+            data={"attributes": "{}"},
+            files={"file": ("unused", BytesIO(b"content"))}
+        )
+    assert len(network._session.calls) == max_retries + 1
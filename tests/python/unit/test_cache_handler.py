@@ -0,0 +1,149 @@
+import os
+import json
+
+from cache_handler import CacheHandler
+
+
+def read_journal(cache):
+    if not os.path.exists(cache.journal_location):
+        return []
+    with open(cache.journal_location, "r") as file_handle:
+        return [json.loads(line) for line in file_handle]
+
+
+def test_journal_replayed_by_another_handler(dip_home):
+    cache = CacheHandler("token")
+    cache.add("a", "1", "folder")
+    cache.add("a/b.csv", "2", "file", 10, 1000)
+    cache.add("c.csv", "3", "file", 20)
+    cache.remove("3")
+    cache.flush()
+    assert not os.path.exists(cache.cache_location)
+    assert [record["op"] for record in read_journal(cache)] == ["add", "add", "add", "remove"]
+
+    loaded = CacheHandler("token")
+    assert loaded.count_entries() == 2
+    assert loaded.query("a/b.csv") == ("2", "file")
+    assert loaded.query_entry("a/b.csv")["size"] == 10
+    assert loaded.query("c.csv") == (None, None)
+
+
+def test_records_are_buffered_until_flush(dip_home):
+    cache = CacheHandler("token")
+    cache.add("a.csv", "1", "file", 1)
+    assert read_journal(cache) == []
+    cache.flush()
+    assert len(read_journal(cache)) == 1
+
+
+def test_refresh_catches_up_with_other_handlers(dip_home):
+    first = CacheHandler("token")
+    second = CacheHandler("token")
+    first.add("a", "1", "folder")
+    first.add("a/b.csv", "2", "file", 10)
+    first.flush()
+    assert second.query("a/b.csv") == (None, None)
+    second.refresh()
+    assert second.query("a/b.csv") == ("2", "file")
+    first.remove_path("a")
+    first.flush()
+    second.refresh()
+    assert second.count_entries() == 0
+
+
+def test_partial_journal_line_is_skipped(dip_home):
+    cache = CacheHandler("token")
+    cache.add("a.csv", "1", "file", 1)
+    cache.flush()
+    with open(cache.journal_location, "a") as file_handle:
+        file_handle.write('{"op": "add", "path": "b.csv"\n')
+        file_handle.write('{"op": "add", "path": "c.csv", "item_id": "3"')
+    loaded = CacheHandler("token")
+    assert loaded.query("a.csv") == ("1", "file")
+    assert loaded.count_entries() == 1
+    # The unterminated line is left for a later replay
+    assert loaded.journal_offset < os.path.getsize(cache.journal_location)
+
+
+def test_compaction_writes_snapshot_and_truncates_journal(dip_home, monkeypatch):
+    monkeypatch.setattr(CacheHandler, "COMPACTION_MIN_RECORDS", 5)
+    cache = CacheHandler("token")
+    for index in range(3):
+        cache.add("file_{}.csv".format(index), str(index), "file", index)
+    cache.flush()
+    assert not os.path.exists(cache.cache_location)
+    # Compacted once the journal outgrows both the minimum and the cache itself
+    for size in [10, 20]:
+        for index in range(3):
+            cache.add("file_{}.csv".format(index), str(index), "file", size + index)
+    cache.flush()
+    assert os.path.exists(cache.cache_location)
+    assert os.path.getsize(cache.journal_location) == 0
+    assert cache.journal_records == 0
+    with open(cache.cache_location, "r") as file_handle:
+        snapshot = json.load(file_handle)
+    assert sorted(snapshot) == ["file_0.csv", "file_1.csv", "file_2.csv"]
+
+    loaded = CacheHandler("token")
+    assert loaded.count_entries() == 3
+    assert loaded.query_entry("file_1.csv")["size"] == 21
+
+
+def test_compaction_keeps_records_of_other_handlers(dip_home, monkeypatch):
+    monkeypatch.setattr(CacheHandler, "COMPACTION_MIN_RECORDS", 5)
+    first = CacheHandler("token")
+    second = CacheHandler("token")
+    second.add("other.csv", "100", "file", 1)
+    second.flush()
+    for size in range(6):
+        first.add("file.csv", "1", "file", size)
+    first.flush()
+    assert os.path.getsize(first.journal_location) == 0
+    assert first.query("other.csv") == ("100", "file")
+    second.refresh()
+    assert second.count_entries() == 2
+    assert second.query_entry("file.csv")["size"] == 5
+
+
+def test_large_batch_goes_to_snapshot(dip_home, monkeypatch):
+    monkeypatch.setattr(CacheHandler, "COMPACTION_MIN_RECORDS", 10)
+    cache = CacheHandler("token")
+    cache.add_batch([("folder", "0", "folder")] + [
+        ("folder/file_{}.csv".format(index), str(index + 1), "file", index) for index in range(20)
+    ])
+    assert os.path.getsize(cache.journal_location) == 0
+    assert CacheHandler("token").count_entries() == 21
+
+
+def test_eviction_keeps_most_recently_used(dip_home):
+    cache = CacheHandler("token", max_entries=10)
+    for index in range(10):
+        cache.add("file_{}.csv".format(index), str(index), "file", index)
+    for node in [cache.cache.find("file_{}.csv".format(index)) for index in range(10)]:
+        node.accessed_at = 0
+    cache.query_entry("file_0.csv")
+    cache.add("file_10.csv", "10", "file", 10)
+    assert cache.count_entries() == 9
+    assert cache.query("file_0.csv") == ("0", "file")
+    assert cache.query("file_10.csv") == ("10", "file")
+    cache.flush()
+    # Evictions are journaled, so other handlers forget the same entries
+    assert CacheHandler("token").count_entries() == 9
+
+
+def test_reset(dip_home):
+    cache = CacheHandler("token")
+    cache.add("a.csv", "1", "file", 1)
+    cache.flush()
+    cache.reset()
+    assert cache.count_entries() == 0
+    assert CacheHandler("token").count_entries() == 0
+
+
+def test_disabled_cache(dip_home):
+    cache = CacheHandler(None)
+    cache.add("a.csv", "1", "file", 1)
+    cache.flush()
+    assert cache.query("a.csv") == (None, None)
+    assert cache.count_entries() == 0
+    assert os.listdir(str(dip_home)) == []
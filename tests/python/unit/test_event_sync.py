@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from cache_handler import CacheHandler
+from event_sync import EventSync
+
+
+class FakeListings():
+    def __init__(self):
+        self.invalidated_items = []
+        self.invalidated_folders = []
+
+    def invalidate_item(self, item_id):
+        self.invalidated_items.append(item_id)
+
+    def invalidate(self, folder_id):
+        self.invalidated_folders.append(folder_id)
+
+
+def event(event_type, item_id, item_type="file", name=None, parent_id=None, **source):
+    source.update({"id": item_id, "type": item_type})
+    if name is not None:
+        source["name"] = name
+    if parent_id is not None:
+        source["parent"] = {"type": "folder", "id": parent_id}
+    return {"event_type": event_type, "source": source}
+
+
+@pytest.fixture
+def cache(dip_home):
+    cache = CacheHandler("token")
+    cache.add("root", "1", "folder")
+    cache.add("root/data", "2", "folder")
+    cache.add("root/data/file.csv", "3", "file", 10)
+    cache.add("root/other", "4", "folder")
+    return cache
+
+
+@pytest.fixture
+def sync(cache):
+    return EventSync("token", None, cache)
+
+
+def test_trash_removes_subtree(sync, cache):
+    listings = FakeListings()
+    sync.apply(event("ITEM_TRASH", "2", "folder", "data", "1"), [listings])
+    assert cache.query("root/data") == (None, None)
+    assert cache.query("root/data/file.csv") == (None, None)
+    assert cache.query("root/other") == ("4", "folder")
+    assert listings.invalidated_items == ["2"]
+    assert listings.invalidated_folders == ["1"]
+
+
+def test_rename_moves_entry(sync, cache):
+    sync.apply(event("ITEM_RENAME", "2", "folder", "renamed", "1"), [FakeListings()])
+    assert cache.query("root/data") == (None, None)
+    assert cache.query("root/renamed") == ("2", "folder")
+    # Not known to be below the new path until resolved again
+    assert cache.query("root/renamed/file.csv") == (None, None)
+
+
+def test_move_to_known_folder(sync, cache):
+    sync.apply(event("ITEM_MOVE", "3", "file", "file.csv", "4", size=12), [FakeListings()])
+    assert cache.query("root/data/file.csv") == (None, None)
+    entry = cache.query_entry("root/other/file.csv")
+    assert entry["item_id"] == "3"
+    assert entry["size"] == 12
+
+
+def test_upload_sets_size_and_date(sync, cache):
+    sync.apply(event("ITEM_UPLOAD", "3", "file", "file.csv", "2", size=20, modified_at="2020-01-01T00:00:00-08:00"), [])
+    entry = cache.query_entry("root/data/file.csv")
+    assert entry["size"] == 20
+    assert entry["modified_at"] == 1577836800000
+
+
+def test_create_in_root_folder(sync, cache):
+    sync.apply(event("ITEM_CREATE", "5", "folder", "top", EventSync.BOX_ROOT_ID), [])
+    assert cache.query("top") == ("5", "folder")
+
+
+def test_move_to_unknown_folder_drops_entry(sync, cache):
+    sync.apply(event("ITEM_MOVE", "3", "file", "file.csv", "999"), [])
+    assert cache.query("root/data/file.csv") == (None, None)
+    assert cache.query_path("3") is None
+
+
+def test_unrelated_events_are_ignored(sync, cache):
+    listings = FakeListings()
+    before = cache.count_entries()
+    sync.apply(event("ITEM_TRASH", "9", "web_link", "link", "1"), [listings])
+    sync.apply({"event_type": "ITEM_TRASH", "source": None}, [listings])
+    sync.apply(event("ITEM_PREVIEW", "3", "file", "file.csv", "2"), [listings])
+    assert cache.count_entries() == before
+    assert listings.invalidated_items == ["3"]
+
+
+def test_apply_pending_persists_position(sync, cache, monkeypatch):
+    monkeypatch.setattr(sync, "start", lambda: None)
+    sync.pending.extend([
+        event("ITEM_TRASH", "3", "file", "file.csv", "2"),
+        event("ITEM_CREATE", "6", "file", "new.csv", "4", size=1)
+    ])
+    sync.fetched_position = "1234"
+    sync.since = time.time()
+    sync.apply_pending()
+    assert cache.query("root/data/file.csv") == (None, None)
+    assert cache.query("root/other/new.csv") == ("6", "file")
+    assert sync.read_position() == ("1234", sync.since)
+    # Applied records are on disk for the processes starting from this position
+    assert CacheHandler("token").query("root/other/new.csv") == ("6", "file")
+
+
+def test_covers(sync):
+    assert not sync.covers(time.time())
+    sync.since = time.time() - 10
+    sync.synced_at = time.time()
+    assert sync.covers(time.time())
+    assert not sync.covers(sync.since - 1)
+    assert not sync.covers(None)
+    sync.synced_at = time.time() - 2 * sync.interval
+    assert not sync.covers(time.time())
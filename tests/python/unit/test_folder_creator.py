@@ -0,0 +1,143 @@
+import time
+import threading
+
+import pytest
+
+from boxsdk.exception import BoxAPIException
+from folder_creator import FolderCreator
+
+
+class FakeFolder(dict):
+    @property
+    def id(self):
+        return self["id"]
+
+
+class FakeChild():
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+
+
+class FakeBox():
+    """
+    create_subfolder answers with the given results in turn, then with a duplicate name error
+    """
+    def __init__(self, results=None, delay=0.0):
+        self.results = list(results or [])
+        self.delay = delay
+        self.calls = []
+        self.folders = {}
+        self.lock = threading.Lock()
+
+    def folder(self, folder_id):
+        return FakeFolderManager(self, folder_id)
+
+    def list_folder(self, parent_id, fields=None):
+        with self.lock:
+            return [FakeChild(name, id) for (parent, name), id in self.folders.items() if parent == parent_id]
+
+    def create(self, parent_id, name):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append((parent_id, name))
+            if self.results:
+                result = self.results.pop(0)
+                if isinstance(result, Exception):
+                    raise result
+                self.folders[(parent_id, name)] = result
+                return FakeFolder(id=result)
+            if (parent_id, name) in self.folders:
+                raise duplicate(self.folders[(parent_id, name)])
+            folder_id = str(100 + len(self.calls))
+            self.folders[(parent_id, name)] = folder_id
+            return FakeFolder(id=folder_id)
+
+
+class FakeFolderManager():
+    def __init__(self, box, folder_id):
+        self.box = box
+        self.folder_id = folder_id
+
+    def create_subfolder(self, name):
+        return self.box.create(self.folder_id, name)
+
+
+def duplicate(folder_id):
+    return BoxAPIException(409, code=FolderCreator.BOX_ERR_DUPLICATE, context_info={"conflicts": [{"id": folder_id}]})
+
+
+def reserved():
+    return BoxAPIException(409, code=FolderCreator.BOX_ERR_RESERVED)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(FolderCreator, "INITIAL_BACKOFF", 0.001)
+
+
+def test_concurrent_creations_share_one_request(dip_home):
+    box = FakeBox(delay=0.2)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(FolderCreator.create(box, "0", "new", box)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["101"] * 8
+    assert box.calls == [("0", "new")]
+    assert FolderCreator.in_flight == {}
+    assert (dip_home / "caches" / "plugins" / "box-com" / FolderCreator.LOCK_DIRECTORY).is_dir()
+
+
+def test_other_names_are_not_shared(dip_home):
+    box = FakeBox()
+    assert FolderCreator.create(box, "0", "a", box) != FolderCreator.create(box, "0", "b", box)
+    assert len(box.calls) == 2
+
+
+def test_existing_folder_is_returned(dip_home):
+    box = FakeBox(results=[duplicate("42")])
+    assert FolderCreator.create(box, "0", "existing", box) == "42"
+
+
+def test_reserved_name_is_retried(dip_home):
+    box = FakeBox(results=[reserved(), reserved(), duplicate("42")])
+    assert FolderCreator.create(box, "0", "reserved", box) == "42"
+    assert len(box.calls) == 3
+
+
+def test_reserved_name_gives_up(dip_home, monkeypatch):
+    monkeypatch.setattr(FolderCreator, "MAX_ATTEMPTS", 3)
+    box = FakeBox(results=[reserved()] * 3)
+    with pytest.raises(Exception, match="still reserved after 3 attempts"):
+        FolderCreator.create(box, "0", "reserved", box)
+
+
+def test_error_is_raised_to_every_waiter(dip_home):
+    box = FakeBox(results=[BoxAPIException(500, code="internal_server_error")], delay=0.2)
+    errors = []
+
+    def create():
+        try:
+            FolderCreator.create(box, "0", "failing", box)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=create) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 4
+    assert len(box.calls) == 1
+    assert FolderCreator.in_flight == {}
+
+
+def test_without_dip_home(monkeypatch):
+    monkeypatch.delenv("DIP_HOME", raising=False)
+    box = FakeBox()
+    assert FolderCreator.create(box, "0", "new", box) == "101"
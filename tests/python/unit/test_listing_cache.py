@@ -0,0 +1,137 @@
+import pytest
+
+import listing_cache
+from listing_cache import FolderListingCache
+
+
+class FakeResponse():
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+class FakeFolderObject():
+    def __init__(self, folder_id):
+        self.folder_id = folder_id
+
+    def get_url(self, endpoint):
+        return "folders/{}/{}".format(self.folder_id, endpoint)
+
+
+class FakeSession():
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, url, params=None):
+        folder_id = url.split('/')[1]
+        self.client.calls.append((folder_id, params.get('marker')))
+        entries = self.client.folders[folder_id]
+        start = int(params.get('marker') or 0)
+        end = start + params['limit']
+        next_marker = str(end) if end < len(entries) else None
+        return FakeResponse({"entries": entries[start:end], "next_marker": next_marker})
+
+
+class FakeClient():
+    """
+    Serves the folder listings of folders, a dict of folder id -> entries
+    """
+    def __init__(self, folders):
+        self.folders = folders
+        self.calls = []
+        self.session = FakeSession(self)
+
+    def folder(self, folder_id):
+        return FakeFolderObject(folder_id)
+
+
+class FakeTime():
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def entries(folder_id, count):
+    return [
+        {"id": "{}-{}".format(folder_id, index), "type": "file", "name": "file_{}.csv".format(index), "size": index}
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(listing_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def client():
+    return FakeClient({"0": [{"id": "1", "type": "folder", "name": "data"}], "1": entries("1", 3), "2": entries("2", 3)})
+
+
+def test_listing_is_served_from_cache_until_ttl(client, clock):
+    listings = FolderListingCache(client, ttl=60)
+    assert [item.name for item in listings.get_items("1")] == ["file_0.csv", "file_1.csv", "file_2.csv"]
+    clock.now = clock.now + 59
+    listings.get_items("1")
+    assert len(client.calls) == 1
+    clock.now = clock.now + 2
+    listings.get_items("1")
+    assert len(client.calls) == 2
+
+
+def test_refresh_bypasses_and_replaces_cached_listing(client, clock):
+    listings = FolderListingCache(client)
+    listings.get_items("1")
+    client.folders["1"] = entries("1", 1)
+    assert len(listings.get_items("1")) == 3
+    assert len(listings.get_items("1", refresh=True)) == 1
+    assert len(listings.get_items("1")) == 1
+    assert len(client.calls) == 2
+
+
+def test_zero_ttl_disables_cache(client, clock):
+    listings = FolderListingCache(client, ttl=0)
+    listings.get_items("1")
+    listings.get_items("1")
+    assert len(client.calls) == 2
+    assert listings.total_entries == 0
+
+
+def test_least_recently_used_listing_is_evicted(client, clock):
+    listings = FolderListingCache(client, max_entries=6)
+    listings.get_items("1")
+    listings.get_items("2")
+    listings.get_items("1")
+    listings.get_items("0")
+    assert list(listings.listings.keys()) == ["1", "0"]
+    assert listings.total_entries == 4
+    assert "2-0" not in listings.parents
+    listings.get_items("1")
+    assert len(client.calls) == 3
+
+
+def test_invalidate_item_drops_parent_and_own_listing(client, clock):
+    listings = FolderListingCache(client)
+    listings.get_items("0")
+    listings.get_items("1")
+    listings.get_items("2")
+    listings.invalidate_item("1")
+    assert list(listings.listings.keys()) == ["2"]
+    listings.invalidate_item("2-1")
+    assert listings.listings == {}
+    assert listings.total_entries == 0
+    assert listings.parents == {}
+
+
+def test_pages_are_followed(client, clock, monkeypatch):
+    monkeypatch.setattr(FolderListingCache, "PAGE_SIZE", 2)
+    client.folders["3"] = entries("3", 5)
+    listings = FolderListingCache(client)
+    assert [item.id for item in listings.get_items("3")] == ["3-{}".format(index) for index in range(5)]
+    assert client.calls == [("3", None), ("3", "2"), ("3", "4")]
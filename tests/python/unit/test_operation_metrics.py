@@ -0,0 +1,49 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from operation_metrics import OperationMetrics
+
+
+def test_requests_are_counted_under_the_current_operation():
+    metrics = OperationMetrics()
+    metrics.record_request("GET /folders", 0.01, 0, 10)
+    metrics.start_operation("stat")
+    metrics.record_request("GET /files", 0.01, 0, 20)
+    metrics.end_operation(0.02)
+    assert metrics.get_api_calls("stat") == 1
+    assert metrics.get_api_calls() == 1
+    assert metrics.get_operation() is None
+
+
+def test_operation_is_per_thread():
+    metrics = OperationMetrics()
+    metrics.start_operation("move")
+    other_thread = threading.Thread(target=metrics.record_request, args=("GET /files", 0.01, 0, 10))
+    other_thread.start()
+    other_thread.join()
+    assert metrics.get_api_calls("move") == 0
+    assert metrics.get_api_calls() == 1
+
+
+def test_bound_functions_run_under_the_submitting_operation():
+    metrics = OperationMetrics()
+    metrics.start_operation("read")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(metrics.bind(lambda _: metrics.record_request("GET /content", 0.01, 0, 10)), range(4)))
+    metrics.end_operation(0.1)
+    assert metrics.get_api_calls("read") == 4
+
+
+def test_bound_function_runs_under_the_given_operation():
+    metrics = OperationMetrics()
+    upload = metrics.bind(lambda: metrics.record_request("POST /content", 0.01, 100, 0), "write")
+    metrics.start_operation("move")
+    worker = threading.Thread(target=upload)
+    worker.start()
+    worker.join()
+    upload()
+    assert metrics.get_operation() == "move"
+    metrics.end_operation(0.1)
+    assert metrics.get_api_calls("write") == 2
+    assert metrics.get_api_calls("move") == 0
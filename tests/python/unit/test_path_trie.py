@@ -0,0 +1,109 @@
+from path_trie import PathTrie
+
+
+def build_trie():
+    trie = PathTrie()
+    trie.set("a", "1", "folder")
+    trie.set("a/b", "2", "folder")
+    trie.set("a/b/c.csv", "3", "file", 10, 1000, 1.0)
+    trie.set("a/d.csv", "4", "file", 20)
+    return trie
+
+
+def test_set_and_get():
+    trie = build_trie()
+    assert len(trie) == 4
+    assert trie.get("a/b/c.csv") == ("3", "file")
+    assert trie.get("/a/b/c.csv") == ("3", "file")
+    assert trie.get("a/b/missing.csv") == (None, None)
+    assert trie.path_of_id("3") == "a/b/c.csv"
+    entry = trie.find("a/b/c.csv").get_entry()
+    assert entry["size"] == 10
+    assert entry["modified_at"] == 1000
+    assert entry["accessed_at"] == 1.0
+
+
+def test_closest_ancestor():
+    trie = build_trie()
+    path, node = trie.closest_ancestor("a/b/new/file.csv", "folder")
+    assert path == "a/b"
+    assert node.item_id == "2"
+    # Strict ancestors only
+    path, node = trie.closest_ancestor("a/b", "folder")
+    assert path == "a"
+    assert trie.closest_ancestor("other/file.csv") == (None, None)
+
+
+def test_remove_path_drops_subtree():
+    trie = build_trie()
+    assert trie.remove_path("a/b") == 2
+    assert len(trie) == 2
+    assert trie.get("a/b/c.csv") == (None, None)
+    assert trie.path_of_id("2") is None
+    assert trie.path_of_id("3") is None
+    assert trie.get("a/d.csv") == ("4", "file")
+    assert trie.remove_path("a/b") == 0
+    assert trie.remove_path("") == 0
+
+
+def test_remove_id():
+    trie = build_trie()
+    assert trie.remove_id("1") == 4
+    assert len(trie) == 0
+    assert trie.root.children == {}
+    assert trie.remove_id("1") == 0
+
+
+def test_move_drops_old_subtree():
+    trie = build_trie()
+    trie.set("e", "2", "folder")
+    assert trie.path_of_id("2") == "e"
+    assert trie.get("a/b") == (None, None)
+    # What was cached below the old path is not known to be below the new one
+    assert trie.get("a/b/c.csv") == (None, None)
+    assert trie.get("e/c.csv") == (None, None)
+    assert trie.path_of_id("3") is None
+    assert len(trie) == 3
+
+
+def test_path_reused_by_another_item():
+    trie = build_trie()
+    trie.set("a/b", "5", "folder")
+    assert trie.get("a/b") == ("5", "folder")
+    assert trie.path_of_id("2") is None
+    assert trie.get("a/b/c.csv") == (None, None)
+    assert len(trie) == 3
+
+
+def test_set_same_item_again_keeps_children():
+    trie = build_trie()
+    trie.set("a/b", "2", "folder", confirmed_at=2.0)
+    assert trie.get("a/b/c.csv") == ("3", "file")
+    assert trie.find("a/b").confirmed_at == 2.0
+    assert len(trie) == 4
+
+
+def test_evict_keeps_children():
+    trie = build_trie()
+    assert trie.evict_path("a/b") == 1
+    assert trie.get("a/b") == (None, None)
+    assert trie.path_of_id("2") is None
+    assert trie.get("a/b/c.csv") == ("3", "file")
+    assert len(trie) == 3
+    assert trie.evict_path("a/b") == 0
+
+
+def test_evict_prunes_empty_nodes():
+    trie = PathTrie()
+    trie.set("x/y/z.csv", "1", "file")
+    assert trie.evict_path("x/y/z.csv") == 1
+    assert len(trie) == 0
+    assert trie.root.children == {}
+
+
+def test_round_trip():
+    trie = build_trie()
+    copy = PathTrie.from_dict(trie.to_dict())
+    assert copy.to_dict() == trie.to_dict()
+    assert copy.path_of_id("3") == "a/b/c.csv"
+    assert len(copy) == 4
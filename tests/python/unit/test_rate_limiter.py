@@ -0,0 +1,111 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+class FakeTime():
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.slept.append(delay)
+        self.now = self.now + delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_time = FakeTime()
+    monkeypatch.setattr(rate_limiter, "time", fake_time)
+    return fake_time
+
+
+def hold_rate(limiter, clock):
+    # The rate only grows after INCREASE_INTERVAL without change
+    limiter.update(lambda state: state.update(last_change=clock.now))
+
+
+@pytest.fixture
+def no_dip_home(monkeypatch):
+    # The state stays in memory
+    monkeypatch.delenv("DIP_HOME", raising=False)
+
+
+def test_burst_then_paced(clock, no_dip_home):
+    limiter = RateLimiter("token", 10)
+    hold_rate(limiter, clock)
+    delays = [limiter.update(limiter.reserve_slot) for _ in range(12)]
+    # Up to burst requests go at once, the next ones are spaced by 1 / rate
+    assert max(delays[:10]) < 1e-9
+    assert delays[10] == pytest.approx(0.1)
+    assert delays[11] == pytest.approx(0.2)
+
+
+def test_acquire_sleeps_until_slot(clock, no_dip_home):
+    limiter = RateLimiter("token", 2)
+    hold_rate(limiter, clock)
+    for _ in range(4):
+        limiter.acquire()
+    assert clock.slept == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_idle_time_is_not_saved_up(clock, no_dip_home):
+    limiter = RateLimiter("token", 10)
+    clock.now = clock.now + 3600
+    delays = [limiter.update(limiter.reserve_slot) for _ in range(11)]
+    assert max(delays[:10]) < 1e-9
+    assert delays[10] > 0
+
+
+def test_throttling_halves_rate_once_per_interval(clock, no_dip_home):
+    limiter = RateLimiter("token", 8)
+    limiter.on_throttled()
+    limiter.on_throttled()
+    assert limiter.state["rate"] == 4
+    clock.now = clock.now + RateLimiter.DECREASE_INTERVAL
+    limiter.on_throttled()
+    assert limiter.state["rate"] == 2
+    for _ in range(5):
+        clock.now = clock.now + RateLimiter.DECREASE_INTERVAL
+        limiter.on_throttled()
+    assert limiter.state["rate"] == RateLimiter.MIN_RATE
+
+
+def test_rate_grows_back_up_to_max(clock, no_dip_home):
+    limiter = RateLimiter("token", 2)
+    limiter.on_throttled()
+    assert limiter.state["rate"] == 1
+    limiter.update(limiter.reserve_slot)
+    assert limiter.state["rate"] == 1
+    rates = []
+    for _ in range(10):
+        clock.now = clock.now + RateLimiter.INCREASE_INTERVAL
+        limiter.update(limiter.reserve_slot)
+        rates.append(limiter.state["rate"])
+    assert rates[:3] == [2, 3, 4]
+    assert max(rates) == 2 * RateLimiter.MAX_RATE_FACTOR
+
+
+def test_state_shared_through_file(clock, dip_home):
+    first = RateLimiter("token", 10)
+    second = RateLimiter("token", 10)
+    assert first.state_fd is not None
+    hold_rate(first, clock)
+    for _ in range(10):
+        first.update(first.reserve_slot)
+    # The other instance, as another process would, sees the slots already taken
+    assert second.update(second.reserve_slot) == pytest.approx(0.1)
+    clock.now = clock.now + RateLimiter.DECREASE_INTERVAL
+    first.on_throttled()
+    assert second.update(lambda state: state["rate"]) == 5
+    assert (dip_home / "caches" / "plugins" / "box-com" / "token.rate").exists()
+
+
+def test_get_shares_instances_per_key(no_dip_home, monkeypatch):
+    monkeypatch.setattr(RateLimiter, "limiters", {})
+    assert RateLimiter.get("a", 10) is RateLimiter.get("a", 10)
+    assert RateLimiter.get("a", 10) is not RateLimiter.get("b", 10)
@@ -0,0 +1,100 @@
+import time
+
+import sqlite_cache_handler
+from sqlite_cache_handler import SQLiteCacheHandler
+
+
+class FakeTime():
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def build_cache(max_entries=0):
+    cache = SQLiteCacheHandler("token", max_entries=max_entries)
+    cache.add_batch([
+        ("a", "1", "folder"),
+        ("a/b", "2", "folder"),
+        ("a/b/c.csv", "3", "file", 10, 1000),
+        ("a/b0.csv", "4", "file", 20),
+        ("a/b.csv", "5", "file", 30),
+        ("ab", "6", "folder"),
+    ])
+    return cache
+
+
+def test_entries_are_shared_by_handlers(dip_home):
+    cache = build_cache()
+    other = SQLiteCacheHandler("token")
+    assert other.count_entries() == 6
+    assert other.query("a/b/c.csv") == ("3", "file")
+    entry = other.query_entry("a/b/c.csv")
+    assert entry["size"] == 10
+    assert entry["modified_at"] == 1000
+    assert other.query_path("2") == "a/b"
+    cache.add("a/d.csv", "7", "file", 1)
+    assert other.query("a/d.csv") == ("7", "file")
+
+
+def test_remove_deletes_the_subtree_only(dip_home):
+    cache = build_cache()
+    assert cache.remove("2") == 1
+    assert cache.query("a/b") == (None, None)
+    assert cache.query("a/b/c.csv") == (None, None)
+    # Siblings sharing the "a/b" prefix are kept
+    assert cache.query("a/b0.csv") == ("4", "file")
+    assert cache.query("a/b.csv") == ("5", "file")
+    assert cache.query("ab") == ("6", "folder")
+    assert cache.remove("2") == 0
+
+
+def test_remove_path(dip_home):
+    cache = build_cache()
+    assert cache.remove_path("a") == 1
+    assert cache.count_entries() == 1
+    assert cache.remove_path("missing") == 0
+
+
+def test_query_ancestor_returns_the_deepest_cached_folder(dip_home):
+    cache = build_cache()
+    assert cache.query_ancestor("a/b/new/file.csv", "folder") == ("a/b", "2")
+    assert cache.query_ancestor("a/new.csv", "folder") == ("a", "1")
+    # The path itself and files are not ancestors
+    assert cache.query_ancestor("a/b", "folder") == ("a", "1")
+    assert cache.query_ancestor("a/b/c.csv/x", "folder") == ("a/b", "2")
+    assert cache.query_ancestor("z/new.csv", "folder") == (None, None)
+    assert cache.query_ancestor("a/b/new.csv", "folder", force_no_cache=True) == (None, None)
+
+
+def test_least_recently_used_entries_are_evicted(dip_home, monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(sqlite_cache_handler, "time", clock)
+    # Size checked after each addition
+    monkeypatch.setattr(SQLiteCacheHandler, "EVICTION_CHECK_INTERVAL", 1)
+    cache = SQLiteCacheHandler("token", max_entries=10)
+    for index in range(10):
+        clock.now = clock.now + SQLiteCacheHandler.ACCESS_RESOLUTION + 1
+        cache.add("file_{}.csv".format(index), str(index), "file", 1)
+    clock.now = clock.now + SQLiteCacheHandler.ACCESS_RESOLUTION + 1
+    assert cache.query("file_0.csv") == ("0", "file")
+    cache.add("file_10.csv", "10", "file", 1)
+    assert cache.count_entries() == int(10 * SQLiteCacheHandler.EVICTION_TARGET)
+    assert cache.query("file_0.csv") == ("0", "file")
+    assert cache.query("file_1.csv") == (None, None)
+    assert cache.query("file_10.csv") == ("10", "file")
+
+
+def test_disabled_cache(dip_home):
+    cache = SQLiteCacheHandler(None)
+    cache.add("a", "1", "folder")
+    assert cache.query("a") == (None, None)
+    assert cache.count_entries() == 0
+    assert cache.remove("1") == 0
+
+
+def test_force_no_cache(dip_home):
+    cache = build_cache()
+    assert cache.query_entry("a", force_no_cache=True) is None
+    assert time.time() - cache.query_entry("a")["confirmed_at"] < 60
@@ -0,0 +1,134 @@
+import time
+import threading
+
+import pytest
+
+from upload_queue import UploadQueue
+
+
+class FakeSpool():
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def blocked_upload(release, uploaded=None, path=None):
+    def upload():
+        release.wait(5)
+        if uploaded is not None:
+            uploaded.append(path)
+    return upload
+
+
+def wait_in_thread(queue, path):
+    # Returns the thread waiting for room for path, and the event set once it got it
+    got_room = threading.Event()
+
+    def wait():
+        queue.wait_for_room(path)
+        got_room.set()
+
+    thread = threading.Thread(target=wait)
+    thread.daemon = True
+    thread.start()
+    return thread, got_room
+
+
+def test_files_backpressure():
+    queue = UploadQueue(workers=1)
+    release = threading.Event()
+    for index in range(queue.max_files):
+        queue.wait_for_room("file_{}".format(index))
+        queue.submit("file_{}".format(index), FakeSpool(), 1, blocked_upload(release))
+    thread, got_room = wait_in_thread(queue, "next")
+    assert not got_room.wait(0.2)
+    release.set()
+    assert got_room.wait(5)
+    queue.close()
+
+
+def test_bytes_backpressure():
+    queue = UploadQueue(workers=4, max_bytes=100)
+    release = threading.Event()
+    queue.submit("big", FakeSpool(), 150, blocked_upload(release))
+    thread, got_room = wait_in_thread(queue, "next")
+    assert not got_room.wait(0.2)
+    release.set()
+    assert got_room.wait(5)
+    queue.close()
+
+
+def test_oversized_file_is_accepted_when_nothing_is_pending():
+    queue = UploadQueue(workers=1, max_bytes=100)
+    thread, got_room = wait_in_thread(queue, "big")
+    assert got_room.wait(5)
+    queue.close()
+
+
+def test_same_path_waits_for_previous_upload():
+    queue = UploadQueue(workers=4)
+    release = threading.Event()
+    uploaded = []
+    queue.submit("same", FakeSpool(), 1, blocked_upload(release, uploaded, "first"))
+    thread, got_room = wait_in_thread(queue, "same")
+    assert not got_room.wait(0.2)
+    queue.wait_for_room("other")
+    release.set()
+    assert got_room.wait(5)
+    assert uploaded == ["first"]
+    queue.close()
+
+
+def test_spool_closed_after_upload():
+    queue = UploadQueue(workers=2)
+    spools = [FakeSpool() for _ in range(3)]
+    for index, spool in enumerate(spools):
+        queue.submit("file_{}".format(index), spool, 1, lambda: None)
+    queue.wait()
+    assert all(spool.closed for spool in spools)
+    assert queue.pending_bytes == 0
+    queue.close()
+
+
+def test_errors_are_aggregated():
+    queue = UploadQueue(workers=4)
+
+    def failing_upload(index):
+        def upload():
+            raise Exception("error {}".format(index))
+        return upload
+
+    spools = []
+    for index in range(12):
+        spools.append(FakeSpool())
+        queue.wait_for_room("file_{}".format(index))
+        queue.submit("file_{}".format(index), spools[-1], 1, failing_upload(index))
+    queue.submit("fine", FakeSpool(), 1, lambda: None)
+    # Waiting operations are not failed by the uploads of others, the errors are kept for close()
+    queue.wait()
+    assert all(spool.closed for spool in spools)
+    assert queue.uploaded == 1
+    queue.wait()
+    with pytest.raises(Exception) as error:
+        queue.close()
+    message = str(error.value)
+    assert message.startswith("12 uploads failed: ")
+    assert message.count("error ") == UploadQueue.MAX_REPORTED_ERRORS
+    assert message.endswith("; ...")
+
+
+def test_close_raises_and_shuts_down():
+    queue = UploadQueue(workers=1)
+
+    def failing_upload():
+        time.sleep(0.1)
+        raise Exception("boom")
+
+    queue.submit("file", FakeSpool(), 1, failing_upload)
+    with pytest.raises(Exception, match="1 uploads failed: file: boom"):
+        queue.close()
+    with pytest.raises(RuntimeError):
+        queue.submit("late", FakeSpool(), 1, lambda: None)
+    assert queue.pending_paths == set()
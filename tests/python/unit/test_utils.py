@@ -0,0 +1,16 @@
+from utils import get_cache_file_name
+
+
+def test_account_cache_is_named_after_the_token():
+    assert get_cache_file_name("token") == "token"
+
+
+def test_root_cache_name_does_not_depend_on_the_root_spelling():
+    name = get_cache_file_name("token", "a/b")
+    assert name.startswith("token-")
+    for root in ["/a/b", "a/b/", "/a//b/", "a//b"]:
+        assert get_cache_file_name("token", root) == name
+
+
+def test_each_root_has_its_own_cache():
+    assert get_cache_file_name("token", "a") != get_cache_file_name("token", "a/b")